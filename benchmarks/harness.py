@@ -0,0 +1,489 @@
+import gzip
+import math
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+from celery.signals import task_prerun, task_postrun
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from feeds.cache import get_version_key
+from feeds.models import Channel, Feed, Entry, Item
+from feeds.tasks import update_feeds_task
+from feeds.utils import update_feed, count_feeds_items, normalize_feed_url
+from rss_scraper import celery_app
+
+RSS_DOCUMENT = '''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0">
+<channel>
+<title>Benchmark feed {index}</title>
+<link>http://benchmark.local/{index}/</link>
+<description>Synthetic feed {index}</description>
+{entries}
+</channel>
+</rss>
+'''
+RSS_ENTRY = '''<item><title>Entry {number}</title><link>http://benchmark.local/{index}/{number}</link>
+<guid>http://benchmark.local/{index}/{number}</guid><pubDate>{published}</pubDate>
+<description>{description}</description></item>'''
+ATOM_DOCUMENT = '''<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+<title>Benchmark feed {index}</title>
+<link href="http://benchmark.local/{index}/"/>
+<subtitle>Synthetic feed {index}</subtitle>
+<id>http://benchmark.local/{index}/</id>
+<updated>{updated}</updated>
+{entries}
+</feed>
+'''
+ATOM_ENTRY = '''<entry><title>Entry {number}</title><link href="http://benchmark.local/{index}/{number}"/>
+<id>http://benchmark.local/{index}/{number}</id><updated>{published}</updated>
+<summary>{description}</summary></entry>'''
+# words of the generated titles and descriptions, search requests look up the first word of a title
+WORDS = (
+    'release', 'python', 'security', 'database', 'network', 'update', 'browser', 'kernel', 'storage', 'mobile',
+    'cloud', 'review', 'design', 'market', 'science', 'energy', 'startup', 'privacy', 'hardware', 'language',
+)
+FORMATS = ('rss', 'atom')
+MODES = ('update_feed', 'update_feeds_task')
+
+# name, method and path of the API requests of the benchmark, {feed} is a feed of the user
+API_SCENARIOS = [
+    ('feed-list', 'get', '/feeds/'),
+    ('item-list', 'get', '/items/'),
+    ('item-list-unread', 'get', '/items/?read=false'),
+    ('feed-item-list', 'get', '/feeds/{feed}/items/'),
+    ('item-sync', 'get', '/items/sync/'),
+    ('item-search', 'get', '/items/search/?q={word}'),
+    ('item-read', 'post', '/items/read/'),
+    ('feed-item-read-all', 'post', '/feeds/{feed}/items/read_all/'),
+    ('force-update', 'post', '/feeds/{feed}/force_update/'),
+]
+# max queries of every request whatever the number of feeds and items, atomic blocks
+# count their savepoint queries as they run inside the test transaction
+QUERY_BUDGETS = {
+    'feed-list': 2,
+    # item listings sum the feed counters for their count
+    'item-list': 2,
+    'item-list-unread': 2,
+    'feed-item-list': 3,
+    'item-sync': 1,
+    'item-search': 1,
+    'item-read': 6,
+    'feed-item-read-all': 5,
+    'force-update': 14,
+}
+
+
+def build_document(index, version, entries=20, entry_size=500, document_format='rss', new_entries=5):
+    '''
+    build a synthetic feed document, every version publishes new_entries entries on top
+    of the previous version so successive refreshes insert and skip entries like real feeds
+
+    Parameters:
+        index (int): number of the feed.
+        version (int): version of the document.
+        entries (int): number of entries in the document.
+        entry_size (int): characters of every entry description.
+        document_format (str): rss or atom.
+        new_entries (int): entries added by every version.
+    Returns:
+        document (bytes): feed document.
+    '''
+    base = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    newest = version * new_entries + entries
+    description = escape(('lorem ipsum ' * (entry_size // 12 + 1))[:entry_size])
+    rendered = []
+    for number in range(newest, newest - entries, -1):
+        published = base + timedelta(hours=number)
+        if document_format == 'atom':
+            rendered.append(ATOM_ENTRY.format(
+                index=index, number=number, published=published.isoformat(), description=description
+            ))
+        else:
+            rendered.append(RSS_ENTRY.format(
+                index=index, number=number, published=format_datetime(published), description=description
+            ))
+    template = ATOM_DOCUMENT if document_format == 'atom' else RSS_DOCUMENT
+    updated = (base + timedelta(hours=newest)).isoformat()
+    return template.format(index=index, updated=updated, entries='\n'.join(rendered)).encode('utf-8')
+
+
+class FeedRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serve /<index>.<format> documents of the stub server with ETag and gzip support.
+    """
+
+    def do_GET(self):
+        server = self.server
+        name, _, document_format = self.path.strip('/').partition('.')
+        if not name.isdigit() or document_format not in FORMATS:
+            self.send_error(404)
+            return
+        etag = '"{}-{}"'.format(name, server.version)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        content = build_document(
+            int(name), server.version, server.entries, server.entry_size, document_format, server.new_entries
+        )
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/{}+xml'.format(document_format))
+        self.send_header('ETag', etag)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            content = gzip.compress(content, compresslevel=1)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def stub_server(entries=20, entry_size=500, new_entries=5):
+    '''
+    run a local HTTP server serving synthetic feed documents in a background thread
+
+    Parameters:
+        entries (int): number of entries in every document.
+        entry_size (int): characters of every entry description.
+        new_entries (int): entries added by every version.
+    Returns:
+        server (ThreadingHTTPServer): running server, set its version to publish new entries.
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FeedRequestHandler)
+    server.daemon_threads = True
+    server.version = 0
+    server.entries = entries
+    server.entry_size = entry_size
+    server.new_entries = new_entries
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def count_queries():
+    '''
+    count the queries executed on the default connection without keeping them
+
+    Returns:
+        counter (dict): number of queries under the "queries" key.
+    '''
+    counter = {'queries': 0}
+
+    def execute(execute, sql, params, many, context):
+        counter['queries'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(execute):
+        yield counter
+
+
+def percentile(values, percent):
+    '''
+    get the nearest rank percentile of values
+
+    Parameters:
+        values (List): measured values.
+        percent (int): percentile between 0 and 100.
+    Returns:
+        value (float): percentile value or None if values is empty.
+    '''
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(len(ordered), max(1, math.ceil(percent / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def create_benchmark_feeds(server, count, document_format):
+    '''
+    create a user following count channels served by the stub server
+
+    Parameters:
+        server (ThreadingHTTPServer): running stub server.
+        count (int): number of feeds.
+        document_format (str): rss or atom.
+    Returns:
+        feeds (List): created Feed objects.
+    '''
+    owner = get_user_model().objects.create_user('benchmark-{}'.format(time.time_ns()))
+    host, port = server.server_address
+    feeds = []
+    for index in range(count):
+        url = 'http://{}:{}/{}.{}'.format(host, port, index, document_format)
+        channel = Channel.objects.create(xml_link=url)
+        feeds.append(Feed.objects.create(
+            title='', link='', description='', xml_link=url, owner=owner, channel=channel
+        ))
+    return feeds
+
+
+def refresh_feeds(feeds, mode):
+    '''
+    refresh feeds through update_feed one by one or through update_feeds_task with
+    its batch tasks run eagerly in this process
+
+    Parameters:
+        feeds (List): Feed objects to be refreshed.
+        mode (str): update_feed or update_feeds_task.
+    Returns:
+        latencies (List): seconds taken by every feed, or by every batch task.
+    '''
+    latencies = []
+    if mode == 'update_feed':
+        for feed in feeds:
+            started_at = time.perf_counter()
+            update_feed(feed)
+            latencies.append(time.perf_counter() - started_at)
+        return latencies
+
+    started = {}
+
+    def on_prerun(task_id=None, task=None, **kwargs):
+        started[task_id] = time.perf_counter()
+
+    def on_postrun(task_id=None, task=None, **kwargs):
+        if task.name.endswith('channels_batch_update_task'):
+            latencies.append(time.perf_counter() - started.pop(task_id))
+
+    task_prerun.connect(on_prerun, weak=False)
+    task_postrun.connect(on_postrun, weak=False)
+    try:
+        update_feeds_task.apply()
+    finally:
+        task_prerun.disconnect(on_prerun)
+        task_postrun.disconnect(on_postrun)
+    return latencies
+
+
+def run_refresh_benchmark(feeds_count=100, entries=20, entry_size=500, document_format='rss', rounds=2,
+                          mode='update_feed', new_entries=5, trace_memory=True):
+    '''
+    refresh synthetic feeds served by a local stub server for some rounds, the first
+    round inserts every entry and the next ones get new_entries new entries per feed
+
+    Parameters:
+        feeds_count (int): number of feeds.
+        entries (int): number of entries in every document.
+        entry_size (int): characters of every entry description.
+        document_format (str): rss or atom.
+        rounds (int): number of refreshes of every feed.
+        mode (str): update_feed or update_feeds_task.
+        new_entries (int): entries published between rounds.
+        trace_memory (boolean): measure peak memory with tracemalloc, it slows the refresh down.
+    Returns:
+        reports (List): measures of every round.
+    '''
+    reports = []
+    # every stub document lives on the same host
+    with override_settings(FEED_HOST_LIMITS=False), stub_server(entries, entry_size, new_entries) as server:
+        # batch tasks of update_feeds_task run in this process and their errors are raised
+        eager_settings = celery_app.conf.task_always_eager, celery_app.conf.task_eager_propagates
+        celery_app.conf.task_always_eager = celery_app.conf.task_eager_propagates = True
+        try:
+            feeds = create_benchmark_feeds(server, feeds_count, document_format)
+            for round_number in range(1, rounds + 1):
+                server.version = round_number - 1
+                Channel.objects.filter(pk__in=[feed.channel_id for feed in feeds]).update(
+                    next_fetch_at=datetime.now(timezone.utc)
+                )
+                if trace_memory:
+                    tracemalloc.start()
+                with count_queries() as counter:
+                    started_at = time.perf_counter()
+                    latencies = refresh_feeds(feeds, mode)
+                    seconds = time.perf_counter() - started_at
+                peak_memory = None
+                if trace_memory:
+                    peak_memory = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                reports.append({
+                    'round': round_number,
+                    'feeds': feeds_count,
+                    'seconds': seconds,
+                    'feeds_per_second': feeds_count / seconds if seconds else None,
+                    'queries_per_feed': counter['queries'] / feeds_count,
+                    'p50': percentile(latencies, 50),
+                    'p99': percentile(latencies, 99),
+                    'peak_memory': peak_memory,
+                    'failed': Channel.objects.filter(
+                        pk__in=[feed.channel_id for feed in feeds], failure_count__gt=0
+                    ).count(),
+                })
+        finally:
+            celery_app.conf.task_always_eager, celery_app.conf.task_eager_propagates = eager_settings
+    return reports
+
+
+def get_words(number, count):
+    '''
+    build a text of count words that varies with number
+
+    Parameters:
+        number (int): number of the generated row.
+        count (int): number of words.
+    Returns:
+        text (str): words separated by spaces.
+    '''
+    return ' '.join(WORDS[(number * 7 + index * 3) % len(WORDS)] for index in range(count))
+
+
+def create_api_fixtures(users=10, feeds=1000, entries=100, batch_size=5000):
+    '''
+    create users following feeds, every channel gets entries and every feed gets an
+    item of each entry, half of them read
+
+    Parameters:
+        users (int): number of users.
+        feeds (int): number of feeds shared between the users.
+        entries (int): entries of every channel.
+        batch_size (int): rows inserted by one query.
+    Returns:
+        feeds (List): created Feed objects.
+    '''
+    prefix = 'benchmark-{}'.format(time.time_ns())
+    owners = [get_user_model().objects.create_user('{}-{}'.format(prefix, index)) for index in range(users)]
+    created_feeds = []
+    for index in range(feeds):
+        url = 'http://benchmark.local/{}.rss'.format(index)
+        data = {'title': get_words(index, 3), 'link': url, 'description': get_words(index, 7)}
+        channel = Channel.objects.create(xml_link=normalize_feed_url(url), **data)
+        created_feeds.append(Feed.objects.create(
+            owner=owners[index % users], channel=channel, xml_link=url, updated=True, **data
+        ))
+    # entry content is shared by every channel
+    templates = [
+        {
+            'title': get_words(number, 3),
+            'link': 'http://benchmark.local/entries/{}'.format(number),
+            'description': get_words(number, 7),
+        }
+        for number in range(entries)
+    ]
+    now = datetime.now(timezone.utc)
+    chunk_size = max(1, batch_size // max(1, entries))
+    for start in range(0, feeds, chunk_size):
+        chunk = created_feeds[start:start + chunk_size]
+        Entry.objects.bulk_create([
+            Entry(
+                channel_id=feed.channel_id,
+                guid='{}-{}'.format(feed.channel_id, number),
+                **template,
+                published_at=now - timedelta(minutes=number),
+                last_updated_at=now - timedelta(minutes=number)
+            )
+            for feed in chunk for number, template in enumerate(templates)
+        ], batch_size=batch_size)
+        feed_by_channel = {feed.channel_id: feed.pk for feed in chunk}
+        Item.objects.bulk_create([
+            Item(
+                feed_id=feed_by_channel[channel_id],
+                entry_id=entry_id,
+                read=entry_id % 2 == 0,
+                last_updated_at=last_updated_at,
+                changed_at=last_updated_at
+            )
+            for entry_id, channel_id, last_updated_at in Entry.objects.filter(
+                channel_id__in=feed_by_channel
+            ).values_list('pk', 'channel_id', 'last_updated_at').iterator()
+        ], batch_size=batch_size)
+        count_feeds_items(Feed.objects.filter(pk__in=feed_by_channel.values()))
+    return created_feeds
+
+
+def get_scenario_request(client, method, path, feed):
+    '''
+    build the request of a scenario for the feeds of one user
+
+    Parameters:
+        client (APIClient): client authenticated as the feed owner.
+        method (str): get or post.
+        path (str): path of the request, {feed} is replaced by the feed id and {word} by
+            a word of its first entry title.
+        feed (Feed): feed of the authenticated user.
+    Returns:
+        request (functools.partial): callable sending the request.
+    '''
+    title = feed.channel.entries.order_by('pk').values_list('title', flat=True).first() or ''
+    path = path.format(feed=feed.pk, word=(title.split() or [''])[0].strip('.'))
+    if path == '/items/read/':
+        ids = list(feed.items.filter(read=False).values_list('pk', flat=True)[:10]) or \
+            list(feed.items.values_list('pk', flat=True)[:10])
+        return partial(client.post, path, {'ids': ids}, format='json')
+    return partial(getattr(client, method), path)
+
+
+def run_api_benchmark(feed, requests=20, scenarios=API_SCENARIOS):
+    '''
+    send the requests of every scenario as the owner of feed and measure them, the
+    channel of feed is pointed to a local stub server for force update. The cached
+    listings of the owner are dropped before every measured request so it reaches the
+    database, list requests are sent again right after to measure cache hits apart
+
+    Parameters:
+        feed (Feed): feed whose owner sends the requests.
+        requests (int): requests sent per scenario.
+        scenarios (List): name, method and path of the requests.
+    Returns:
+        reports (List): latency percentiles of uncached and cached requests and max queries of every scenario.
+    '''
+    client = APIClient()
+    client.force_authenticate(feed.owner)
+    reports = []
+    # requests are sent in process to the host name of the test client
+    with override_settings(FEED_HOST_LIMITS=False, ALLOWED_HOSTS=['testserver']), stub_server() as server:
+        host, port = server.server_address
+        Channel.objects.filter(pk=feed.channel_id).update(
+            xml_link='http://{}:{}/{}.rss'.format(host, port, feed.channel_id), etag=None, last_modified=None
+        )
+        for name, method, path in scenarios:
+            request = get_scenario_request(client, method, path, feed)
+            latencies = []
+            cached_latencies = []
+            queries = []
+            statuses = set()
+            for _ in range(requests):
+                # a new listings version, set at once even inside the transaction of a test
+                cache.delete(get_version_key(feed.owner_id))
+                with count_queries() as counter:
+                    started_at = time.perf_counter()
+                    response = request()
+                    latencies.append(time.perf_counter() - started_at)
+                queries.append(counter['queries'])
+                statuses.add(response.status_code)
+                if method == 'get':
+                    started_at = time.perf_counter()
+                    request()
+                    cached_latencies.append(time.perf_counter() - started_at)
+            reports.append({
+                'name': name,
+                'requests': requests,
+                'statuses': sorted(statuses),
+                'p50': percentile(latencies, 50),
+                'p99': percentile(latencies, 99),
+                'cached_p50': percentile(cached_latencies, 50),
+                'cached_p99': percentile(cached_latencies, 99),
+                'queries': max(queries),
+                'budget': QUERY_BUDGETS.get(name),
+            })
+    return reports
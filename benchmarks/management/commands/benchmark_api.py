@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from benchmarks.harness import create_api_fixtures, run_api_benchmark
+from benchmarks.management.commands.benchmark_refresh import format_milliseconds
+from feeds.models import Feed
+
+
+class Command(BaseCommand):
+    help = 'Send API requests over generated feeds and items and report latency and queries per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='number of users')
+        parser.add_argument('--feeds', type=int, default=1000, help='number of feeds shared by the users')
+        parser.add_argument('--entries', type=int, default=100, help='entries of every channel')
+        parser.add_argument('--requests', type=int, default=50, help='requests sent per scenario')
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='keep the benchmark database and reuse its data in the next run, generating it is slow'
+        )
+
+    def handle(self, *args, **options):
+        # the benchmark writes to a throwaway test database, never to the configured one
+        database_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            feed = Feed.objects.select_related('owner').order_by('pk').first()
+            if feed is None:
+                self.stdout.write('Generating {feeds} feeds with {entries} items each'.format(**options))
+                feed = create_api_fixtures(options['users'], options['feeds'], options['entries'])[0]
+            reports = run_api_benchmark(feed, options['requests'])
+        finally:
+            if not options['keepdb']:
+                connection.creation.destroy_test_db(database_name, verbosity=0)
+
+        # cached latencies are the list requests answered from the listing cache
+        self.stdout.write('scenario            statuses  p50 ms  p99 ms  cached p50  cached p99  queries  budget')
+        for report in reports:
+            self.stdout.write('{:<18}  {:>8}  {:>6}  {:>6}  {:>10}  {:>10}  {:>7}  {:>6}{}'.format(
+                report['name'],
+                ','.join(str(status) for status in report['statuses']),
+                format_milliseconds(report['p50']),
+                format_milliseconds(report['p99']),
+                format_milliseconds(report['cached_p50']),
+                format_milliseconds(report['cached_p99']),
+                report['queries'],
+                report['budget'],
+                ' over budget' if report['queries'] > report['budget'] else '',
+            ))
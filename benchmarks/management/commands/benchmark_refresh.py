@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from benchmarks.harness import run_refresh_benchmark, FORMATS, MODES
+
+
+class Command(BaseCommand):
+    help = 'Refresh synthetic feeds served by a local stub server and report throughput, queries, latency and memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--feeds', type=int, default=100, help='number of feeds')
+        parser.add_argument('--entries', type=int, default=20, help='entries in every document')
+        parser.add_argument('--entry-size', type=int, default=500, help='characters of every entry description')
+        parser.add_argument('--new-entries', type=int, default=5, help='entries published between rounds')
+        parser.add_argument('--format', choices=FORMATS, default='rss', help='document format')
+        parser.add_argument('--rounds', type=int, default=2, help='refreshes of every feed')
+        parser.add_argument('--mode', choices=MODES, default='update_feed', help='refresh path to drive')
+        parser.add_argument('--no-memory', action='store_true', help='do not trace memory, it slows refreshes down')
+
+    def handle(self, *args, **options):
+        # the benchmark writes to a throwaway test database, never to the configured one
+        database_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            reports = run_refresh_benchmark(
+                feeds_count=options['feeds'],
+                entries=options['entries'],
+                entry_size=options['entry_size'],
+                document_format=options['format'],
+                rounds=options['rounds'],
+                mode=options['mode'],
+                new_entries=options['new_entries'],
+                trace_memory=not options['no_memory'],
+            )
+        finally:
+            connection.creation.destroy_test_db(database_name, verbosity=0)
+
+        latency = 'batch' if options['mode'] == 'update_feeds_task' else 'feed'
+        self.stdout.write(
+            'round  feeds/sec  queries/feed  {0} p50 ms  {0} p99 ms  peak memory MiB  failed'.format(latency)
+        )
+        for report in reports:
+            self.stdout.write('{:>5}  {:>9.1f}  {:>12.1f}  {:>11}  {:>11}  {:>15}  {:>6}'.format(
+                report['round'],
+                report['feeds_per_second'],
+                report['queries_per_feed'],
+                format_milliseconds(report['p50']),
+                format_milliseconds(report['p99']),
+                '-' if report['peak_memory'] is None else '{:.1f}'.format(report['peak_memory'] / 2 ** 20),
+                report['failed'],
+            ))
+
+
+def format_milliseconds(seconds):
+    return '-' if seconds is None else '{:.1f}'.format(seconds * 1000)
@@ -3,6 +3,23 @@ from celery.schedules import crontab
 tasks = {
     "update_feeds": {
         "task": "feeds.tasks.update_feeds_task",
-        "schedule": crontab(minute="*/60"),
+        # only channels due for a fetch are dispatched on each tick
+        "schedule": crontab(minute="*/5"),
+    },
+    "reconcile_feeds_counts": {
+        "task": "feeds.tasks.reconcile_feeds_counts_task",
+        "schedule": crontab(minute=30, hour=3),
+    },
+    "prune_items": {
+        "task": "feeds.tasks.prune_items_task",
+        "schedule": crontab(minute=0, hour=4),
+    },
+    "renew_websub_subscriptions": {
+        "task": "feeds.tasks.renew_websub_subscriptions_task",
+        "schedule": crontab(minute=15),
+    },
+    "rotate_item_partitions": {
+        "task": "feeds.tasks.rotate_item_partitions_task",
+        "schedule": crontab(minute=45, hour=3),
     },
 }
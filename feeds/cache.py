@@ -0,0 +1,128 @@
+import uuid
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags
+
+
+def get_version_key(user_id):
+    '''
+    get the cache key of the listings version of a user
+
+    Parameters:
+        user_id (int): id of the user.
+    Returns:
+        key (str): cache key of the version.
+    '''
+    return 'feeds:version:user:{}'.format(user_id)
+
+
+def get_user_version(user_id):
+    '''
+    get the version of everything user sees in feed and item listings, a new version
+    is set whenever one of the user feeds or items changes
+
+    Parameters:
+        user_id (int): id of the user.
+    Returns:
+        version (str): current version.
+    '''
+    key = get_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # an evicted version must not come back to an older value with cached pages
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key) or uuid.uuid4().hex
+    return version
+
+
+def invalidate_users(user_ids):
+    '''
+    set new versions for users once the current transaction commits so their cached
+    listings are not used anymore, a listing cached before the commit is never
+    stored under the new version
+
+    Parameters:
+        user_ids (Iterable): ids of the users whose feeds or items changed.
+    '''
+    versions = {get_version_key(user_id): uuid.uuid4().hex for user_id in set(user_ids)}
+    if versions:
+        transaction.on_commit(lambda: cache.set_many(versions, timeout=None))
+
+
+def invalidate_feeds(feeds):
+    '''
+    set new versions for the owners of feeds
+
+    Parameters:
+        feeds (Iterable): changed Feed objects.
+    '''
+    invalidate_users(feed.owner_id for feed in feeds)
+
+
+def get_page_key(request):
+    '''
+    get the cache key of a listing page, the current version of the user makes
+    changed listings miss the cache without deleting any page
+
+    Parameters:
+        request (Request): listing request with its filters and cursor.
+    Returns:
+        key (str): cache key of the page.
+    '''
+    # pages hold absolute next links
+    url = sha1(request.build_absolute_uri().encode()).hexdigest()
+    return 'feeds:page:{}:{}:{}'.format(request.user.pk, get_user_version(request.user.pk), url)
+
+
+def get_page_etag(key):
+    '''
+    get the ETag of a listing page, it changes with the user version so it is
+    checked without querying the database
+
+    Parameters:
+        key (str): cache key of the page.
+    Returns:
+        etag (str): quoted entity tag.
+    '''
+    return '"{}"'.format(sha1(key.encode()).hexdigest())
+
+
+def is_not_modified(request, etag):
+    '''
+    check if the client already has the page of etag, weak comparison is used since
+    compressing responses weakens their ETags
+
+    Parameters:
+        request (Request): listing request.
+        etag (str): ETag of the current page.
+    Returns:
+        not_modified (boolean): True if If-None-Match has etag, False otherwise.
+    '''
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return etag in [tag[2:] if tag.startswith('W/') else tag for tag in etags]
+
+
+def get_page(key):
+    '''
+    get the cached data of a listing page
+
+    Parameters:
+        key (str): cache key of the page.
+    Returns:
+        data (dict): response data or None if the page is not cached.
+    '''
+    return cache.get(key)
+
+
+def set_page(key, data):
+    '''
+    cache the data of a listing page, pages of old versions are left to expire
+
+    Parameters:
+        key (str): cache key of the page.
+        data (dict): response data.
+    '''
+    cache.set(key, data, timeout=settings.FEEDS_CACHE_TIMEOUT)
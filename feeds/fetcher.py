@@ -0,0 +1,300 @@
+import asyncio
+import time
+from functools import lru_cache
+from hashlib import sha256
+
+import feedparser
+import httpx
+from django.conf import settings
+
+from feeds.metrics import FETCH_SECONDS, PARSE_SECONDS, DOWNLOADED_BYTES, record_fetch
+from feeds.scheduler import get_skip_hours
+from feeds.throttling import host_slot, async_host_slot, get_host, get_retry_after, penalize_host, HostThrottled
+
+# statuses of servers asking to slow down
+THROTTLED_STATUSES = (429, 503)
+
+
+class FetchError(Exception):
+    """
+    Raised when a feed document can not be downloaded.
+    """
+
+
+def get_request_headers(etag=None, modified=None):
+    '''
+    build request headers, adding the validators of the previous fetch (if any)
+    so the server can answer with 304 Not Modified
+
+    Parameters:
+        etag (str): ETag header of the previous response.
+        modified (str): Last-Modified header of the previous response.
+    Returns:
+        headers (dict): request headers.
+    '''
+    headers = {
+        'User-Agent': feedparser.USER_AGENT,
+        'Accept': feedparser.http.ACCEPT_HEADER,
+    }
+    if etag:
+        headers['If-None-Match'] = etag
+    if modified:
+        headers['If-Modified-Since'] = modified
+    return headers
+
+
+def get_content_hash(content):
+    '''
+    fingerprint a downloaded document, servers without validators often send the
+    same document again with a 200 response
+
+    Parameters:
+        content (bytes): response body.
+    Returns:
+        hash (str): hex digest of content.
+    '''
+    return sha256(content).hexdigest()
+
+
+def parse_document(url, status, headers, content, content_hash=None):
+    '''
+    parse a downloaded document with feedparser and attach the response data the
+    same way feedparser does when it downloads the url itself. A document with the
+    hash of the previous fetch is not parsed and is marked unchanged.
+
+    Parameters:
+        url (URL): url of the document.
+        status (int): HTTP status code of the response.
+        headers (Mapping): response headers.
+        content (bytes): response body.
+        content_hash (str): hash of the previous document.
+    Returns:
+        data (FeedParserDict): parsed feed data.
+    '''
+    digest = None if status == 304 else get_content_hash(content)
+    if status == 304 or digest == content_hash:
+        feed_xml = feedparser.FeedParserDict(bozo=0, entries=[], feed=feedparser.FeedParserDict())
+        feed_xml['unchanged'] = status != 304
+    else:
+        with PARSE_SECONDS.time():
+            feed_xml = feedparser.parse(content, response_headers={
+                'content-location': url,
+                'content-type': headers.get('content-type', ''),
+                'content-language': headers.get('content-language', ''),
+            })
+            feed_xml['skip_hours'] = get_skip_hours(content)
+        feed_xml['content_hash'] = digest
+    feed_xml['href'] = url
+    feed_xml['status'] = status
+    feed_xml['headers'] = dict(headers)
+    if headers.get('etag'):
+        feed_xml['etag'] = headers.get('etag')
+    if headers.get('last-modified'):
+        feed_xml['modified'] = headers.get('last-modified')
+    return feed_xml
+
+
+def penalize_throttled(response):
+    '''
+    stop requesting the host of a response asking to slow down for the time it asked for
+
+    Parameters:
+        response (httpx.Response): streamed response.
+    '''
+    if response.status_code in THROTTLED_STATUSES:
+        penalize_host(get_host(response.url), get_retry_after(response.headers))
+
+
+def check_response(response):
+    '''
+    raise FetchError if the response has no document to parse
+
+    Parameters:
+        response (httpx.Response): streamed response.
+    '''
+    if response.status_code not in (200, 304):
+        raise FetchError('{} responded with {}'.format(response.url, response.status_code))
+
+
+def check_size(url, size):
+    '''
+    raise FetchError if the document is larger than FEED_FETCH_MAX_BYTES
+
+    Parameters:
+        url (URL): url of the document.
+        size (int): bytes read so far.
+    '''
+    if size > settings.FEED_FETCH_MAX_BYTES:
+        raise FetchError('{} is larger than {} bytes'.format(url, settings.FEED_FETCH_MAX_BYTES))
+
+
+def check_deadline(url, deadline):
+    '''
+    raise FetchError if the download of url went past the deadline of its host slot
+
+    Parameters:
+        url (URL): url of the document.
+        deadline (float): time.monotonic() value the download must end by.
+    '''
+    if time.monotonic() > deadline:
+        raise FetchError('{} took longer than {} seconds'.format(url, settings.FEED_FETCH_DEADLINE))
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    '''
+    get the client holding the keep-alive connections of this process, reused by every
+    sync fetch so requests to the same host skip the TCP and TLS handshakes
+
+    Returns:
+        client (httpx.Client): pooled client.
+    '''
+    return httpx.Client(
+        timeout=settings.FEED_FETCH_TIMEOUT,
+        limits=httpx.Limits(max_keepalive_connections=settings.FEED_FETCH_CONCURRENCY),
+        follow_redirects=True
+    )
+
+
+def fetch_document(url, etag=None, modified=None, client=None, content_hash=None, max_wait=None):
+    '''
+    download url through the host limits and parse it, failures are reported the way
+    feedparser reports them so the document is rejected by feed validation
+
+    Parameters:
+        url (URL): url of the document.
+        etag (str): ETag header of the previous response.
+        modified (str): Last-Modified header of the previous response.
+        client (httpx.Client): custom client, used in tests.
+        content_hash (str): hash of the previous document.
+        max_wait (float): seconds to wait for the host, HostThrottled is then raised to the caller
+            instead of failing the document. Used by requests that can not wait FEED_HOST_MAX_WAIT.
+    Returns:
+        data (FeedParserDict): parsed feed data.
+    '''
+    client = client or get_client()
+    size = 0
+    try:
+        with host_slot(url, max_wait) as deadline, FETCH_SECONDS.time():
+            with client.stream('GET', url, headers=get_request_headers(etag, modified)) as response:
+                penalize_throttled(response)
+                check_response(response)
+                chunks = []
+                for chunk in response.iter_bytes():
+                    size += len(chunk)
+                    check_size(url, size)
+                    check_deadline(url, deadline)
+                    chunks.append(chunk)
+    except (FetchError, HostThrottled) as error:
+        if isinstance(error, HostThrottled) and max_wait is not None:
+            raise
+        feed_xml = feedparser.FeedParserDict(
+            bozo=1, bozo_exception=error, entries=[], feed=feedparser.FeedParserDict()
+        )
+    except httpx.HTTPError as error:
+        feed_xml = feedparser.FeedParserDict(
+            bozo=1,
+            bozo_exception=FetchError('failed to fetch {}: {!r}'.format(url, error)),
+            entries=[],
+            feed=feedparser.FeedParserDict()
+        )
+    else:
+        feed_xml = parse_document(
+            str(response.url), response.status_code, response.headers, b''.join(chunks), content_hash
+        )
+    DOWNLOADED_BYTES.inc(size)
+    record_fetch(feed_xml)
+    return feed_xml
+
+
+async def download_document(client, url, etag=None, modified=None):
+    '''
+    download url through the host limits without reading more than FEED_FETCH_MAX_BYTES of its body
+    or for longer than FEED_FETCH_DEADLINE
+
+    Parameters:
+        client (httpx.AsyncClient): client holding the connection pool.
+        url (URL): url of the document.
+        etag (str): ETag header of the previous response.
+        modified (str): Last-Modified header of the previous response.
+    Returns:
+        response (tuple): url, status, headers and content of the response.
+    '''
+    size = 0
+
+    async def download():
+        nonlocal size
+        async with client.stream('GET', url, headers=get_request_headers(etag, modified)) as response:
+            if response.status_code in THROTTLED_STATUSES:
+                await asyncio.get_running_loop().run_in_executor(None, penalize_throttled, response)
+            check_response(response)
+            chunks = []
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                check_size(url, size)
+                chunks.append(chunk)
+        return response.url, response.status_code, response.headers, b''.join(chunks)
+
+    try:
+        async with async_host_slot(url) as deadline:
+            started_at = time.perf_counter()
+            # the download is cancelled at the deadline so the slot is released within its lease
+            document = await asyncio.wait_for(download(), deadline - time.monotonic())
+            FETCH_SECONDS.observe(time.perf_counter() - started_at)
+    except asyncio.TimeoutError as error:
+        raise FetchError('{} took longer than {} seconds'.format(url, settings.FEED_FETCH_DEADLINE)) from error
+    except httpx.HTTPError as error:
+        raise FetchError('failed to fetch {}: {!r}'.format(url, error)) from error
+    finally:
+        DOWNLOADED_BYTES.inc(size)
+    return document
+
+
+async def download_channels(channels, transport=None):
+    '''
+    download the documents of channels concurrently over pooled keep-alive connections
+
+    Parameters:
+        channels (List): Channel objects to be downloaded.
+        transport (httpx.AsyncBaseTransport): custom transport, used in tests.
+    Returns:
+        responses (List): (url, status, headers, content) tuple or FetchError for every channel.
+    '''
+    semaphore = asyncio.Semaphore(settings.FEED_FETCH_CONCURRENCY)
+    limits = httpx.Limits(
+        max_connections=settings.FEED_FETCH_CONCURRENCY,
+        max_keepalive_connections=settings.FEED_FETCH_CONCURRENCY
+    )
+
+    async with httpx.AsyncClient(
+        timeout=settings.FEED_FETCH_TIMEOUT,
+        limits=limits,
+        follow_redirects=True,
+        transport=transport
+    ) as client:
+
+        async def download(channel):
+            async with semaphore:
+                return await download_document(client, channel.xml_link, channel.etag, channel.last_modified)
+
+        return await asyncio.gather(*[download(channel) for channel in channels], return_exceptions=True)
+
+
+def fetch_channels(channels, transport=None):
+    '''
+    fetch the documents of channels concurrently then parse them one by one
+
+    Parameters:
+        channels (List): Channel objects to be fetched.
+        transport (httpx.AsyncBaseTransport): custom transport, used in tests.
+    Returns:
+        documents (Generator): (channel, FeedParserDict or FetchError) for every channel.
+    '''
+    responses = asyncio.run(download_channels(channels, transport))
+    for channel, response in zip(channels, responses):
+        if isinstance(response, Exception):
+            feed_xml = response
+        else:
+            feed_xml = parse_document(str(response[0]), *response[1:], channel.content_hash)
+        record_fetch(feed_xml)
+        yield channel, feed_xml
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from feeds.partitions import is_partitioned, partition_item_table
+
+
+class Command(BaseCommand):
+    help = 'Partition the item table by month on PostgreSQL, for deployments migrated without ITEM_PARTITIONING'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Item partitioning needs PostgreSQL')
+        if is_partitioned():
+            self.stdout.write('Items are already partitioned')
+            return
+        # rows are copied to the new table, writers wait for the transaction
+        with connection.schema_editor() as schema_editor:
+            partition_item_table(schema_editor)
+        self.stdout.write(self.style.SUCCESS('Items partitioned'))
@@ -0,0 +1,117 @@
+import ipaddress
+import os
+import time
+
+from celery.signals import before_task_publish, task_prerun, worker_ready
+from django.conf import settings
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess, start_http_server
+)
+
+LAG_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 5 * 60, 15 * 60, 60 * 60, float('inf'))
+
+STAGE_SECONDS = Histogram('feeds_stage_seconds', 'Seconds spent in every refresh stage', ['stage'])
+FETCH_SECONDS = STAGE_SECONDS.labels('fetch')
+PARSE_SECONDS = STAGE_SECONDS.labels('parse')
+VALIDATE_SECONDS = STAGE_SECONDS.labels('validate')
+UPSERT_SECONDS = STAGE_SECONDS.labels('upsert')
+DOWNLOADED_BYTES = Counter('feeds_downloaded_bytes', 'Bytes of downloaded feed documents')
+# 304 hit rate is the share of not_modified fetches
+FETCHES = Counter('feeds_fetches', 'Channel fetches by outcome', ['outcome'])
+ENTRIES = Counter('feeds_entries', 'Entries written by refreshes', ['action'])
+ITEMS_CREATED = Counter('feeds_items_created', 'Items created for the followers of refreshed channels')
+# every failure schedules a retry after a backoff, throttled fetches are retried without counting as failures
+CHANNEL_FAILURES = Counter('feeds_channel_failures', 'Failed channel updates by resulting state', ['state'])
+REFRESH_LAG = Histogram(
+    'feeds_refresh_lag_seconds', 'Seconds channels waited after they were due before being dispatched',
+    buckets=LAG_BUCKETS
+)
+QUEUE_LAG = Histogram(
+    'feeds_task_queue_lag_seconds', 'Seconds tasks waited in their queue before a worker started them', ['queue'],
+    buckets=LAG_BUCKETS
+)
+
+
+def get_registry():
+    '''
+    get the registry to be exported, metrics of all the processes are merged when
+    PROMETHEUS_MULTIPROC_DIR is set like in prefork workers and multi process servers
+
+    Returns:
+        registry (CollectorRegistry): registry collecting the metrics.
+    '''
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def export_metrics():
+    '''
+    render the metrics in the Prometheus text format
+
+    Returns:
+        metrics (bytes): exported metrics.
+    '''
+    return generate_latest(get_registry())
+
+
+def can_read_metrics(request):
+    '''
+    check if request may read the metrics of the API process, staff users and
+    the addresses or networks of METRICS_ALLOWED_IPS may
+
+    Parameters:
+        request (HttpRequest): request to the metrics endpoint.
+    Returns:
+        allowed (boolean): True if the metrics can be served, False otherwise.
+    '''
+    if request.user.is_staff:
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in settings.METRICS_ALLOWED_IPS)
+
+
+def record_fetch(feed_xml):
+    '''
+    count a fetched channel document by outcome
+
+    Parameters:
+        feed_xml (FeedParserDict or Exception): parsed document or fetch error.
+    '''
+    if isinstance(feed_xml, Exception):
+        outcome = type(feed_xml).__name__
+    elif feed_xml.get('status') == 304:
+        outcome = 'not_modified'
+    elif feed_xml.get('unchanged'):
+        outcome = 'unchanged'
+    elif feed_xml.get('bozo') and 'status' not in feed_xml:
+        outcome = type(feed_xml.get('bozo_exception')).__name__
+    else:
+        outcome = 'ok'
+    FETCHES.labels(outcome).inc()
+
+
+@before_task_publish.connect
+def add_published_at(headers=None, **kwargs):
+    headers['published_at'] = time.time()
+
+
+@task_prerun.connect
+def observe_queue_lag(task=None, **kwargs):
+    published_at = getattr(task.request, 'published_at', None)
+    # eager tasks are not published
+    if published_at is None:
+        return
+    queue = (task.request.delivery_info or {}).get('routing_key') or 'unknown'
+    QUEUE_LAG.labels(queue).observe(max(0, time.time() - published_at))
+
+
+@worker_ready.connect
+def start_metrics_server(**kwargs):
+    if settings.METRICS_WORKER_PORT:
+        start_http_server(settings.METRICS_WORKER_PORT, registry=get_registry())
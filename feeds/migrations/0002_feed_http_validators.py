@@ -0,0 +1,23 @@
+# Generated by Django 3.2.5 on 2026-10-18 21:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='etag',
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='last_modified',
+            field=models.TextField(null=True),
+        ),
+    ]
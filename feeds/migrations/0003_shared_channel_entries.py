@@ -0,0 +1,168 @@
+from urllib.parse import urlsplit, urlunsplit
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+BATCH_SIZE = 1000
+
+
+def normalize_feed_url(feed_url):
+    # frozen copy of feeds.utils.normalize_feed_url as it was when channels were introduced
+    parts = urlsplit(feed_url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = '{}:{}'.format(netloc, parts.port)
+    if parts.username:
+        credentials = parts.username if parts.password is None else '{}:{}'.format(parts.username, parts.password)
+        netloc = '{}@{}'.format(credentials, netloc)
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+def split_shared_content(apps, schema_editor):
+    Channel = apps.get_model('feeds', 'Channel')
+    Entry = apps.get_model('feeds', 'Entry')
+    Feed = apps.get_model('feeds', 'Feed')
+    Item = apps.get_model('feeds', 'Item')
+
+    # the oldest feed of a url gives the channel its data
+    feeds = list(Feed.objects.order_by('pk').only(
+        'xml_link', 'title', 'link', 'description', 'modified_at', 'etag', 'last_modified'
+    ))
+    channels = {}
+    for feed in feeds:
+        feed.url = normalize_feed_url(feed.xml_link)
+        channels.setdefault(feed.url, Channel(
+            xml_link=feed.url,
+            title=feed.title,
+            link=feed.link,
+            description=feed.description,
+            modified_at=feed.modified_at,
+            etag=feed.etag,
+            last_modified=feed.last_modified,
+        ))
+    Channel.objects.bulk_create(channels.values(), batch_size=BATCH_SIZE)
+    channel_ids = dict(Channel.objects.values_list('xml_link', 'pk'))
+    for feed in feeds:
+        feed.channel_id = channel_ids[feed.url]
+    Feed.objects.bulk_update(feeds, ['channel'], batch_size=BATCH_SIZE)
+
+    # one channel at a time keeps the entries of a single document in memory
+    for channel_id in channel_ids.values():
+        items = list(Item.objects.filter(feed__channel_id=channel_id).order_by('pk').values_list(
+            'pk', 'guid', 'title', 'link', 'description', 'published_at', 'last_updated_at'
+        ))
+        entries = {}
+        for pk, guid, title, link, description, published_at, last_updated_at in items:
+            entries.setdefault(guid, Entry(
+                channel_id=channel_id,
+                guid=guid,
+                title=title,
+                link=link,
+                description=description,
+                published_at=published_at,
+                last_updated_at=last_updated_at,
+            ))
+        Entry.objects.bulk_create(entries.values(), batch_size=BATCH_SIZE)
+        entry_ids = dict(Entry.objects.filter(channel_id=channel_id).values_list('guid', 'pk'))
+        Item.objects.bulk_update(
+            [Item(pk=item[0], entry_id=entry_ids[item[1]]) for item in items], ['entry'], batch_size=BATCH_SIZE
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0002_feed_http_validators'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Channel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('xml_link', models.URLField(unique=True)),
+                ('title', models.TextField(null=True)),
+                ('link', models.URLField(null=True)),
+                ('description', models.TextField(null=True)),
+                ('modified_at', models.DateTimeField(null=True)),
+                ('etag', models.TextField(null=True)),
+                ('last_modified', models.TextField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Entry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.TextField(null=True)),
+                ('link', models.URLField(null=True)),
+                ('description', models.TextField(null=True)),
+                ('published_at', models.DateTimeField(null=True)),
+                ('last_updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('guid', models.TextField()),
+                ('channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='feeds.channel')),
+            ],
+            options={
+                'unique_together': {('channel', 'guid')},
+            },
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='channel',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='feeds', to='feeds.channel'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='entry',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='feeds.entry'),
+        ),
+        migrations.RunPython(split_shared_content, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='feed',
+            name='channel',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feeds', to='feeds.channel'),
+        ),
+        migrations.AlterField(
+            model_name='item',
+            name='entry',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='feeds.entry'),
+        ),
+        migrations.AlterModelOptions(
+            name='item',
+            options={'ordering': ['-last_updated_at', '-id']},
+        ),
+        migrations.AlterUniqueTogether(
+            name='item',
+            unique_together={('feed', 'entry')},
+        ),
+        migrations.RemoveField(
+            model_name='feed',
+            name='etag',
+        ),
+        migrations.RemoveField(
+            model_name='feed',
+            name='last_modified',
+        ),
+        migrations.RemoveField(
+            model_name='item',
+            name='description',
+        ),
+        migrations.RemoveField(
+            model_name='item',
+            name='guid',
+        ),
+        migrations.RemoveField(
+            model_name='item',
+            name='link',
+        ),
+        migrations.RemoveField(
+            model_name='item',
+            name='published_at',
+        ),
+        migrations.RemoveField(
+            model_name='item',
+            name='title',
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.5 on 2026-10-18 21:09
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0003_shared_channel_entries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='fetch_interval',
+            field=models.PositiveIntegerField(default=3600),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='next_fetch_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='skip_hours',
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.5 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0004_channel_fetch_schedule'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['feed', 'last_updated_at', 'id'], name='feeds_item_feed_id_e1af94_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['feed', 'read', 'last_updated_at', 'id'], name='feeds_item_feed_id_ffcda3_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.5 on 2026-10-18 21:15
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def copy_last_updated_at(apps, schema_editor):
+    Item = apps.get_model('feeds', 'Item')
+    Item.objects.update(changed_at=models.F('last_updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0005_item_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(copy_last_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['feed', 'changed_at', 'id'], name='feeds_item_feed_id_8a2e1a_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.5 on 2026-10-18 21:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0006_item_changed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('active', 'Active'), ('failed', 'Failed')], default='active', max_length=10),
+        ),
+    ]
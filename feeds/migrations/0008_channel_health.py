@@ -0,0 +1,28 @@
+# Generated by Django 3.2.5 on 2026-10-18 21:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0007_feed_subscription_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='failure_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='last_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='state',
+            field=models.CharField(choices=[('healthy', 'Healthy'), ('failing', 'Failing'), ('broken', 'Broken')], default='healthy', max_length=10),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.5 on 2026-10-18 21:35
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_items(apps, schema_editor):
+    Feed = apps.get_model('feeds', 'Feed')
+    Item = apps.get_model('feeds', 'Item')
+
+    def items_count(**filters):
+        items = Item.objects.filter(feed=OuterRef('pk'), **filters).order_by().values('feed')
+        return Coalesce(Subquery(items.annotate(count=Count('pk')).values('count')), 0)
+
+    Feed.objects.update(unread_count=items_count(read=False), total_count=items_count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0008_channel_health'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='total_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.5 on 2026-10-18 21:48
+
+from django.db import migrations
+
+from feeds.search import POSTGRES_COLUMN_SQL, POSTGRES_DROP_SQL, SQLITE_TABLE_SQL, SQLITE_DROP_SQL
+
+# a generated tsvector column with a GIN index on PostgreSQL and an FTS5 table kept
+# in sync by triggers on SQLite, feeds/search.py defines them with the queries reading them
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_COLUMN_SQL)
+    elif schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_TABLE_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_DROP_SQL)
+    elif schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_DROP_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0009_feed_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
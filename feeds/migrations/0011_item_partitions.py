@@ -0,0 +1,100 @@
+# Generated by Django 3.2.5 on 2026-10-18 23:10
+
+import re
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations
+
+# frozen copy of feeds.partitions.partition_item_table, later changes of the
+# partitions maintenance do not change how the table was partitioned
+ITEM_TABLE = 'feeds_item'
+DEFAULT_PARTITION = 'feeds_item_default'
+CONSTRAINTS_SQL = '''
+SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint
+WHERE conrelid = %s::regclass
+'''
+INDEXES_SQL = '''
+SELECT indexname, indexdef FROM pg_indexes
+WHERE tablename = %s AND indexname NOT IN (
+    SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass
+)
+'''
+
+
+def get_month_start(value):
+    value = value.astimezone(timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(start, months):
+    month = start.month - 1 + months
+    return start.replace(year=start.year + month // 12, month=month % 12 + 1)
+
+
+def get_partition_name(start):
+    return 'feeds_item_p{:%Y%m}'.format(start)
+
+
+def create_partition(cursor, start):
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)'.format(
+            get_partition_name(start), ITEM_TABLE
+        ),
+        [start, add_months(start, 1)]
+    )
+
+
+def partition_item_table(schema_editor):
+    old_table = '{}_unpartitioned'.format(ITEM_TABLE)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CONSTRAINTS_SQL, [ITEM_TABLE])
+        constraints = cursor.fetchall()
+        cursor.execute(INDEXES_SQL, [ITEM_TABLE, ITEM_TABLE])
+        indexes = cursor.fetchall()
+        cursor.execute('SELECT min(last_updated_at) FROM {}'.format(ITEM_TABLE))
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute('ALTER TABLE {} RENAME TO {}'.format(ITEM_TABLE, old_table))
+        cursor.execute(
+            'CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS) PARTITION BY RANGE (last_updated_at)'.format(
+                ITEM_TABLE, old_table
+            )
+        )
+        cursor.execute('CREATE TABLE {} PARTITION OF {} DEFAULT'.format(DEFAULT_PARTITION, ITEM_TABLE))
+        now = datetime.now(timezone.utc)
+        start = get_month_start(oldest or now)
+        while start <= add_months(get_month_start(now), settings.ITEM_PARTITIONS_AHEAD):
+            create_partition(cursor, start)
+            start = add_months(start, 1)
+        cursor.execute('INSERT INTO {} SELECT * FROM {}'.format(ITEM_TABLE, old_table))
+        # the id sequence must outlive the old table
+        cursor.execute("ALTER SEQUENCE {0}_id_seq OWNED BY {0}.id".format(ITEM_TABLE))
+        cursor.execute('DROP TABLE {}'.format(old_table))
+
+        for name, kind, definition in constraints:
+            if kind in ('p', 'u'):
+                # unique constraints of partitioned tables include the partition key
+                definition = re.sub(r'\)$', ', last_updated_at)', definition)
+            cursor.execute('ALTER TABLE {} ADD CONSTRAINT {} {}'.format(ITEM_TABLE, name, definition))
+        # definitions were read before the rename so they target the new table
+        for name, definition in indexes:
+            cursor.execute(definition)
+
+
+def partition_items(apps, schema_editor):
+    # the table layout is invisible to models, other databases keep a plain table
+    if schema_editor.connection.vendor == 'postgresql' and settings.ITEM_PARTITIONING:
+        partition_item_table(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0010_entry_search'),
+    ]
+
+    operations = [
+        # a partitioned table works the same for every later migration so it is not reverted
+        migrations.RunPython(partition_items, migrations.RunPython.noop),
+    ]
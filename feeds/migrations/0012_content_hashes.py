@@ -0,0 +1,66 @@
+# Generated by Django 3.2.5 on 2026-10-18 21:45
+
+import json
+from hashlib import sha256
+
+from django.db import migrations, models
+
+from feeds.search import SQLITE_TABLE_SQL, SQLITE_DROP_SQL
+
+# the index of migration 0010 is dropped and created again around the new columns,
+# frozen copy of feeds.utils.get_entry_hash
+ENTRY_CONTENT_FIELDS = ['title', 'link', 'description', 'published_at']
+
+
+def get_entry_hash(data):
+    content = json.dumps([data.get(field) for field in ENTRY_CONTENT_FIELDS], default=str)
+    return sha256(content.encode()).hexdigest()
+
+
+def drop_sqlite_index(apps, schema_editor):
+    # SQLite adds columns by rebuilding the table, which drops the triggers of the index
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_DROP_SQL:
+            schema_editor.execute(sql)
+
+
+def create_sqlite_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_TABLE_SQL:
+            schema_editor.execute(sql)
+
+
+def hash_entries(apps, schema_editor):
+    # stored entries get the hash their next fetch computes so unchanged ones are not rewritten
+    Entry = apps.get_model('feeds', 'Entry')
+    entries = []
+    for entry in Entry.objects.only(*ENTRY_CONTENT_FIELDS).iterator(chunk_size=1000):
+        entry.content_hash = get_entry_hash({field: getattr(entry, field) for field in ENTRY_CONTENT_FIELDS})
+        entries.append(entry)
+        if len(entries) == 1000:
+            Entry.objects.bulk_update(entries, ['content_hash'])
+            entries = []
+    Entry.objects.bulk_update(entries, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0011_item_partitions'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_sqlite_index, create_sqlite_index),
+        migrations.AddField(
+            model_name='channel',
+            name='content_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='content_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(create_sqlite_index, drop_sqlite_index),
+        migrations.RunPython(hash_entries, migrations.RunPython.noop),
+    ]
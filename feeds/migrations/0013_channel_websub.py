@@ -0,0 +1,33 @@
+# Generated by Django 3.2.5 on 2026-10-18 21:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0012_content_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='hub',
+            field=models.URLField(null=True),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='topic',
+            field=models.URLField(null=True),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='websub_expires_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='websub_secret',
+            field=models.CharField(max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.5 on 2026-10-18 22:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+from feeds.search import SQLITE_TABLE_SQL, SQLITE_DROP_SQL
+
+# SQLite adds columns by rebuilding the table, which drops the triggers of the full
+# text index, the index of migration 0010 is dropped and created again around it
+
+
+def drop_sqlite_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_DROP_SQL:
+            schema_editor.execute(sql)
+
+
+def create_sqlite_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_TABLE_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0013_channel_websub'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_sqlite_index, create_sqlite_index),
+        # stored entries count as seen by the migration so none is pruned before the next fetch
+        migrations.AddField(
+            model_name='entry',
+            name='last_seen_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(create_sqlite_index, drop_sqlite_index),
+    ]
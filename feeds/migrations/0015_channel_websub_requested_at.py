@@ -0,0 +1,18 @@
+# Generated by Django 3.2.5 on 2026-10-18 22:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0014_entry_last_seen_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='websub_requested_at',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
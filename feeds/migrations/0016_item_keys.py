@@ -0,0 +1,56 @@
+# Generated by Django 3.2.5 on 2026-10-18 22:40
+
+from django.db import migrations
+
+# frozen copy of feeds.partitions.ITEM_KEYS_SQL, tables partitioned by 0011 lost the
+# (feed, entry) unique constraint to the partition key and get a table of item keys
+ITEM_KEYS_SQL = '''
+DELETE FROM feeds_item duplicate USING feeds_item item
+WHERE duplicate.feed_id = item.feed_id AND duplicate.entry_id = item.entry_id AND duplicate.id > item.id;
+CREATE TABLE feeds_item_key (
+    feed_id bigint NOT NULL,
+    entry_id bigint NOT NULL,
+    PRIMARY KEY (feed_id, entry_id)
+);
+INSERT INTO feeds_item_key SELECT feed_id, entry_id FROM feeds_item;
+CREATE FUNCTION feeds_item_claim_key() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO feeds_item_key VALUES (NEW.feed_id, NEW.entry_id) ON CONFLICT DO NOTHING;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+CREATE FUNCTION feeds_item_release_key() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM feeds_item_key WHERE feed_id = OLD.feed_id AND entry_id = OLD.entry_id;
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER feeds_item_claim_key BEFORE INSERT ON feeds_item
+FOR EACH ROW EXECUTE FUNCTION feeds_item_claim_key();
+CREATE TRIGGER feeds_item_release_key BEFORE DELETE ON feeds_item
+FOR EACH ROW EXECUTE FUNCTION feeds_item_release_key();
+'''
+
+
+def add_item_keys(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = 'feeds_item'")
+        row = cursor.fetchone()
+        if row is not None and row[0] == 'p':
+            cursor.execute(ITEM_KEYS_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feeds', '0015_channel_websub_requested_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_item_keys, migrations.RunPython.noop),
+    ]
@@ -4,7 +4,58 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 
 
+class Channel(models.Model):
+    """
+    Feed document shared by all the users following the same url.
+    """
+    HEALTHY = 'healthy'
+    FAILING = 'failing'
+    BROKEN = 'broken'
+    STATE_CHOICES = (
+        (HEALTHY, 'Healthy'),
+        (FAILING, 'Failing'),
+        (BROKEN, 'Broken'),
+    )
+
+    xml_link = models.URLField(unique=True)
+    title = models.TextField(null=True)
+    link = models.URLField(null=True)
+    description = models.TextField(null=True)
+    modified_at = models.DateTimeField(null=True)
+    # HTTP validators of the last fetched document for conditional requests
+    etag = models.TextField(null=True)
+    last_modified = models.TextField(null=True)
+    # hash of the last parsed document, the same document sent again is not parsed
+    content_hash = models.CharField(max_length=64, null=True)
+    # seconds between fetches derived from the channel publish frequency
+    fetch_interval = models.PositiveIntegerField(default=3600)
+    next_fetch_at = models.DateTimeField(default=now, db_index=True)
+    # UTC hours in which the channel asks not to be fetched (RSS skipHours)
+    skip_hours = models.JSONField(default=list)
+    # failing channels back off exponentially, broken ones are only probed until they recover
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=HEALTHY)
+    failure_count = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    # WebSub hub advertised by the document and the topic url it knows the channel by,
+    # pushes are signed with the secret and the channel is pushed until the lease ends
+    hub = models.URLField(null=True)
+    topic = models.URLField(null=True)
+    websub_secret = models.CharField(max_length=64, null=True)
+    websub_expires_at = models.DateTimeField(null=True)
+    # hubs may only verify a subscription requested less than WEBSUB_VERIFY_TIMEOUT ago
+    websub_requested_at = models.DateTimeField(null=True)
+
+
 class Feed(models.Model):
+    PENDING = 'pending'
+    ACTIVE = 'active'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (ACTIVE, 'Active'),
+        (FAILED, 'Failed'),
+    )
+
     title = models.TextField()
     link = models.URLField()
     description = models.TextField()
@@ -14,26 +65,44 @@ class Feed(models.Model):
         related_name='feeds',
         on_delete=models.CASCADE
         )
+    channel = models.ForeignKey(
+        Channel,
+        related_name='feeds',
+        on_delete=models.CASCADE
+        )
     modified_at = models.DateTimeField(null=True)
     updated = models.BooleanField(default=True)
+    # state of the first fetch of feeds subscribed asynchronously
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=ACTIVE)
+    error = models.TextField(null=True, blank=True)
+    # kept in sync with the feed items by every write, drift is corrected by a periodic task
+    unread_count = models.PositiveIntegerField(default=0)
+    total_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ('xml_link', 'owner')
 
 
-class Item(models.Model):
+class Entry(models.Model):
+    """
+    Content of a channel item stored once for all the users following the channel.
+    """
     title = models.TextField(null=True)
     link = models.URLField(null=True)
     description = models.TextField(null=True)
     published_at = models.DateTimeField(null=True)
-    read = models.BooleanField(default=False)
-    feed = models.ForeignKey(
-        Feed,
-        related_name='items',
+    channel = models.ForeignKey(
+        Channel,
+        related_name='entries',
         on_delete=models.CASCADE
         )
     last_updated_at = models.DateTimeField(default=now)
+    # set by every fetched document listing the entry, unlike last_updated_at which only
+    # moves with the content, entries not listed anymore are pruned by it
+    last_seen_at = models.DateTimeField(default=now)
     guid = models.TextField()
+    # hash of the item data, compared instead of loading the stored content
+    content_hash = models.CharField(max_length=64, null=True)
 
     def clean(self):
         super().clean()
@@ -41,5 +110,36 @@ class Item(models.Model):
             raise ValidationError('Both title and description can not be None')
 
     class Meta:
-        ordering = ['-last_updated_at']
-        unique_together = ('feed', 'guid')
+        unique_together = ('channel', 'guid')
+
+
+class Item(models.Model):
+    """
+    Per user read state of a channel entry.
+    """
+    read = models.BooleanField(default=False)
+    feed = models.ForeignKey(
+        Feed,
+        related_name='items',
+        on_delete=models.CASCADE
+        )
+    entry = models.ForeignKey(
+        Entry,
+        related_name='items',
+        on_delete=models.CASCADE
+        )
+    # copied from the entry to order user items without joining entries
+    last_updated_at = models.DateTimeField(default=now)
+    # set whenever the item is created, its entry is updated or it is read for delta sync
+    changed_at = models.DateTimeField(default=now)
+
+    class Meta:
+        # items of one fetch share last_updated_at so the id keeps document order
+        ordering = ['-last_updated_at', '-id']
+        unique_together = ('feed', 'entry')
+        # match the keyset pagination of feed items with and without read filter
+        indexes = [
+            models.Index(fields=['feed', 'last_updated_at', 'id']),
+            models.Index(fields=['feed', 'read', 'last_updated_at', 'id']),
+            models.Index(fields=['feed', 'changed_at', 'id']),
+        ]
@@ -0,0 +1,246 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class ItemCursorPagination(BasePagination):
+    """
+    Keyset pagination over (last_updated_at, id), every page is fetched by an index
+    range scan starting after the last item of the previous page instead of an OFFSET.
+    Previous pages are fetched the same way in reverse order from the first item of the
+    page, the count comes from the view without counting the items.
+    """
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    invalid_cursor_message = 'Invalid cursor'
+    position_field = 'last_updated_at'
+    ordering = ('-last_updated_at', '-id')
+    previous_marker = 'previous'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.view = view
+        self.page_size = self.get_page_size(request)
+        self.position, self.reverse = self.decode_cursor(request)
+        ordering = self.ordering
+        if self.position is not None:
+            queryset = self.filter_after(queryset, self.position, reverse=self.reverse)
+        if self.reverse:
+            ordering = tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
+        items = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(items) > self.page_size
+        items = items[:self.page_size]
+        if self.reverse:
+            items.reverse()
+        # a page reached from a cursor has at least the item of the cursor on its other side
+        self.has_next = self.position is not None if self.reverse else has_more
+        self.has_previous = has_more if self.reverse else self.position is not None
+        self.first_position = None
+        if items:
+            self.first_position = self.get_position(items[0])
+            self.position = self.get_position(items[-1])
+        else:
+            self.has_next = self.has_previous = False
+        return items
+
+    def get_position(self, item):
+        return (getattr(item, self.position_field), item.pk)
+
+    def filter_after(self, queryset, position, reverse=False):
+        value, pk = position
+        lookup = 'lt' if self.ordering[0].startswith('-') != reverse else 'gt'
+        # the redundant bound gives PostgreSQL a range on the position field to prune
+        # item partitions and to scan the index in order
+        return queryset.filter(
+            Q(**{'{}__{}'.format(self.position_field, lookup): value}) |
+            Q(**{self.position_field: value, 'id__{}'.format(lookup): pk}),
+            **{'{}__{}e'.format(self.position_field, lookup): value}
+        )
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        return self.parse_cursor(encoded)
+
+    def parse_cursor(self, encoded):
+        '''
+        decode a cursor of the listing
+
+        Parameters:
+            encoded (str): cursor query parameter.
+        Returns:
+            position (tuple): position field value and id of the item the page starts after.
+            reverse (boolean): True if the page is the one before the position, False otherwise.
+        '''
+        try:
+            value, pk, *marker = b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            position = (parse_datetime(value), int(pk))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if position[0] is None or marker not in ([], [self.previous_marker]):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(marker)
+
+    def encode_cursor(self, position, reverse=False):
+        value, pk = position
+        cursor = '{}|{}'.format(value.isoformat(), pk)
+        if reverse:
+            cursor = '{}|{}'.format(cursor, self.previous_marker)
+        return b64encode(cursor.encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.position)
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.first_position, reverse=True)
+        )
+
+    def get_count(self):
+        # views count their items from counters, counting the rows is the scan the cursor avoids
+        count_items = getattr(self.view, 'count_items', None)
+        return count_items() if count_items is not None else None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.get_count()),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {
+                    'type': 'integer',
+                    'nullable': True,
+                },
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'previous': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+
+class ItemSyncPagination(ItemCursorPagination):
+    """
+    Keyset pagination over (changed_at, id) in change order, the returned cursor
+    points after the last change the client received so the next sync only returns
+    items created, updated or marked as read after it.
+    """
+    max_page_size = 500
+    position_field = 'changed_at'
+    ordering = ('changed_at', 'id')
+    # changes are only synced forward
+    previous_marker = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # changes committed by slower transactions may carry an older changed_at,
+        # recent changes are held back until they can not be overtaken anymore
+        settled_at = timezone.now() - timedelta(seconds=settings.ITEM_SYNC_SETTLE_TIME)
+        return super().paginate_queryset(queryset.filter(changed_at__lte=settled_at), request, view)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('cursor', self.encode_cursor(self.position) if self.position else None),
+            ('has_more', self.has_next),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'cursor': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'has_more': {
+                    'type': 'boolean',
+                },
+                'results': schema,
+            },
+        }
+
+
+class ItemSearchPagination(LimitOffsetPagination):
+    """
+    Offset pagination of ranked search results without counting all the matches,
+    one more result than the page size is fetched to know if there is a next page.
+    """
+    max_limit = 100
+    # deep pages of ranked results are not worth ranking every match for
+    max_offset = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = min(self.get_offset(request), self.max_offset)
+        items = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(items) > self.limit and self.offset + self.limit <= self.max_offset
+        return items[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = replace_query_param(self.request.build_absolute_uri(), self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
@@ -0,0 +1,308 @@
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from feeds.cache import invalidate_users
+
+logger = logging.getLogger(__name__)
+
+# items are partitioned by month of last_updated_at on PostgreSQL, rows out of the
+# monthly ranges like the unread items of dropped partitions go to the default one
+ITEM_TABLE = 'feeds_item'
+DEFAULT_PARTITION = 'feeds_item_default'
+PARTITION_NAME = re.compile(r'^feeds_item_p(\d{4})(\d{2})$')
+# unique constraints of a partitioned table must include the partition key, so one item
+# per feed and entry is kept by a plain table of their keys claimed by every inserted row.
+# A row whose key is taken is skipped like ON CONFLICT DO NOTHING, rows moved to another
+# partition by an update release their key before claiming it again. BEFORE row triggers
+# of partitioned tables need PostgreSQL 13, duplicates found when the keys are added are
+# deleted and their counters corrected by the reconcile task
+ITEM_KEYS_SQL = '''
+DELETE FROM feeds_item duplicate USING feeds_item item
+WHERE duplicate.feed_id = item.feed_id AND duplicate.entry_id = item.entry_id AND duplicate.id > item.id;
+CREATE TABLE feeds_item_key (
+    feed_id bigint NOT NULL,
+    entry_id bigint NOT NULL,
+    PRIMARY KEY (feed_id, entry_id)
+);
+INSERT INTO feeds_item_key SELECT feed_id, entry_id FROM feeds_item;
+CREATE FUNCTION feeds_item_claim_key() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO feeds_item_key VALUES (NEW.feed_id, NEW.entry_id) ON CONFLICT DO NOTHING;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+CREATE FUNCTION feeds_item_release_key() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM feeds_item_key WHERE feed_id = OLD.feed_id AND entry_id = OLD.entry_id;
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER feeds_item_claim_key BEFORE INSERT ON feeds_item
+FOR EACH ROW EXECUTE FUNCTION feeds_item_claim_key();
+CREATE TRIGGER feeds_item_release_key BEFORE DELETE ON feeds_item
+FOR EACH ROW EXECUTE FUNCTION feeds_item_release_key();
+'''
+# keys of the rows of a detached partition
+RELEASE_KEYS_SQL = '''
+DELETE FROM feeds_item_key USING {partition}
+WHERE feeds_item_key.feed_id = {partition}.feed_id AND feeds_item_key.entry_id = {partition}.entry_id
+'''
+
+CONSTRAINTS_SQL = '''
+SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint
+WHERE conrelid = %s::regclass
+'''
+INDEXES_SQL = '''
+SELECT indexname, indexdef FROM pg_indexes
+WHERE tablename = %s AND indexname NOT IN (
+    SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass
+)
+'''
+PARTITIONS_SQL = '''
+SELECT child.relname FROM pg_inherits
+JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+WHERE pg_inherits.inhparent = %s::regclass
+'''
+# counters of the feeds losing the rows of a dropped partition
+UNCOUNT_SQL = '''
+UPDATE feeds_feed SET
+    total_count = GREATEST(total_count - dropped.total, 0),
+    unread_count = GREATEST(unread_count - dropped.unread, 0)
+FROM (
+    SELECT feed_id, count(*) AS total, count(*) FILTER (WHERE NOT read) AS unread
+    FROM {partition} {where} GROUP BY feed_id
+) AS dropped
+WHERE feeds_feed.id = dropped.feed_id
+RETURNING feeds_feed.owner_id
+'''
+
+
+def is_partitioned():
+    '''
+    check if the item table is partitioned
+
+    Returns:
+        partitioned (boolean): True on PostgreSQL with a partitioned item table, False otherwise.
+    '''
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE relname = %s', [ITEM_TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def get_month_start(value):
+    '''
+    get the first moment of the month of value in UTC
+
+    Parameters:
+        value (datetime): aware datetime.
+    Returns:
+        start (datetime): start of the month.
+    '''
+    value = value.astimezone(timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(start, months):
+    '''
+    get the start of the month months after the month starting at start
+
+    Parameters:
+        start (datetime): start of a month.
+        months (int): number of months to add.
+    Returns:
+        start (datetime): start of the later month.
+    '''
+    month = start.month - 1 + months
+    return start.replace(year=start.year + month // 12, month=month % 12 + 1)
+
+
+def get_partition_name(start):
+    return 'feeds_item_p{:%Y%m}'.format(start)
+
+
+def get_partition_start(name):
+    '''
+    get the start of the month held by a partition from its name
+
+    Parameters:
+        name (str): partition table name.
+    Returns:
+        start (datetime): start of the month or None for the default partition.
+    '''
+    match = PARTITION_NAME.match(name)
+    if match is None:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+
+
+def create_partition(cursor, start):
+    '''
+    create the partition of the month starting at start if it does not exist
+
+    Parameters:
+        cursor (CursorWrapper): database cursor.
+        start (datetime): start of the month.
+    '''
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)'.format(
+            get_partition_name(start), ITEM_TABLE
+        ),
+        [start, add_months(start, 1)]
+    )
+
+
+def partition_item_table(schema_editor):
+    '''
+    turn the item table into a table partitioned by month of last_updated_at keeping
+    its rows, indexes and constraint names. The partition key joins the primary key
+    and the (feed, entry) unique constraint, which no longer keeps one item per feed
+    and entry, the keys table of ITEM_KEYS_SQL does.
+
+    Parameters:
+        schema_editor (BaseDatabaseSchemaEditor): schema editor of a PostgreSQL connection.
+    '''
+    old_table = '{}_unpartitioned'.format(ITEM_TABLE)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CONSTRAINTS_SQL, [ITEM_TABLE])
+        constraints = cursor.fetchall()
+        cursor.execute(INDEXES_SQL, [ITEM_TABLE, ITEM_TABLE])
+        indexes = cursor.fetchall()
+        cursor.execute('SELECT min(last_updated_at) FROM {}'.format(ITEM_TABLE))
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute('ALTER TABLE {} RENAME TO {}'.format(ITEM_TABLE, old_table))
+        cursor.execute(
+            'CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS) PARTITION BY RANGE (last_updated_at)'.format(
+                ITEM_TABLE, old_table
+            )
+        )
+        cursor.execute('CREATE TABLE {} PARTITION OF {} DEFAULT'.format(DEFAULT_PARTITION, ITEM_TABLE))
+        now = datetime.now(timezone.utc)
+        start = get_month_start(oldest or now)
+        while start <= add_months(get_month_start(now), settings.ITEM_PARTITIONS_AHEAD):
+            create_partition(cursor, start)
+            start = add_months(start, 1)
+        cursor.execute('INSERT INTO {} SELECT * FROM {}'.format(ITEM_TABLE, old_table))
+        # the id sequence must outlive the old table
+        cursor.execute("ALTER SEQUENCE {0}_id_seq OWNED BY {0}.id".format(ITEM_TABLE))
+        cursor.execute('DROP TABLE {}'.format(old_table))
+
+        for name, kind, definition in constraints:
+            if kind in ('p', 'u'):
+                # unique constraints of partitioned tables include the partition key
+                definition = re.sub(r'\)$', ', last_updated_at)', definition)
+            cursor.execute('ALTER TABLE {} ADD CONSTRAINT {} {}'.format(ITEM_TABLE, name, definition))
+        # definitions were read before the rename so they target the new table
+        for name, definition in indexes:
+            cursor.execute(definition)
+        cursor.execute(ITEM_KEYS_SQL)
+
+
+def get_partitions(cursor):
+    '''
+    get the monthly partitions of the item table
+
+    Parameters:
+        cursor (CursorWrapper): database cursor.
+    Returns:
+        partitions (dict): start of the month keyed by partition name.
+    '''
+    cursor.execute(PARTITIONS_SQL, [ITEM_TABLE])
+    partitions = {}
+    for name, in cursor.fetchall():
+        start = get_partition_start(name)
+        if start is not None:
+            partitions[name] = start
+    return partitions
+
+
+def get_partitions_start():
+    '''
+    get the start of the oldest monthly partition, older items like the unread items
+    of dropped partitions are in the default partition
+
+    Returns:
+        start (datetime): start of the oldest month, None without monthly partitions.
+    '''
+    if not is_partitioned():
+        return None
+    with connection.cursor() as cursor:
+        return min(get_partitions(cursor).values(), default=None)
+
+
+def create_next_partitions(now):
+    '''
+    create the partitions of the current month and of the ITEM_PARTITIONS_AHEAD next ones
+
+    Parameters:
+        now (datetime): time of the maintenance run.
+    Returns:
+        names (List): names of the created partitions.
+    '''
+    with connection.cursor() as cursor:
+        existing = get_partitions(cursor)
+        created = []
+        start = get_month_start(now)
+        for months in range(settings.ITEM_PARTITIONS_AHEAD + 1):
+            month = add_months(start, months)
+            if get_partition_name(month) not in existing:
+                create_partition(cursor, month)
+                created.append(get_partition_name(month))
+    return created
+
+
+def drop_partition(cursor, name):
+    '''
+    drop a partition whose rows are all past ITEM_RETENTION_DAYS, its unread items
+    are moved to the default partition if ITEM_RETENTION_KEEP_UNREAD is set
+
+    Parameters:
+        cursor (CursorWrapper): database cursor.
+        name (str): partition table name.
+    '''
+    cursor.execute('ALTER TABLE {} DETACH PARTITION {}'.format(ITEM_TABLE, name))
+    # dropping a table fires no delete trigger, the unread items moved back claim their keys again
+    cursor.execute(RELEASE_KEYS_SQL.format(partition=name))
+    where = ''
+    if settings.ITEM_RETENTION_KEEP_UNREAD:
+        where = 'WHERE read'
+        cursor.execute('INSERT INTO {} SELECT * FROM {} WHERE NOT read'.format(ITEM_TABLE, name))
+    cursor.execute(UNCOUNT_SQL.format(partition=name, where=where))
+    invalidate_users(owner_id for owner_id, in cursor.fetchall())
+    cursor.execute('DROP TABLE {}'.format(name))
+
+
+def drop_old_partitions(now):
+    '''
+    drop the partitions holding only items older than ITEM_RETENTION_DAYS, one
+    transaction per partition
+
+    Parameters:
+        now (datetime): time of the maintenance run.
+    Returns:
+        names (List): names of the dropped partitions.
+    '''
+    if not settings.ITEM_RETENTION_DAYS:
+        return []
+    cutoff = now - timedelta(days=settings.ITEM_RETENTION_DAYS)
+    with connection.cursor() as cursor:
+        partitions = get_partitions(cursor)
+    dropped = []
+    for name, start in sorted(partitions.items(), key=lambda partition: partition[1]):
+        if add_months(start, 1) > cutoff:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            drop_partition(cursor, name)
+        logger.info('Dropped item partition %s', name)
+        dropped.append(name)
+    return dropped
@@ -0,0 +1,112 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, Max, OuterRef, Q
+from django.db.models.functions import Greatest
+
+from feeds.cache import invalidate_feeds
+from feeds.models import Entry, Feed, Item
+
+
+def get_prunable_items(feed, now, partitions_start=None):
+    '''
+    get the items of feed past the retention policy: older than ITEM_RETENTION_DAYS
+    or after the ITEM_RETENTION_MAX_PER_FEED newest ones, unread items are kept
+    if ITEM_RETENTION_KEEP_UNREAD is set.
+
+    Parameters:
+        feed (Feed): feed whose items are checked.
+        now (datetime): time of the pruning run.
+        partitions_start (datetime): start of the oldest monthly partition, ITEM_RETENTION_DAYS only
+            applies to the older items of the default partition since old partitions are dropped instead.
+    Returns:
+        items (QuerySet): Item objects to be deleted.
+    '''
+    rules = []
+    if settings.ITEM_RETENTION_DAYS:
+        cutoff = now - timedelta(days=settings.ITEM_RETENTION_DAYS)
+        if partitions_start is not None:
+            cutoff = min(cutoff, partitions_start)
+        rules.append(Q(last_updated_at__lt=cutoff))
+    if settings.ITEM_RETENTION_MAX_PER_FEED:
+        # position of the oldest item kept, read by the (feed, last_updated_at, id) index
+        position = Item.objects.filter(feed=feed).order_by('-last_updated_at', '-id').values_list(
+            'last_updated_at', 'id'
+        )[settings.ITEM_RETENTION_MAX_PER_FEED - 1:settings.ITEM_RETENTION_MAX_PER_FEED].first()
+        if position is not None:
+            rules.append(Q(last_updated_at__lt=position[0]) | Q(last_updated_at=position[0], id__lt=position[1]))
+    if not rules:
+        return Item.objects.none()
+    items = Item.objects.filter(feed=feed)
+    if settings.ITEM_RETENTION_KEEP_UNREAD:
+        items = items.filter(read=True)
+    condition = rules[0]
+    for rule in rules[1:]:
+        condition |= rule
+    return items.filter(condition)
+
+
+def prune_feed_items(feed, now, partitions_start=None):
+    '''
+    delete the items of feed past the retention policy in batches of ITEM_PRUNE_BATCH_SIZE,
+    every batch is a short transaction so no lock is held for long
+
+    Parameters:
+        feed (Feed): feed whose items are pruned.
+        now (datetime): time of the pruning run.
+        partitions_start (datetime): start of the oldest monthly partition of a partitioned table.
+    Returns:
+        count (int): number of deleted items.
+    '''
+    items = get_prunable_items(feed, now, partitions_start=partitions_start).order_by()
+    pruned = 0
+    while True:
+        batch = list(items.values_list('pk', 'read')[:settings.ITEM_PRUNE_BATCH_SIZE])
+        if not batch:
+            break
+        unread = sum(1 for pk, read in batch if not read)
+        with transaction.atomic():
+            Item.objects.filter(pk__in=[pk for pk, read in batch]).delete()
+            Feed.objects.filter(pk=feed.pk).update(
+                total_count=Greatest(F('total_count') - len(batch), 0),
+                unread_count=Greatest(F('unread_count') - unread, 0)
+            )
+        pruned += len(batch)
+    if pruned:
+        invalidate_feeds([feed])
+    return pruned
+
+
+def prune_orphan_entries(channel, now):
+    '''
+    delete the entries of channel left without items and not listed by its documents
+    for ENTRY_ORPHAN_RETENTION_DAYS. An entry still published by the channel would be
+    created again as a new one, so the entries of the last processed document are kept
+    whatever their age, a channel answering 304 Not Modified still lists them.
+
+    Parameters:
+        channel (Channel): channel whose entries are pruned.
+        now (datetime): time of the pruning run.
+    Returns:
+        count (int): number of deleted entries.
+    '''
+    seen_before = now - timedelta(days=settings.ENTRY_ORPHAN_RETENTION_DAYS)
+    # every entry of a processed document is marked seen at the same time
+    last_seen_at = channel.entries.aggregate(last_seen_at=Max('last_seen_at'))['last_seen_at']
+    if last_seen_at is not None:
+        seen_before = min(seen_before, last_seen_at)
+    orphans = Entry.objects.filter(
+        ~Exists(Item.objects.filter(entry=OuterRef('pk'))),
+        channel=channel,
+        last_seen_at__lt=seen_before
+    ).order_by()
+    pruned = 0
+    while True:
+        batch = list(orphans.values_list('pk', flat=True)[:settings.ITEM_PRUNE_BATCH_SIZE])
+        if not batch:
+            break
+        # an item created meanwhile by a re-enabled feed keeps its entry
+        deleted, _ = orphans.filter(pk__in=batch).delete()
+        pruned += deleted
+    return pruned
@@ -0,0 +1,165 @@
+import random
+import re
+import time
+from calendar import timegm
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+MAX_AGE_PATTERN = re.compile(r'max-age=(\d+)')
+SKIP_HOURS_PATTERN = re.compile(rb'<skipHours>(.*?)</skipHours>', re.DOTALL | re.IGNORECASE)
+HOUR_PATTERN = re.compile(rb'<hour>\s*(\d+)\s*</hour>', re.IGNORECASE)
+
+
+def get_skip_hours(content):
+    '''
+    extract RSS skipHours from raw document as feedparser only keeps the last hour
+
+    Parameters:
+        content (bytes): feed document.
+    Returns:
+        hours (List): UTC hours in which the feed should not be fetched.
+    '''
+    match = SKIP_HOURS_PATTERN.search(content)
+    if not match:
+        return []
+    return sorted({int(hour) for hour in HOUR_PATTERN.findall(match.group(1)) if 0 <= int(hour) < 24})
+
+
+def get_publish_interval(feed_xml):
+    '''
+    estimate how often the feed publishes from the dates of its recent entries,
+    a feed that stopped publishing gets the time since its last entry.
+
+    Parameters:
+        feed_xml (FeedParserDict): parsed feed data.
+    Returns:
+        interval (int): seconds between entries or None if entries have no dates.
+    '''
+    timestamps = sorted((
+        timegm(entry.get('published_parsed') or entry.get('updated_parsed'))
+        for entry in feed_xml.get('entries', [])
+        if entry.get('published_parsed') or entry.get('updated_parsed')
+    ), reverse=True)[:settings.FEED_SCHEDULE_SAMPLE_SIZE]
+    if len(timestamps) < 2:
+        return None
+    average_gap = (timestamps[0] - timestamps[-1]) / (len(timestamps) - 1)
+    silence = time.time() - timestamps[0]
+    return max(average_gap, silence)
+
+
+def get_cache_max_age(feed_xml):
+    '''
+    read max-age of Cache-Control response header
+
+    Parameters:
+        feed_xml (FeedParserDict): parsed feed data.
+    Returns:
+        max_age (int): seconds the response is fresh for or None if not set.
+    '''
+    cache_control = feed_xml.get('headers', {}).get('cache-control', '')
+    match = MAX_AGE_PATTERN.search(cache_control)
+    return int(match.group(1)) if match else None
+
+
+def get_fetch_interval(channel, feed_xml):
+    '''
+    compute seconds to wait before fetching the channel again, fetching twice per
+    publish interval while honoring ttl and Cache-Control hints of the feed.
+
+    Parameters:
+        channel (Channel): channel that was fetched.
+        feed_xml (FeedParserDict): parsed feed data.
+    Returns:
+        interval (int): seconds until the next fetch.
+    '''
+    interval = channel.fetch_interval
+    publish_interval = get_publish_interval(feed_xml)
+    if publish_interval is not None:
+        interval = publish_interval / 2
+
+    ttl = feed_xml.get('feed', {}).get('ttl')
+    if ttl and str(ttl).isdigit():
+        interval = max(interval, int(ttl) * 60)
+    max_age = get_cache_max_age(feed_xml)
+    if max_age:
+        interval = max(interval, max_age)
+    return int(min(max(interval, settings.FEED_MIN_FETCH_INTERVAL), settings.FEED_MAX_FETCH_INTERVAL))
+
+
+def get_next_fetch_at(interval, skip_hours):
+    '''
+    get next fetch time after interval, moved to the first hour not in skip hours
+
+    Parameters:
+        interval (int): seconds until the next fetch.
+        skip_hours (List): UTC hours in which the feed should not be fetched.
+    Returns:
+        next_fetch_at (datetime): time of the next fetch.
+    '''
+    next_fetch_at = timezone.now() + timedelta(seconds=interval)
+    if len(skip_hours) >= 24:
+        return next_fetch_at
+    while next_fetch_at.hour in skip_hours:
+        next_fetch_at = next_fetch_at.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return next_fetch_at
+
+
+def get_poll_interval(channel):
+    '''
+    get seconds between polls of channel, a channel pushed by its WebSub hub is only
+    polled every WEBSUB_POLL_INTERVAL in case pushes get lost
+
+    Parameters:
+        channel (Channel): channel to be polled.
+    Returns:
+        interval (int): seconds until the next fetch.
+    '''
+    if channel.websub_expires_at is not None and channel.websub_expires_at > timezone.now():
+        return max(channel.fetch_interval, settings.WEBSUB_POLL_INTERVAL)
+    return channel.fetch_interval
+
+
+def schedule_channel(channel, feed_xml):
+    '''
+    set the fetch interval and next fetch time of channel from the fetched document,
+    a 304 response or an unchanged document keeps the interval computed from the
+    last full document.
+
+    Parameters:
+        channel (Channel): channel that was fetched.
+        feed_xml (FeedParserDict): parsed feed data.
+    '''
+    if feed_xml.get('status') != 304 and not feed_xml.get('unchanged'):
+        channel.fetch_interval = get_fetch_interval(channel, feed_xml)
+        channel.skip_hours = feed_xml.get('skip_hours', [])
+    channel.next_fetch_at = get_next_fetch_at(get_poll_interval(channel), channel.skip_hours)
+
+
+def get_backoff_interval(failure_count):
+    '''
+    compute seconds to wait before fetching a failing channel again, doubling with every
+    failure in a row and switching to the probe interval once the circuit is open.
+    A random part spreads the retries of channels that failed together.
+
+    Parameters:
+        failure_count (int): number of failed updates in a row.
+    Returns:
+        interval (float): seconds until the next fetch.
+    '''
+    if failure_count >= settings.FEED_CIRCUIT_THRESHOLD:
+        interval = settings.FEED_PROBE_INTERVAL
+    else:
+        interval = min(settings.FEED_BACKOFF_BASE * 2 ** (failure_count - 1), settings.FEED_BACKOFF_MAX)
+    return random.uniform(interval / 2, interval)
+
+
+def schedule_failed_channel(channel):
+    '''
+    set the next fetch time of a channel whose update failed
+
+    Parameters:
+        channel (Channel): channel that failed to be updated.
+    '''
+    channel.next_fetch_at = timezone.now() + timedelta(seconds=get_backoff_interval(channel.failure_count))
@@ -0,0 +1,108 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+# the index is a generated tsvector column with a GIN index on PostgreSQL and an
+# FTS5 table kept in sync by triggers on SQLite, both are created by migration 0010
+# and the SQLite one is created again by the migrations rebuilding the entry table
+POSTGRES_COLUMN_SQL = '''
+ALTER TABLE feeds_entry ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'B')
+) STORED;
+CREATE INDEX feeds_entry_search_vector_idx ON feeds_entry USING GIN (search_vector);
+'''
+POSTGRES_DROP_SQL = 'ALTER TABLE feeds_entry DROP COLUMN search_vector;'
+SQLITE_TABLE_SQL = [
+    '''
+    CREATE VIRTUAL TABLE feeds_entry_fts USING fts5(
+        title, description, content='feeds_entry', content_rowid='id'
+    )
+    ''',
+    '''
+    CREATE TRIGGER feeds_entry_fts_insert AFTER INSERT ON feeds_entry BEGIN
+        INSERT INTO feeds_entry_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER feeds_entry_fts_delete AFTER DELETE ON feeds_entry BEGIN
+        INSERT INTO feeds_entry_fts(feeds_entry_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER feeds_entry_fts_update AFTER UPDATE OF title, description ON feeds_entry BEGIN
+        INSERT INTO feeds_entry_fts(feeds_entry_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO feeds_entry_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    ''',
+    "INSERT INTO feeds_entry_fts(feeds_entry_fts) VALUES ('rebuild')",
+]
+SQLITE_DROP_SQL = [
+    'DROP TRIGGER feeds_entry_fts_insert',
+    'DROP TRIGGER feeds_entry_fts_delete',
+    'DROP TRIGGER feeds_entry_fts_update',
+    'DROP TABLE feeds_entry_fts',
+]
+
+# read from the entry joined to the items
+POSTGRES_MATCHES_SQL = "feeds_entry.search_vector @@ websearch_to_tsquery('english', %s)"
+POSTGRES_RANK_SQL = "ts_rank(feeds_entry.search_vector, websearch_to_tsquery('english', %s))"
+
+SQLITE_MATCHES_SQL = 'SELECT rowid FROM feeds_entry_fts WHERE feeds_entry_fts MATCH %s'
+# bm25 is lower for better matches
+SQLITE_RANK_SQL = '''
+SELECT -bm25(feeds_entry_fts, 2.0, 1.0) FROM feeds_entry_fts
+WHERE feeds_entry_fts MATCH %s AND feeds_entry_fts.rowid = feeds_item.entry_id
+'''
+
+
+def get_match_query(query):
+    '''
+    turn user input into an FTS5 query matching entries having all of its words,
+    words are quoted so FTS5 operators and syntax errors can not come from input
+
+    Parameters:
+        query (str): searched text.
+    Returns:
+        match (str): FTS5 query or None if query has no words.
+    '''
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    return ' '.join('"{}"'.format(word) for word in words)
+
+
+def search_items(items, channels, query):
+    '''
+    filter items whose entry matches query and rank them, best matches first.
+    On PostgreSQL entries are joined to the items and restricted to channels before
+    they are matched, so only the entries the items can list are ranked.
+
+    Parameters:
+        items (QuerySet): Item objects to be searched.
+        channels (QuerySet): ids of the channels of the searched feeds.
+        query (str): searched text.
+    Returns:
+        items (QuerySet): matching Item objects ordered by rank.
+    '''
+    items = items.filter(entry__channel_id__in=channels)
+    if connection.vendor == 'postgresql':
+        items = items.alias(
+            matches=RawSQL(POSTGRES_MATCHES_SQL, [query], output_field=BooleanField())
+        ).filter(matches=True).annotate(
+            rank=RawSQL(POSTGRES_RANK_SQL, [query], output_field=FloatField())
+        )
+    else:
+        query = get_match_query(query)
+        if query is None:
+            return items.none()
+        items = items.filter(
+            entry_id__in=RawSQL(SQLITE_MATCHES_SQL, [query])
+        ).annotate(
+            rank=RawSQL(SQLITE_RANK_SQL, [query], output_field=FloatField())
+        )
+    return items.order_by('-rank', '-last_updated_at', '-id')
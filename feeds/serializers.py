@@ -1,12 +1,22 @@
 from rest_framework import serializers
+from rest_framework.exceptions import NotFound
 
 from feeds import models
+from feeds.pagination import ItemCursorPagination
 
 
 class FeedSerializer(serializers.ModelSerializer):
 
     class Meta:
-        fields = '__all__'
+        exclude = ('channel',)
+        read_only_fields = ('status', 'error', 'unread_count', 'total_count')
+        model = models.Feed
+
+
+class FeedSubscriptionSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        fields = ('id', 'status', 'error')
         model = models.Feed
 
 
@@ -24,9 +34,14 @@ class CreateFeedSerializer(serializers.Serializer):
 
 
 class ItemSerializer(serializers.ModelSerializer):
+    title = serializers.CharField(source='entry.title', read_only=True)
+    link = serializers.URLField(source='entry.link', read_only=True)
+    description = serializers.CharField(source='entry.description', read_only=True)
+    published_at = serializers.DateTimeField(source='entry.published_at', read_only=True)
+    guid = serializers.CharField(source='entry.guid', read_only=True)
 
     class Meta:
-        fields = '__all__'
+        fields = ('id', 'title', 'link', 'description', 'published_at', 'read', 'feed', 'last_updated_at', 'guid')
         model = models.Item
 
 
@@ -45,3 +60,21 @@ class ReadItemSerializer(serializers.Serializer):
                 "Some ids are invalid or you do not have permission to edit"
                 )
         return value
+
+
+class ReadAllItemsSerializer(serializers.Serializer):
+    before = serializers.DateTimeField(required=False)
+    cursor = serializers.CharField(required=False)
+
+    class Meta:
+        fields = '__all__'
+
+    def validate_cursor(self, value):
+        try:
+            position, reverse = ItemCursorPagination().parse_cursor(value)
+        except NotFound:
+            raise serializers.ValidationError("Invalid cursor")
+        # items are marked read from a page on, not up to it
+        if reverse:
+            raise serializers.ValidationError("Invalid cursor")
+        return position
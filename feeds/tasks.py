@@ -1,31 +1,201 @@
+from base64 import b64decode
+from collections import defaultdict
+from datetime import timedelta
+
 from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
-from celery.exceptions import MaxRetriesExceededError
 from celery import shared_task, group
 
-from feeds.models import Feed
-from feeds.utils import update_feed, send_failure_notification
+from feeds.cache import invalidate_feeds
+from feeds.models import Channel, Feed
+from feeds.retention import prune_feed_items, prune_orphan_entries
+from feeds.fetcher import fetch_channels, FetchError
+from feeds.metrics import REFRESH_LAG
+from feeds.partitions import is_partitioned, create_next_partitions, drop_old_partitions, get_partitions_start
+from feeds.scheduler import get_next_fetch_at
+from feeds.throttling import HostThrottled
+from feeds.websub import needs_subscription, request_subscription, parse_pushed_document
+from feeds.utils import (
+    update_feed, update_channel, update_channel_document, subscribe_feed, record_channel_failure, get_error_message,
+    reconcile_feeds_counts
+)
 
 
-@shared_task(max_retries=settings.CELERY_MAX_RETRIES, default_retry_delay=settings.CELERY_RETRY_DELAY)
+@shared_task
 def feed_update_task(feed_pk):
-    feed = Feed.objects.get(pk=feed_pk)
+    feed = Feed.objects.select_related('channel').get(pk=feed_pk)
     try:
-        result = update_feed(feed)
-    except ValidationError:
-        result = False
+        if update_feed(feed) is False:
+            record_channel_failure(feed.channel, FetchError('failed to update {}'.format(feed.xml_link)))
+    except ValidationError as error:
+        record_channel_failure(feed.channel, error)
+
+
+# the only task whose result is stored, force update waits for it
+@shared_task(ignore_result=False)
+def feed_refresh_task(feed_pk):
+    feed = Feed.objects.select_related('channel').get(pk=feed_pk)
+    try:
+        if update_feed(feed) is False:
+            record_channel_failure(feed.channel, FetchError('failed to update {}'.format(feed.xml_link)))
+    except ValidationError as error:
+        record_channel_failure(feed.channel, error)
+        # returned instead of raised so the waiting request can answer with them
+        return error.detail
+
+
+@shared_task
+def feed_subscribe_task(feed_pk):
+    feed = Feed.objects.select_related('channel').filter(pk=feed_pk, status=Feed.PENDING).first()
+    # feed was unfollowed or already fetched
+    if feed is None:
+        return
+    try:
+        subscribe_feed(feed)
+    except ValidationError as error:
+        feed.status = Feed.FAILED
+        feed.error = get_error_message(error)
+        feed.save(update_fields=['status', 'error'])
+        invalidate_feeds([feed])
+        return
+    if needs_subscription(feed.channel):
+        websub_subscribe_task.delay(feed.channel_id)
 
-    if result is False:
+
+@shared_task
+def channel_update_task(channel_pk):
+    channel = Channel.objects.get(pk=channel_pk)
+    feeds = list(channel.feeds.filter(updated=True))
+    # broken channels are probed even though their followers are disabled
+    if not feeds and channel.state != Channel.BROKEN:
+        return
+    try:
+        if update_channel(channel, feeds) is False:
+            record_channel_failure(channel, FetchError('failed to update {}'.format(channel.xml_link)))
+    except ValidationError as error:
+        record_channel_failure(channel, error)
+
+
+@shared_task
+def channels_batch_update_task(channels_pks):
+    channels = list(Channel.objects.filter(pk__in=channels_pks))
+    feeds_by_channel = defaultdict(list)
+    for feed in Feed.objects.filter(channel__in=channels, updated=True):
+        feeds_by_channel[feed.channel_id].append(feed)
+
+    for channel, feed_xml in fetch_channels(channels):
+        if isinstance(feed_xml, HostThrottled):
+            # the host is busy, not failing
+            channel.next_fetch_at = get_next_fetch_at(settings.FEED_MIN_FETCH_INTERVAL, channel.skip_hours)
+            channel.save(update_fields=['next_fetch_at'])
+            continue
         try:
-            feed_update_task.retry()
-        except MaxRetriesExceededError:
-            feed.updated = False
-            feed.save()
-            send_failure_notification(feed)
+            if isinstance(feed_xml, Exception):
+                raise feed_xml
+            update_channel_document(channel, feeds_by_channel[channel.pk], feed_xml)
+        except (FetchError, ValidationError) as error:
+            record_channel_failure(channel, error)
 
 
 @shared_task
 def update_feeds_task():
-    feeds_pks = Feed.objects.filter(updated=True).values_list('id', flat=True)
-    tasks = [feed_update_task.s(feed_pk) for feed_pk in feeds_pks]
+    now = timezone.now()
+    # feeds followed by many users share one channel so fetch each channel only once
+    due_channels = list(
+        Channel.objects.filter(
+            Q(feeds__updated=True) | Q(state=Channel.BROKEN, feeds__status=Feed.ACTIVE),
+            next_fetch_at__lte=now
+            ).order_by('id').values_list('id', 'next_fetch_at').distinct()
+    )
+    channels_pks = [pk for pk, next_fetch_at in due_channels]
+    for pk, next_fetch_at in due_channels:
+        REFRESH_LAG.observe((now - next_fetch_at).total_seconds())
+    # keep dispatched channels out of the next ticks until their update reschedules them
+    Channel.objects.filter(pk__in=channels_pks).update(
+        next_fetch_at=now + timedelta(seconds=settings.FEED_FETCH_LEASE)
+    )
+    batch_size = settings.FEED_FETCH_BATCH_SIZE
+    tasks = [
+        channels_batch_update_task.s(channels_pks[i:i + batch_size])
+        for i in range(0, len(channels_pks), batch_size)
+    ]
     group(tasks).apply_async()
+
+
+@shared_task
+def reconcile_feeds_counts_task():
+    # feeds are checked in primary key ranges so no statement scans all the items
+    batch_size = settings.FEED_COUNTS_BATCH_SIZE
+    last_pk = Feed.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    return sum(
+        reconcile_feeds_counts(Feed.objects.filter(pk__gt=start, pk__lte=start + batch_size))
+        for start in range(0, last_pk, batch_size)
+    )
+
+
+@shared_task
+def prune_items_task():
+    now = timezone.now()
+    # old items of partitioned tables go with their partitions, except the ones kept in the default partition
+    partitions_start = get_partitions_start()
+    items = sum(
+        prune_feed_items(feed, now, partitions_start=partitions_start)
+        for feed in Feed.objects.only('pk', 'owner_id').order_by('pk')
+    )
+    entries = sum(prune_orphan_entries(channel, now) for channel in Channel.objects.only('pk').order_by('pk'))
+    return items, entries
+
+
+@shared_task
+def rotate_item_partitions_task():
+    if not is_partitioned():
+        return [], []
+    now = timezone.now()
+    return create_next_partitions(now), drop_old_partitions(now)
+
+
+@shared_task
+def websub_subscribe_task(channel_pk):
+    channel = Channel.objects.get(pk=channel_pk)
+    if not needs_subscription(channel):
+        return False
+    try:
+        request_subscription(channel)
+    except FetchError:
+        # the channel keeps being polled and the renewal task asks again
+        return False
+    return True
+
+
+@shared_task
+def websub_content_task(channel_pk, headers, content):
+    # content is base64 encoded by the callback since task arguments are serialized as JSON
+    channel = Channel.objects.filter(pk=channel_pk).first()
+    if channel is None:
+        return False
+    feed_xml = parse_pushed_document(channel, headers, b64decode(content))
+    try:
+        update_channel_document(channel, list(channel.feeds.filter(updated=True)), feed_xml)
+    except ValidationError:
+        # an invalid push leaves the channel to its next poll
+        return False
+    return True
+
+
+@shared_task
+def renew_websub_subscriptions_task():
+    if not settings.WEBSUB_CALLBACK_URL:
+        return 0
+    renew_at = timezone.now() + timedelta(seconds=settings.WEBSUB_RENEW_BEFORE)
+    # hubs found by polls and leases ending soon, channels nobody follows are let expire
+    channels_pks = list(
+        Channel.objects.filter(
+            Q(websub_expires_at__isnull=True) | Q(websub_expires_at__lte=renew_at),
+            hub__isnull=False,
+            feeds__updated=True
+        ).order_by('pk').values_list('pk', flat=True).distinct()
+    )
+    group([websub_subscribe_task.s(pk) for pk in channels_pks]).apply_async()
+    return len(channels_pks)
@@ -0,0 +1,30 @@
+from django.core.cache import cache
+from django.test import TestCase as DjangoTestCase, override_settings
+from rest_framework.test import APITestCase as DRFAPITestCase
+
+# a process local cache, tests never share listings or user versions through Redis
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class TestCase(DjangoTestCase):
+    """
+    Every test starts with an empty cache. Invalidations run on commit, which never
+    happens inside a test, and user pks are reused after the rollback, so pages
+    cached by an earlier test would be served to a later one.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class APITestCase(DRFAPITestCase):
+    """
+    API test starting with an empty cache, see TestCase.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
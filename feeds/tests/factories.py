@@ -2,7 +2,8 @@ from django.contrib.auth import get_user_model
 from django.utils.timezone import now
 import factory
 
-from feeds.models import Feed, Item
+from feeds.models import Channel, Feed, Entry, Item
+from feeds.utils import normalize_feed_url
 
 
 class UserFactory(factory.django.DjangoModelFactory):
@@ -17,12 +18,28 @@ class UserFactory(factory.django.DjangoModelFactory):
         model = get_user_model()
 
 
+class ChannelFactory(factory.django.DjangoModelFactory):
+    xml_link = factory.Sequence(lambda n: 'https://example.com/channel/%d/rss' % n)
+    title = factory.Faker("sentence", nb_words=3)
+    link = factory.Faker("url")
+    description = factory.Faker("sentence", nb_words=7)
+    modified_at = factory.LazyFunction(now)
+
+    class Meta:
+        model = Channel
+        django_get_or_create = ('xml_link',)
+
+
 class FeedFactory(factory.django.DjangoModelFactory):
     title = factory.Faker("sentence", nb_words=3)
     link = factory.Faker("url")
     description = factory.Faker("sentence", nb_words=7)
-    xml_link = factory.Faker('url')
+    xml_link = factory.Sequence(lambda n: 'https://example.com/feed/%d/rss' % n)
     owner = factory.SubFactory(UserFactory)
+    channel = factory.SubFactory(
+        ChannelFactory,
+        xml_link=factory.LazyAttribute(lambda channel: normalize_feed_url(channel.factory_parent.xml_link))
+    )
     modified_at = factory.LazyFunction(now)
     updated = factory.Faker('pybool')
 
@@ -30,15 +47,25 @@ class FeedFactory(factory.django.DjangoModelFactory):
         model = Feed
 
 
-class ItemFactory(factory.django.DjangoModelFactory):
+class EntryFactory(factory.django.DjangoModelFactory):
     title = factory.Faker("sentence", nb_words=3)
     link = factory.Faker("url")
     description = factory.Faker("sentence", nb_words=7)
     published_at = factory.LazyFunction(now)
+    channel = factory.SubFactory(ChannelFactory)
+    last_updated_at = factory.LazyFunction(now)
+    last_seen_at = factory.SelfAttribute('last_updated_at')
+    guid = factory.Sequence(lambda n: 'https://example.com/item/%d' % n)
+
+    class Meta:
+        model = Entry
+
+
+class ItemFactory(factory.django.DjangoModelFactory):
     read = factory.Faker('pybool')
     feed = factory.SubFactory(FeedFactory)
-    last_updated_at = factory.LazyFunction(now)
-    guid = factory.Faker("sentence", nb_words=1)
+    entry = factory.SubFactory(EntryFactory, channel=factory.SelfAttribute('..feed.channel'))
+    last_updated_at = factory.SelfAttribute('entry.last_updated_at')
 
     class Meta:
         model = Item
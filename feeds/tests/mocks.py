@@ -1,5 +1,7 @@
 import pickle
 
+import feedparser
+
 valid_feed = pickle.load(open("feeds/tests/pickles/valid_feed.pickle", "rb"))
 invalid_feed = pickle.load(open("feeds/tests/pickles/invalid_feed.pickle", "rb"))
 feed_without_items = pickle.load(open("feeds/tests/pickles/feed_without_items.pickle", "rb"))
@@ -7,3 +9,24 @@ feed_without_title = pickle.load(open("feeds/tests/pickles/feed_without_title.pi
 item_without_title_and_description = \
     pickle.load(open("feeds/tests/pickles/item_without_title_and_description.pickle", "rb"))
 item_without_title = pickle.load(open("feeds/tests/pickles/item_without_title.pickle", "rb"))
+not_modified_feed = feedparser.FeedParserDict(status=304, bozo=0, entries=[], feed=feedparser.FeedParserDict())
+rss_document = b'''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0">
+<channel>
+<title>Example feed</title>
+<link>https://example.com/</link>
+<description>Example feed description</description>
+<item><title>First item</title><link>https://example.com/1</link><guid>https://example.com/1</guid>
+<description>First item description</description><pubDate>Sat, 10 Jul 2021 13:11:00 GMT</pubDate></item>
+<item><title>Second item</title><link>https://example.com/2</link><guid>https://example.com/2</guid>
+<description>Second item description</description><pubDate>Sat, 10 Jul 2021 12:08:02 GMT</pubDate></item>
+</channel>
+</rss>
+'''
+rss_hub_document = rss_document.replace(
+    b'<rss version="2.0">', b'<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom">'
+).replace(
+    b'<title>Example feed</title>',
+    b'<title>Example feed</title><atom:link rel="hub" href="https://hub.example.com/"/>'
+    b'<atom:link rel="self" href="https://example.com/rss"/>'
+)
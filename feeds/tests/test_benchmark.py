@@ -0,0 +1,39 @@
+import feedparser
+
+from .cases import TestCase
+from benchmarks.harness import build_document, percentile, run_refresh_benchmark
+from feeds.models import Channel, Item
+
+
+class TestRefreshBenchmark(TestCase):
+
+    def test_build_document(self):
+        for document_format in ['rss', 'atom']:
+            first = feedparser.parse(build_document(1, 0, entries=10, entry_size=50, document_format=document_format))
+            second = feedparser.parse(build_document(1, 1, entries=10, entry_size=50, document_format=document_format))
+            self.assertEqual(first.bozo, 0)
+            self.assertEqual(len(first.entries), 10)
+            self.assertEqual(len(first.entries[0].description), 50)
+            # every version publishes new entries on top of the previous ones
+            self.assertEqual(second.entries[5].id, first.entries[0].id)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 99), 3)
+        self.assertIsNone(percentile([], 50))
+
+    def test_refresh_feeds(self):
+        for mode in ['update_feed', 'update_feeds_task']:
+            reports = run_refresh_benchmark(feeds_count=3, entries=10, rounds=2, mode=mode, new_entries=2)
+            self.assertEqual([report['round'] for report in reports], [1, 2])
+            for report in reports:
+                self.assertEqual(report['failed'], 0)
+                self.assertGreater(report['feeds_per_second'], 0)
+                self.assertGreater(report['queries_per_feed'], 0)
+                self.assertGreater(report['peak_memory'], 0)
+                self.assertLessEqual(report['p50'], report['p99'])
+        # both modes read 12 entries of 3 feeds
+        self.assertEqual(Item.objects.count(), 2 * 3 * 12)
+        self.assertFalse(Channel.objects.exclude(state=Channel.HEALTHY).exists())
@@ -0,0 +1,182 @@
+import asyncio
+import gzip
+import time
+from unittest import mock
+
+import httpx
+from django.conf import settings
+from django.test import override_settings
+
+from .cases import TestCase
+from .factories import ChannelFactory
+from feeds.fetcher import fetch_channels, fetch_document, get_content_hash, FetchError
+from feeds.tests import mocks
+
+
+@override_settings(FEED_HOST_LIMITS=False)
+class TestFetchChannels(TestCase):
+
+    def fetch(self, channels, handler):
+        return dict(fetch_channels(channels, transport=httpx.MockTransport(handler)))
+
+    def test_fetch_and_parse_documents(self):
+        channels = ChannelFactory.create_batch(3)
+
+        def handler(request):
+            return httpx.Response(200, content=mocks.rss_document, headers={'ETag': '"v1"'})
+
+        documents = self.fetch(channels, handler)
+        self.assertEqual(len(documents), 3)
+        for channel in channels:
+            feed_xml = documents[channel]
+            self.assertEqual(feed_xml.status, 200)
+            self.assertEqual(feed_xml.etag, '"v1"')
+            self.assertEqual(feed_xml.feed.title, 'Example feed')
+            self.assertEqual(len(feed_xml.entries), 2)
+
+    def test_send_conditional_request(self):
+        channel = ChannelFactory(etag='"v1"', last_modified='Sun, 11 Jul 2021 16:09:08 GMT')
+
+        def handler(request):
+            self.assertEqual(request.headers['If-None-Match'], '"v1"')
+            self.assertEqual(request.headers['If-Modified-Since'], 'Sun, 11 Jul 2021 16:09:08 GMT')
+            return httpx.Response(304)
+
+        feed_xml = self.fetch([channel], handler)[channel]
+        self.assertEqual(feed_xml.status, 304)
+        self.assertEqual(feed_xml.entries, [])
+
+    def test_skip_unchanged_documents(self):
+        unchanged = ChannelFactory(content_hash=get_content_hash(mocks.rss_document))
+        changed = ChannelFactory(content_hash=get_content_hash(b'<rss></rss>'))
+
+        def handler(request):
+            return httpx.Response(200, content=mocks.rss_document, headers={'ETag': '"v2"'})
+
+        documents = self.fetch([unchanged, changed], handler)
+        self.assertTrue(documents[unchanged].unchanged)
+        self.assertEqual(documents[unchanged].etag, '"v2"')
+        self.assertEqual(documents[unchanged].entries, [])
+        self.assertFalse(documents[changed].get('unchanged'))
+        self.assertEqual(documents[changed].content_hash, unchanged.content_hash)
+        self.assertEqual(len(documents[changed].entries), 2)
+
+    @override_settings(FEED_FETCH_MAX_BYTES=100)
+    def test_reject_large_documents(self):
+        channel = ChannelFactory()
+
+        def handler(request):
+            return httpx.Response(200, content=mocks.rss_document)
+
+        self.assertIsInstance(self.fetch([channel], handler)[channel], FetchError)
+
+    def test_report_failed_requests(self):
+        failed, broken, valid = ChannelFactory.create_batch(3)
+
+        def handler(request):
+            if request.url == failed.xml_link:
+                return httpx.Response(500)
+            if request.url == broken.xml_link:
+                raise httpx.ConnectTimeout('timeout', request=request)
+            return httpx.Response(200, content=mocks.rss_document)
+
+        documents = self.fetch([failed, broken, valid], handler)
+        self.assertIsInstance(documents[failed], FetchError)
+        self.assertIsInstance(documents[broken], FetchError)
+        self.assertEqual(documents[valid].status, 200)
+
+    @override_settings(FEED_FETCH_DEADLINE=0.2)
+    def test_stop_slow_downloads(self):
+        channel = ChannelFactory()
+
+        async def drip():
+            for chunk in range(10):
+                await asyncio.sleep(0.05)
+                yield b' '
+
+        def handler(request):
+            return httpx.Response(200, content=drip())
+
+        started_at = time.monotonic()
+        self.assertIsInstance(self.fetch([channel], handler)[channel], FetchError)
+        self.assertLess(time.monotonic() - started_at, 0.4)
+
+    @mock.patch('feeds.fetcher.penalize_host')
+    def test_penalize_throttling_hosts(self, penalize_mock):
+        channel = ChannelFactory(xml_link='https://example.com/rss')
+
+        def handler(request):
+            return httpx.Response(429, headers={'Retry-After': '120'})
+
+        self.assertIsInstance(self.fetch([channel], handler)[channel], FetchError)
+        penalize_mock.assert_called_once_with('example.com', 120)
+
+
+@override_settings(FEED_HOST_LIMITS=False)
+class TestFetchDocument(TestCase):
+
+    def fetch(self, handler, **kwargs):
+        with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+            return fetch_document('https://example.com/rss', client=client, **kwargs)
+
+    def test_fetch_and_parse_document(self):
+        def handler(request):
+            self.assertEqual(request.headers['If-None-Match'], '"v1"')
+            return httpx.Response(200, content=mocks.rss_document, headers={'ETag': '"v2"'})
+
+        feed_xml = self.fetch(handler, etag='"v1"')
+        self.assertEqual(feed_xml.status, 200)
+        self.assertEqual(feed_xml.etag, '"v2"')
+        self.assertEqual(feed_xml.feed.title, 'Example feed')
+        self.assertEqual(len(feed_xml.entries), 2)
+
+    def test_decompress_document(self):
+        def handler(request):
+            self.assertIn('gzip', request.headers['Accept-Encoding'])
+            return httpx.Response(200, content=gzip.compress(mocks.rss_document), headers={'Content-Encoding': 'gzip'})
+
+        feed_xml = self.fetch(handler)
+        self.assertEqual(feed_xml.feed.title, 'Example feed')
+        self.assertEqual(len(feed_xml.entries), 2)
+
+    @override_settings(FEED_FETCH_MAX_BYTES=1000)
+    def test_limit_decompressed_size(self):
+        def handler(request):
+            content = gzip.compress(mocks.rss_document.replace(b'</channel>', b' ' * 10000 + b'</channel>'))
+            return httpx.Response(200, content=content, headers={'Content-Encoding': 'gzip'})
+
+        feed_xml = self.fetch(handler)
+        self.assertEqual(feed_xml.bozo, 1)
+        self.assertIsInstance(feed_xml.bozo_exception, FetchError)
+
+    def test_report_failed_request_as_invalid_document(self):
+        def handler(request):
+            raise httpx.ConnectTimeout('timeout', request=request)
+
+        feed_xml = self.fetch(handler)
+        self.assertEqual(feed_xml.bozo, 1)
+        self.assertIsInstance(feed_xml.bozo_exception, FetchError)
+        self.assertEqual(feed_xml.entries, [])
+
+    @override_settings(FEED_FETCH_DEADLINE=0.2)
+    def test_stop_slow_download(self):
+        def drip():
+            for chunk in range(10):
+                time.sleep(0.05)
+                yield b' '
+
+        def handler(request):
+            return httpx.Response(200, content=drip())
+
+        feed_xml = self.fetch(handler)
+        self.assertEqual(feed_xml.bozo, 1)
+        self.assertIn('took longer', str(feed_xml.bozo_exception))
+
+    @mock.patch('feeds.fetcher.penalize_host')
+    def test_penalize_throttling_hosts(self, penalize_mock):
+        def handler(request):
+            return httpx.Response(503)
+
+        feed_xml = self.fetch(handler)
+        self.assertEqual(feed_xml.bozo, 1)
+        penalize_mock.assert_called_once_with('example.com', settings.FEED_HOST_PENALTY)
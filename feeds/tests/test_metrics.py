@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+from django.test import override_settings
+from prometheus_client import REGISTRY
+
+from .cases import TestCase
+from .factories import ChannelFactory, FeedFactory, UserFactory
+from feeds.fetcher import fetch_document
+from feeds.metrics import observe_queue_lag
+from feeds.tests import mocks
+from feeds import utils
+
+
+def get_sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestMetrics(TestCase):
+
+    @override_settings(FEED_HOST_LIMITS=False)
+    def test_measure_fetch_and_parse(self):
+        def handler(request):
+            if request.headers.get('If-None-Match'):
+                return httpx.Response(304)
+            return httpx.Response(200, content=mocks.rss_document, headers={'ETag': '"v1"'})
+
+        fetches = get_sample('feeds_fetches_total', outcome='ok')
+        not_modified = get_sample('feeds_fetches_total', outcome='not_modified')
+        downloaded = get_sample('feeds_downloaded_bytes_total')
+        parsed = get_sample('feeds_stage_seconds_count', stage='parse')
+        with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+            fetch_document('https://example.com/rss', client=client)
+            fetch_document('https://example.com/rss', etag='"v1"', client=client)
+        self.assertEqual(get_sample('feeds_fetches_total', outcome='ok'), fetches + 1)
+        self.assertEqual(get_sample('feeds_fetches_total', outcome='not_modified'), not_modified + 1)
+        self.assertEqual(get_sample('feeds_downloaded_bytes_total'), downloaded + len(mocks.rss_document))
+        # 304 responses are not parsed
+        self.assertEqual(get_sample('feeds_stage_seconds_count', stage='parse'), parsed + 1)
+
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.valid_feed)
+    def test_measure_validate_and_upsert(self, feed_mock):
+        channel = ChannelFactory(xml_link='https://example.com/rss')
+        feeds = FeedFactory.create_batch(2, updated=True, channel=channel)
+        inserted = get_sample('feeds_entries_total', action='inserted')
+        items = get_sample('feeds_items_created_total')
+        upserts = get_sample('feeds_stage_seconds_count', stage='upsert')
+        validations = get_sample('feeds_stage_seconds_count', stage='validate')
+        utils.update_channel(channel, feeds)
+        self.assertEqual(get_sample('feeds_entries_total', action='inserted'), inserted + 40)
+        self.assertEqual(get_sample('feeds_items_created_total'), items + 80)
+        self.assertEqual(get_sample('feeds_stage_seconds_count', stage='upsert'), upserts + 1)
+        self.assertEqual(get_sample('feeds_stage_seconds_count', stage='validate'), validations + 1)
+
+    def test_count_channel_failures(self):
+        channel = ChannelFactory()
+        failures = get_sample('feeds_channel_failures_total', state='failing')
+        utils.record_channel_failure(channel, Exception('timeout'))
+        self.assertEqual(get_sample('feeds_channel_failures_total', state='failing'), failures + 1)
+
+    @mock.patch('feeds.metrics.time.time', return_value=1005)
+    def test_observe_queue_lag(self, time_mock):
+        lags = get_sample('feeds_task_queue_lag_seconds_sum', queue='bulk')
+        request = SimpleNamespace(published_at=1000, delivery_info={'routing_key': 'bulk'})
+        observe_queue_lag(task=SimpleNamespace(request=request))
+        # eager tasks are not published
+        observe_queue_lag(task=SimpleNamespace(request=SimpleNamespace(delivery_info=None)))
+        self.assertEqual(get_sample('feeds_task_queue_lag_seconds_sum', queue='bulk'), lags + 5)
+
+    def test_metrics_endpoint(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'feeds_stage_seconds_bucket', response.content)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8'])
+    def test_restrict_metrics_endpoint(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+        response = self.client.get('/metrics', REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn(b'feeds_stage_seconds_bucket', response.content)
+        self.client.force_login(UserFactory(is_staff=True))
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.5').status_code, 200)
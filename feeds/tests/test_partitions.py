@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta, timezone
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone as django_timezone
+
+from .cases import TestCase
+from .factories import FeedFactory, ItemFactory
+from feeds.models import Feed, Item
+from feeds.partitions import (
+    DEFAULT_PARTITION, add_months, create_next_partitions, drop_old_partitions, get_month_start, get_partition_name,
+    get_partition_start, get_partitions_start, is_partitioned, partition_item_table
+)
+from feeds.tasks import rotate_item_partitions_task
+
+
+class TestPartitions(TestCase):
+
+    def test_month_bounds(self):
+        start = get_month_start(datetime(2026, 12, 18, 23, 10, tzinfo=timezone.utc))
+        self.assertEqual(start, datetime(2026, 12, 1, tzinfo=timezone.utc))
+        self.assertEqual(add_months(start, 1), datetime(2027, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(add_months(start, 14), datetime(2028, 2, 1, tzinfo=timezone.utc))
+
+    def test_partition_names(self):
+        start = datetime(2026, 3, 1, tzinfo=timezone.utc)
+        self.assertEqual(get_partition_name(start), 'feeds_item_p202603')
+        self.assertEqual(get_partition_start('feeds_item_p202603'), start)
+        self.assertIsNone(get_partition_start('feeds_item_default'))
+
+    def test_rotate_plain_table(self):
+        # only PostgreSQL tables are partitioned
+        self.assertFalse(is_partitioned())
+        self.assertEqual(rotate_item_partitions_task.apply().get(), ([], []))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'items are only partitioned on PostgreSQL')
+@override_settings(ITEM_PARTITIONS_AHEAD=1, ITEM_RETENTION_DAYS=30, ITEM_RETENTION_KEEP_UNREAD=True)
+class TestItemTablePartitions(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.now = django_timezone.now()
+        self.feed = FeedFactory()
+        old = self.now - timedelta(days=100)
+        self.old_read = ItemFactory(feed=self.feed, read=True, last_updated_at=old)
+        self.old_unread = ItemFactory(feed=self.feed, read=False, last_updated_at=old)
+        self.recent = ItemFactory(feed=self.feed, read=False)
+        Feed.objects.filter(pk=self.feed.pk).update(unread_count=2, total_count=3)
+        if not is_partitioned():
+            # the DDL is rolled back with the transaction of the test
+            with connection.schema_editor() as schema_editor:
+                partition_item_table(schema_editor)
+
+    def get_partition(self, item):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM feeds_item WHERE id = %s', [item.pk])
+            row = cursor.fetchone()
+        return row and row[0]
+
+    def test_keep_rows_in_monthly_partitions(self):
+        self.assertTrue(is_partitioned())
+        old_partition = get_partition_name(get_month_start(self.old_read.last_updated_at))
+        self.assertEqual(self.get_partition(self.old_read), old_partition)
+        self.assertEqual(self.get_partition(self.recent), get_partition_name(get_month_start(self.now)))
+        self.assertEqual(get_partitions_start(), get_month_start(self.old_read.last_updated_at))
+        self.assertEqual(self.feed.items.count(), 3)
+
+    def test_keep_one_item_per_feed_and_entry(self):
+        duplicate = Item(
+            feed=self.feed, entry_id=self.recent.entry_id, last_updated_at=self.now - timedelta(days=40),
+            changed_at=self.now
+        )
+        Item.objects.bulk_create([duplicate], ignore_conflicts=True)
+        self.assertEqual(self.feed.items.filter(entry_id=self.recent.entry_id).count(), 1)
+        # an update moving an item to another partition keeps it
+        Item.objects.filter(pk=self.old_read.pk).update(last_updated_at=self.now)
+        self.assertEqual(self.get_partition(self.old_read), get_partition_name(get_month_start(self.now)))
+        entry = self.old_read.entry
+        self.old_read.delete()
+        ItemFactory(feed=self.feed, entry=entry)
+        self.assertEqual(self.feed.items.count(), 3)
+
+    def test_rotate_partitions(self):
+        month = get_month_start(self.now)
+        self.assertEqual(
+            create_next_partitions(add_months(month, 2)),
+            [get_partition_name(add_months(month, 2)), get_partition_name(add_months(month, 3))]
+        )
+        dropped = drop_old_partitions(self.now)
+        self.assertIn(get_partition_name(get_month_start(self.old_read.last_updated_at)), dropped)
+        self.assertFalse(Item.objects.filter(pk=self.old_read.pk).exists())
+        # unread items outlive their partition
+        self.assertEqual(self.get_partition(self.old_unread), DEFAULT_PARTITION)
+        self.feed.refresh_from_db()
+        self.assertEqual((self.feed.unread_count, self.feed.total_count), (2, 2))
+        # rows of the dropped partition released their keys
+        ItemFactory(feed=self.feed, entry=self.old_read.entry)
+        self.assertEqual(self.feed.items.count(), 3)
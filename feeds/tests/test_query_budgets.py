@@ -0,0 +1,21 @@
+
+from .cases import TestCase
+from benchmarks.harness import create_api_fixtures, run_api_benchmark, API_SCENARIOS, QUERY_BUDGETS
+
+
+class TestQueryBudgets(TestCase):
+
+    def assertWithinBudgets(self, users, feeds, entries):
+        created_feeds = create_api_fixtures(users=users, feeds=feeds, entries=entries, batch_size=100)
+        reports = run_api_benchmark(created_feeds[0], requests=2)
+        self.assertEqual([report['name'] for report in reports], [name for name, _, _ in API_SCENARIOS])
+        for report in reports:
+            self.assertEqual(report['statuses'], [200], report['name'])
+            self.assertLessEqual(report['queries'], QUERY_BUDGETS[report['name']], report['name'])
+
+    def test_small_tree(self):
+        self.assertWithinBudgets(users=1, feeds=2, entries=3)
+
+    def test_larger_tree(self):
+        # queries of a request do not grow with the number of feeds and items
+        self.assertWithinBudgets(users=3, feeds=15, entries=40)
@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+from django.test import override_settings
+from django.utils import timezone
+
+from .cases import TestCase
+from .factories import ChannelFactory, EntryFactory, FeedFactory, ItemFactory
+from feeds.models import Entry, Feed, Item
+from feeds.retention import prune_feed_items, prune_orphan_entries
+from feeds.tasks import prune_items_task
+
+
+@override_settings(ITEM_PRUNE_BATCH_SIZE=2)
+class TestRetention(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+        self.feed = FeedFactory()
+        self.old_read = ItemFactory.create_batch(3, feed=self.feed, read=True, last_updated_at=self.days_ago(40))
+        self.old_unread = ItemFactory(feed=self.feed, read=False, last_updated_at=self.days_ago(40))
+        self.recent = [
+            ItemFactory(feed=self.feed, read=True, last_updated_at=self.days_ago(days)) for days in [3, 2, 1]
+        ]
+        Feed.objects.filter(pk=self.feed.pk).update(unread_count=1, total_count=7)
+
+    def days_ago(self, days):
+        return self.now - timedelta(days=days)
+
+    def remaining(self):
+        return set(self.feed.items.values_list('pk', flat=True))
+
+    @override_settings(ITEM_RETENTION_DAYS=30)
+    def test_prune_old_read_items(self):
+        self.assertEqual(prune_feed_items(self.feed, self.now), 3)
+        self.assertEqual(self.remaining(), {self.old_unread.pk, *[item.pk for item in self.recent]})
+        self.feed.refresh_from_db()
+        self.assertEqual((self.feed.unread_count, self.feed.total_count), (1, 4))
+
+    @override_settings(ITEM_RETENTION_DAYS=30, ITEM_RETENTION_KEEP_UNREAD=False)
+    def test_prune_old_unread_items(self):
+        self.assertEqual(prune_feed_items(self.feed, self.now), 4)
+        self.feed.refresh_from_db()
+        self.assertEqual((self.feed.unread_count, self.feed.total_count), (0, 3))
+
+    @override_settings(ITEM_RETENTION_MAX_PER_FEED=2)
+    def test_keep_newest_items(self):
+        self.assertEqual(prune_feed_items(self.feed, self.now), 4)
+        self.assertEqual(self.remaining(), {self.old_unread.pk, self.recent[1].pk, self.recent[2].pk})
+
+    @override_settings(ITEM_RETENTION_DAYS=30, ITEM_RETENTION_MAX_PER_FEED=5)
+    def test_leave_old_items_to_partitions(self):
+        self.assertEqual(prune_feed_items(self.feed, self.now, partitions_start=self.days_ago(60)), 2)
+        self.assertEqual(self.feed.items.count(), 5)
+
+    @override_settings(ITEM_RETENTION_DAYS=30)
+    def test_prune_old_items_of_default_partition(self):
+        # items older than the oldest partition were kept unread when their partition was dropped
+        self.assertEqual(prune_feed_items(self.feed, self.now, partitions_start=self.days_ago(35)), 3)
+        self.assertEqual(self.remaining(), {self.old_unread.pk, *[item.pk for item in self.recent]})
+
+    def test_keep_items_without_policy(self):
+        self.assertEqual(prune_feed_items(self.feed, self.now), 0)
+        self.assertEqual(self.feed.items.count(), 7)
+
+    @override_settings(ENTRY_ORPHAN_RETENTION_DAYS=30)
+    def test_prune_old_orphan_entries(self):
+        channel = ChannelFactory()
+        old_orphan = EntryFactory(channel=channel, last_seen_at=self.days_ago(40))
+        recent_orphan = EntryFactory(channel=channel, last_seen_at=self.days_ago(10))
+        followed = EntryFactory(channel=channel, last_seen_at=self.days_ago(40))
+        ItemFactory(feed=FeedFactory(channel=channel), entry=followed)
+        # not changed for long but listed by the documents of the channel
+        listed = EntryFactory(channel=channel, last_updated_at=self.days_ago(90), last_seen_at=self.days_ago(1))
+        self.assertEqual(prune_orphan_entries(channel, self.now), 1)
+        self.assertFalse(Entry.objects.filter(pk=old_orphan.pk).exists())
+        self.assertEqual(Entry.objects.filter(pk__in=[recent_orphan.pk, followed.pk, listed.pk]).count(), 3)
+
+    @override_settings(ENTRY_ORPHAN_RETENTION_DAYS=30)
+    def test_keep_entries_of_last_document(self):
+        # the channel answered 304 Not Modified since its last document
+        channel = ChannelFactory()
+        listed = EntryFactory.create_batch(2, channel=channel, last_seen_at=self.days_ago(50))
+        EntryFactory(channel=channel, last_seen_at=self.days_ago(60))
+        self.assertEqual(prune_orphan_entries(channel, self.now), 1)
+        self.assertEqual(Entry.objects.filter(pk__in=[entry.pk for entry in listed]).count(), 2)
+
+    @override_settings(ITEM_RETENTION_DAYS=30, ENTRY_ORPHAN_RETENTION_DAYS=0)
+    def test_prune_items_task(self):
+        self.assertEqual(prune_items_task.apply().get(), (3, 3))
+        self.assertEqual(Item.objects.count(), 4)
+        self.assertEqual(Entry.objects.count(), 4)
@@ -0,0 +1,78 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import override_settings
+from django.utils import timezone
+from feedparser import FeedParserDict
+
+from .cases import TestCase
+from .factories import ChannelFactory
+from feeds import scheduler
+
+
+def build_feed(minutes_between_entries, last_entry_minutes_ago=0, ttl=None, headers=None):
+    now = time.time() - last_entry_minutes_ago * 60
+    entries = [
+        FeedParserDict(published_parsed=time.gmtime(now - i * minutes_between_entries * 60))
+        for i in range(5)
+    ]
+    return FeedParserDict(
+        status=200,
+        entries=entries,
+        feed=FeedParserDict(ttl=ttl) if ttl else FeedParserDict(),
+        headers=headers or {}
+    )
+
+
+@override_settings(FEED_MIN_FETCH_INTERVAL=300, FEED_MAX_FETCH_INTERVAL=86400)
+class TestScheduler(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.channel = ChannelFactory(fetch_interval=3600)
+
+    def test_fetch_busy_feeds_often(self):
+        self.assertEqual(scheduler.get_fetch_interval(self.channel, build_feed(20)), 600)
+        # bounded by the min interval
+        self.assertEqual(scheduler.get_fetch_interval(self.channel, build_feed(1)), 300)
+
+    def test_fetch_dead_feeds_rarely(self):
+        feed = build_feed(20, last_entry_minutes_ago=365 * 24 * 60)
+        self.assertEqual(scheduler.get_fetch_interval(self.channel, feed), 86400)
+
+    def test_keep_interval_without_dates(self):
+        feed = FeedParserDict(status=200, entries=[FeedParserDict()], feed=FeedParserDict(), headers={})
+        self.assertEqual(scheduler.get_fetch_interval(self.channel, feed), 3600)
+
+    def test_honor_feed_hints(self):
+        self.assertEqual(scheduler.get_fetch_interval(self.channel, build_feed(20, ttl='60')), 3600)
+        feed = build_feed(20, headers={'cache-control': 'public, max-age=1800'})
+        self.assertEqual(scheduler.get_fetch_interval(self.channel, feed), 1800)
+
+    def test_skip_hours(self):
+        content = b'<rss><channel><skipHours><hour>1</hour><hour>2</hour><hour>25</hour></skipHours></channel></rss>'
+        self.assertEqual(scheduler.get_skip_hours(content), [1, 2])
+        now = timezone.now().replace(hour=0, minute=30)
+        with mock.patch('feeds.scheduler.timezone.now', return_value=now):
+            next_fetch_at = scheduler.get_next_fetch_at(3600, [1, 2])
+        self.assertEqual(next_fetch_at, now.replace(hour=3, minute=0, second=0, microsecond=0))
+
+    def test_schedule_channel(self):
+        scheduler.schedule_channel(self.channel, build_feed(20))
+        self.assertEqual(self.channel.fetch_interval, 600)
+        self.assertAlmostEqual(
+            self.channel.next_fetch_at, timezone.now() + timedelta(seconds=600), delta=timedelta(seconds=5)
+        )
+        # not modified documents keep the interval
+        scheduler.schedule_channel(self.channel, FeedParserDict(status=304))
+        self.assertEqual(self.channel.fetch_interval, 600)
+
+    @override_settings(
+        FEED_BACKOFF_BASE=60, FEED_BACKOFF_MAX=600, FEED_CIRCUIT_THRESHOLD=10, FEED_PROBE_INTERVAL=86400
+    )
+    def test_backoff_interval(self):
+        for failure_count, interval in [(1, 60), (2, 120), (4, 480), (5, 600), (9, 600), (10, 86400)]:
+            backoff = scheduler.get_backoff_interval(failure_count)
+            self.assertGreaterEqual(backoff, interval / 2)
+            self.assertLessEqual(backoff, interval)
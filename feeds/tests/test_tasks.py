@@ -1,44 +1,238 @@
+from datetime import timedelta
 from unittest import mock
 
-from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.test import override_settings
 from django.conf import settings
 
-from .factories import FeedFactory
-from feeds.tasks import update_feeds_task, feed_update_task
-from feeds.models import Feed
+from .cases import TestCase
+from .factories import ChannelFactory, FeedFactory, ItemFactory
+from feeds.tasks import (
+    update_feeds_task, feed_update_task, feed_refresh_task, feed_subscribe_task, channel_update_task,
+    channels_batch_update_task, reconcile_feeds_counts_task
+)
+from feeds.models import Channel, Feed, Item
+from feeds.tests import mocks
+from rss_scraper import celery_app
+from feeds.fetcher import FetchError
+from feeds.throttling import HostThrottled
 
 
 class TestFeedUpdatingTasks(TestCase):
 
-    @mock.patch('feeds.tasks.feed_update_task.s')
+    @override_settings(FEED_FETCH_BATCH_SIZE=3)
+    @mock.patch('feeds.tasks.channels_batch_update_task.s')
     def test_update_feeds_marked_for_update(self, task_mock):
-        FeedFactory.create_batch(8, updated=True)
+        for i in range(8):
+            FeedFactory.create(updated=True, xml_link='https://example.com/{}/'.format(i))
         FeedFactory.create_batch(2, updated=False)
         self.assertEqual(Feed.objects.count(), 10)
         update_feeds_task.apply()
-        self.assertEqual(task_mock.call_count, 8)
+        # 8 channels in batches of 3
+        self.assertEqual(task_mock.call_count, 3)
+        self.assertEqual(sum(len(call[0][0]) for call in task_mock.call_args_list), 8)
+
+    @mock.patch('feeds.tasks.channels_batch_update_task.s')
+    def test_update_only_due_channels(self, task_mock):
+        due = FeedFactory.create(updated=True, channel__next_fetch_at=timezone.now() - timedelta(minutes=1))
+        FeedFactory.create(updated=True, channel__next_fetch_at=timezone.now() + timedelta(minutes=10))
+        update_feeds_task.apply()
+        task_mock.assert_called_once_with([due.channel_id])
+        # dispatched channels are not due again until their update reschedules them
+        due.channel.refresh_from_db()
+        self.assertGreater(due.channel.next_fetch_at, timezone.now())
+
+    @mock.patch('feeds.tasks.channels_batch_update_task.s')
+    def test_fetch_shared_url_once(self, task_mock):
+        feeds = [
+            FeedFactory.create(updated=True, xml_link='https://example.com/rss'),
+            FeedFactory.create(updated=True, xml_link='HTTPS://Example.com:443/rss#latest'),
+            FeedFactory.create(updated=True, xml_link='https://example.com/rss'),
+        ]
+        other_feed = FeedFactory.create(updated=True, xml_link='https://example.org/rss')
+        update_feeds_task.apply()
+        self.assertEqual(len({feed.channel_id for feed in feeds}), 1)
+        task_mock.assert_called_once_with([feeds[0].channel_id, other_feed.channel_id])
 
     @mock.patch('feeds.tasks.update_feed', return_value=True)
-    @mock.patch('feeds.tasks.feed_update_task.retry')
-    @mock.patch('feeds.tasks.send_failure_notification')
-    def test_update_feed_task(self, email_mock, retry_task_mock, update_feed_mock):
+    @mock.patch('feeds.utils.send_failure_notification')
+    def test_update_feed_task(self, email_mock, update_feed_mock):
         feed = FeedFactory.create(updated=True)
         feed_update_task(feed.pk)
-        self.assertEqual(retry_task_mock.call_count, 0)
         self.assertEqual(email_mock.call_count, 0)
         self.assertEqual(update_feed_mock.call_count, 1)
         feed.refresh_from_db()
         self.assertTrue(feed.updated)
+        self.assertEqual(feed.channel.state, Channel.HEALTHY)
 
-    @override_settings(task_always_eager=True)
     @mock.patch('feeds.tasks.update_feed', return_value=False)
-    @mock.patch('feeds.tasks.send_failure_notification')
-    def test_fallback_and_notify_user(self, email_mock, update_feed_mock):
+    @mock.patch('feeds.utils.send_failure_notification')
+    def test_back_off_failing_feed(self, email_mock, update_feed_mock):
         feed = FeedFactory.create(updated=True)
-        feed_update_task.delay(feed.pk)
-        # assert it called once + number of retries in settings
-        self.assertEqual(update_feed_mock.call_count, settings.CELERY_MAX_RETRIES + 1)
-        # only one email notification sent to user
-        self.assertEqual(email_mock.call_count, 1)
+        feed_update_task(feed.pk)
         feed.refresh_from_db()
+        channel = feed.channel
+        self.assertTrue(feed.updated)
+        self.assertEqual(email_mock.call_count, 0)
+        self.assertEqual(channel.state, Channel.FAILING)
+        self.assertEqual(channel.failure_count, 1)
+        self.assertIsNotNone(channel.last_error)
+        self.assertGreater(channel.next_fetch_at, timezone.now())
+
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.invalid_feed)
+    @mock.patch('feeds.utils.send_failure_notification')
+    def test_back_off_failing_refreshed_feed(self, email_mock, feed_mock):
+        feed = FeedFactory.create(updated=True)
+        self.assertEqual(feed_refresh_task(feed.pk), {'errors': ['Invalid feed']})
+        feed.channel.refresh_from_db()
+        self.assertEqual(feed.channel.state, Channel.FAILING)
+        self.assertEqual(feed.channel.failure_count, 1)
+        self.assertEqual(feed.channel.last_error, 'Invalid feed')
+
+    @override_settings(FEED_CIRCUIT_THRESHOLD=3)
+    @mock.patch('feeds.tasks.update_channel', return_value=True)
+    @mock.patch('feeds.utils.send_failure_notification')
+    def test_update_channel_task(self, email_mock, update_channel_mock):
+        channel = ChannelFactory(state=Channel.FAILING, failure_count=2)
+        feeds = FeedFactory.create_batch(3, updated=True, channel=channel)
+        FeedFactory.create(updated=False, channel=channel)
+        channel_update_task(channel.pk)
+        self.assertEqual(update_channel_mock.call_count, 1)
+        self.assertEqual(update_channel_mock.call_args[0][1], feeds)
+        self.assertEqual(email_mock.call_count, 0)
+
+    @override_settings(FEED_CIRCUIT_THRESHOLD=3)
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.invalid_feed)
+    @mock.patch('feeds.utils.send_failure_notification')
+    def test_open_circuit_and_notify_all_channel_followers(self, email_mock, feed_mock):
+        channel = ChannelFactory()
+        FeedFactory.create_batch(3, updated=True, channel=channel)
+        for i in range(4):
+            channel_update_task(channel.pk)
+        channel.refresh_from_db()
+        self.assertEqual(feed_mock.call_count, 4)
+        self.assertEqual(channel.state, Channel.BROKEN)
+        self.assertEqual(channel.failure_count, 4)
+        self.assertEqual(channel.last_error, 'Invalid feed')
+        # every follower is notified once when the circuit opens
+        self.assertEqual(email_mock.call_count, 3)
+        self.assertFalse(Feed.objects.filter(updated=True).exists())
+        # broken channels are probed on the slow schedule
+        probe_at = timezone.now() + timedelta(seconds=settings.FEED_PROBE_INTERVAL / 2 - 1)
+        self.assertGreater(channel.next_fetch_at, probe_at)
+
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.valid_feed)
+    def test_enable_followers_when_probe_succeeds(self, feed_mock):
+        channel = ChannelFactory(state=Channel.BROKEN, failure_count=12, last_error='Invalid feed')
+        feeds = FeedFactory.create_batch(2, updated=False, channel=channel)
+        channel_update_task(channel.pk)
+        channel.refresh_from_db()
+        self.assertEqual(channel.state, Channel.HEALTHY)
+        self.assertEqual(channel.failure_count, 0)
+        self.assertIsNone(channel.last_error)
+        for feed in feeds:
+            feed.refresh_from_db()
+            self.assertTrue(feed.updated)
+            self.assertEqual(feed.items.count(), 40)
+
+    @mock.patch('feeds.tasks.channels_batch_update_task.s')
+    def test_probe_due_broken_channels(self, task_mock):
+        broken = FeedFactory.create(
+            updated=False,
+            channel__state=Channel.BROKEN,
+            channel__next_fetch_at=timezone.now() - timedelta(minutes=1)
+        )
+        FeedFactory.create(updated=False, channel__next_fetch_at=timezone.now() - timedelta(minutes=1))
+        FeedFactory.create(
+            updated=False,
+            channel__state=Channel.BROKEN,
+            channel__next_fetch_at=timezone.now() + timedelta(hours=1)
+        )
+        update_feeds_task.apply()
+        task_mock.assert_called_once_with([broken.channel_id])
+
+    @mock.patch('feeds.tasks.fetch_channels')
+    def test_update_channels_batch(self, fetch_mock):
+        channels = ChannelFactory.create_batch(4)
+        for channel in channels:
+            FeedFactory.create(updated=True, channel=channel)
+        fetch_mock.return_value = [
+            (channels[0], mocks.valid_feed),
+            (channels[1], mocks.invalid_feed),
+            (channels[2], FetchError('https://example.com responded with 500')),
+            (channels[3], HostThrottled()),
+        ]
+        channels_batch_update_task([channel.pk for channel in channels])
+        for channel in channels:
+            channel.refresh_from_db()
+        self.assertEqual(channels[0].feeds.get().items.count(), 40)
+        self.assertEqual(channels[0].state, Channel.HEALTHY)
+        # failed channels back off instead of being retried right away
+        self.assertEqual(channels[1].state, Channel.FAILING)
+        self.assertEqual(channels[2].state, Channel.FAILING)
+        self.assertEqual(channels[2].last_error, 'https://example.com responded with 500')
+        # throttled channels are fetched later without counting a failure
+        self.assertEqual(channels[3].state, Channel.HEALTHY)
+        self.assertGreater(channels[3].next_fetch_at, timezone.now())
+
+
+class TestFeedSubscribeTask(TestCase):
+
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.valid_feed)
+    def test_subscribe_pending_feed(self, feed_mock):
+        feed = FeedFactory(status=Feed.PENDING, updated=False, title='')
+        follower = FeedFactory(channel=feed.channel, updated=True)
+        feed_subscribe_task(feed.pk)
+        feed.refresh_from_db()
+        self.assertEqual(feed.status, Feed.ACTIVE)
+        self.assertTrue(feed.updated)
+        self.assertEqual(feed.title, mocks.valid_feed.feed.title)
+        self.assertEqual(feed.items.count(), 40)
+        self.assertEqual(follower.items.count(), 40)
+        self.assertIsNotNone(feed.channel.entries.first())
+
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.invalid_feed)
+    def test_subscribe_invalid_feed(self, feed_mock):
+        feed = FeedFactory(status=Feed.PENDING, updated=False)
+        feed_subscribe_task(feed.pk)
+        feed.refresh_from_db()
+        self.assertEqual(feed.status, Feed.FAILED)
+        self.assertEqual(feed.error, 'Invalid feed')
         self.assertFalse(feed.updated)
+        self.assertEqual(Item.objects.count(), 0)
+
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.valid_feed)
+    def test_skip_active_feed(self, feed_mock):
+        feed = FeedFactory(status=Feed.ACTIVE)
+        feed_subscribe_task(feed.pk)
+        self.assertEqual(feed_mock.call_count, 0)
+
+
+class TestReconcileFeedsCountsTask(TestCase):
+
+    @override_settings(FEED_COUNTS_BATCH_SIZE=2)
+    def test_reconcile_feeds_in_batches(self):
+        feeds = FeedFactory.create_batch(5)
+        for feed in feeds[1:]:
+            ItemFactory(feed=feed, read=False)
+        self.assertEqual(reconcile_feeds_counts_task.apply().get(), 4)
+        self.assertEqual(
+            list(Feed.objects.order_by('pk').values_list('unread_count', 'total_count')),
+            [(0, 0), (1, 1), (1, 1), (1, 1), (1, 1)]
+        )
+
+
+class TestTaskRouting(TestCase):
+
+    def test_route_interactive_tasks(self):
+        router = celery_app.amqp.router
+        self.assertEqual(router.route({}, feed_refresh_task.name)['queue'].name, 'interactive')
+        self.assertEqual(router.route({}, feed_subscribe_task.name)['queue'].name, 'interactive')
+        self.assertEqual(router.route({}, channels_batch_update_task.name)['queue'].name, 'bulk')
+        self.assertEqual(router.route({}, update_feeds_task.name)['queue'].name, 'bulk')
+        self.assertEqual(router.route({}, feed_update_task.name)['queue'].name, 'bulk')
+
+    def test_store_only_awaited_results(self):
+        self.assertFalse(feed_refresh_task.ignore_result)
+        for task in [feed_update_task, feed_subscribe_task, channel_update_task, channels_batch_update_task]:
+            self.assertTrue(task.ignore_result)
@@ -0,0 +1,91 @@
+import time
+from unittest import mock
+
+import fakeredis
+import redis
+from django.test import SimpleTestCase, override_settings
+
+from feeds import throttling
+from feeds.throttling import (
+    acquire_host_slot, release_host_slot, penalize_host, host_slot, get_slot_lease, HostThrottled
+)
+
+
+@override_settings(
+    FEED_HOST_RATE=10, FEED_HOST_BURST=2, FEED_HOST_CONCURRENCY=1, FEED_HOST_MAX_WAIT=0,
+    FEED_FETCH_TIMEOUT=5, FEED_FETCH_DEADLINE=10
+)
+class TestHostLimits(SimpleTestCase):
+    """
+    The limiter scripts run on an in-memory Redis server with a Lua interpreter.
+    """
+    host = 'throttling.test'
+
+    def setUp(self):
+        patchers = [
+            mock.patch('feeds.throttling.get_redis', return_value=fakeredis.FakeRedis()),
+            mock.patch('feeds.throttling.redis_retry_at', 0),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_limit_concurrent_requests(self):
+        slot, wait = acquire_host_slot(self.host)
+        self.assertIsNotNone(slot)
+        self.assertEqual(acquire_host_slot(self.host)[0], None)
+        release_host_slot(self.host, slot)
+        self.assertIsNotNone(acquire_host_slot(self.host)[0])
+
+    @override_settings(FEED_HOST_CONCURRENCY=10)
+    def test_limit_request_rate(self):
+        self.assertIsNotNone(acquire_host_slot(self.host)[0])
+        self.assertIsNotNone(acquire_host_slot(self.host)[0])
+        slot, wait = acquire_host_slot(self.host)
+        self.assertIsNone(slot)
+        self.assertGreater(wait, 0)
+        time.sleep(wait)
+        self.assertIsNotNone(acquire_host_slot(self.host)[0])
+
+    def test_free_slots_after_lease(self):
+        self.assertEqual(get_slot_lease(), 15)
+        self.assertIsNotNone(acquire_host_slot(self.host)[0])
+        # the fetch holding the slot died without releasing it
+        with mock.patch('feeds.throttling.time.time', return_value=time.time() + 14):
+            self.assertIsNone(acquire_host_slot(self.host)[0])
+        with mock.patch('feeds.throttling.time.time', return_value=time.time() + 16):
+            self.assertIsNotNone(acquire_host_slot(self.host)[0])
+
+    def test_penalize_host(self):
+        penalize_host(self.host, 60)
+        slot, wait = acquire_host_slot(self.host)
+        self.assertIsNone(slot)
+        self.assertGreater(wait, 59)
+
+    def test_raise_when_host_is_throttled(self):
+        with host_slot('https://{}/rss'.format(self.host)):
+            with self.assertRaises(HostThrottled) as context:
+                with host_slot('https://{}/atom'.format(self.host)):
+                    pass
+            self.assertGreater(context.exception.retry_after, 0)
+        with host_slot('https://{}/rss'.format(self.host)):
+            pass
+
+    @override_settings(FEED_HOST_MAX_WAIT=30)
+    def test_request_does_not_wait(self):
+        with host_slot('https://{}/rss'.format(self.host)):
+            started_at = time.monotonic()
+            with self.assertRaises(HostThrottled):
+                with host_slot('https://{}/atom'.format(self.host), max_wait=0):
+                    pass
+            self.assertLess(time.monotonic() - started_at, 1)
+
+    def test_skip_limits_while_redis_is_down(self):
+        with mock.patch('feeds.throttling.acquire_host_slot', side_effect=redis.ConnectionError) as slot_mock, \
+                self.assertLogs('feeds.throttling', 'WARNING'):
+            for path in ['rss', 'atom']:
+                with host_slot('https://{}/{}'.format(self.host, path)):
+                    pass
+            # the next fetches do not wait for Redis again
+            self.assertEqual(slot_mock.call_count, 1)
+            self.assertGreater(throttling.redis_retry_at, time.monotonic())
@@ -0,0 +1,230 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .cases import TestCase
+from .factories import ChannelFactory, FeedFactory, EntryFactory, ItemFactory
+from feeds.fetcher import parse_document
+from feeds.models import Channel, Entry, Feed, Item
+from feeds.tests import mocks
+from feeds import utils
+
+
+class TestUpdateItemsData(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.channel = ChannelFactory()
+        self.feed = FeedFactory(channel=self.channel, updated=True)
+        self.entries = mocks.valid_feed.get('entries')
+        self.entries_data = utils.get_entries_data(self.entries)
+
+    def test_create_missing_items(self):
+        utils.update_items_data(self.entries_data, self.channel, [self.feed])
+        self.assertEqual(Entry.objects.filter(channel=self.channel).count(), 40)
+        self.assertEqual(Item.objects.filter(feed=self.feed).count(), 40)
+
+    def test_update_only_changed_items(self):
+        utils.update_items_data(self.entries_data, self.channel, [self.feed])
+        changed = Entry.objects.get(guid=self.entries[0].guid)
+        changed.title = 'old title'
+        changed.content_hash = 'old'
+        changed.save()
+        unchanged = Entry.objects.get(guid=self.entries[1].guid)
+
+        utils.update_items_data(self.entries_data, self.channel, [self.feed])
+        changed.refresh_from_db()
+        self.assertEqual(changed.title, self.entries[0].title)
+        self.assertEqual(Entry.objects.get(pk=unchanged.pk).last_updated_at, unchanged.last_updated_at)
+        self.assertEqual(Item.objects.get(entry=changed).last_updated_at, changed.last_updated_at)
+        self.assertEqual(Item.objects.filter(feed=self.feed).count(), 40)
+
+    def test_keep_other_channels_entries(self):
+        EntryFactory(guid=self.entries[0].guid)
+        utils.update_items_data(self.entries_data, self.channel, [self.feed])
+        self.assertEqual(Entry.objects.filter(guid=self.entries[0].guid).count(), 2)
+
+    def test_share_entries_between_feeds(self):
+        other_feed = FeedFactory(channel=self.channel, updated=True)
+        utils.update_items_data(utils.get_entries_data(self.entries[:10]), self.channel, [self.feed, other_feed])
+        new_feed = FeedFactory(channel=self.channel)
+        utils.update_items_data(self.entries_data, self.channel, [self.feed, other_feed], [new_feed])
+        self.assertEqual(Entry.objects.count(), 40)
+        for feed in [self.feed, other_feed, new_feed]:
+            self.assertEqual(feed.items.count(), 40)
+
+    def test_mark_listed_entries_seen(self):
+        utils.update_items_data(self.entries_data, self.channel, [self.feed])
+        listed = Entry.objects.get(guid=self.entries[0].guid)
+        Entry.objects.filter(channel=self.channel).update(last_seen_at=listed.last_seen_at - timedelta(days=60))
+        utils.update_items_data(utils.get_entries_data(self.entries[:10]), self.channel, [self.feed])
+        entry = Entry.objects.get(pk=listed.pk)
+        self.assertGreater(entry.last_seen_at, listed.last_seen_at)
+        self.assertEqual(entry.last_updated_at, listed.last_updated_at)
+        unlisted = Entry.objects.get(guid=self.entries[10].guid)
+        self.assertLess(unlisted.last_seen_at, listed.last_seen_at)
+
+    def test_skip_pruned_items_of_enabled_feed(self):
+        entries_data = dict(list(self.entries_data.items())[:30])
+        utils.create_items(self.feed, entries_data)
+        pruned = self.feed.items.order_by('entry_id')[:5]
+        Item.objects.filter(pk__in=[item.pk for item in pruned]).delete()
+        # the followers got 10 new entries while the feed was disabled
+        other_feed = FeedFactory(channel=self.channel, updated=True)
+        utils.update_items_data(self.entries_data, self.channel, [other_feed])
+        utils.update_items_data(self.entries_data, self.channel, [other_feed], [self.feed])
+        self.assertEqual(self.feed.items.count(), 35)
+        self.assertFalse(self.feed.items.filter(entry__in=[item.entry_id for item in pruned]).exists())
+
+    def test_create_document_items_of_new_feed(self):
+        # the channel kept the entries of its older documents
+        EntryFactory.create_batch(
+            30, channel=self.channel, last_updated_at=timezone.now() - timedelta(days=1)
+        )
+        utils.create_items(self.feed, dict(list(self.entries_data.items())[:2]))
+        self.feed.refresh_from_db()
+        self.assertEqual(self.feed.total_count, 2)
+        self.assertEqual(
+            set(self.feed.items.values_list('entry__guid', flat=True)), {entry.guid for entry in self.entries[:2]}
+        )
+
+    def test_extract_compact_entries_data(self):
+        self.assertEqual(len(self.entries_data), 40)
+        data = self.entries_data[self.entries[0].guid]
+        self.assertEqual(set(data), {'title', 'link', 'description', 'published_at', 'content_hash'})
+        self.assertEqual(data['title'], self.entries[0].title)
+
+    def test_reject_invalid_entries(self):
+        entries = mocks.item_without_title_and_description.get('entries')
+        with self.assertRaises(ValidationError):
+            utils.get_entries_data(entries)
+
+    def test_constant_number_of_queries(self):
+        utils.update_items_data(utils.get_entries_data(self.entries[:10]), self.channel, [self.feed])
+        Entry.objects.filter(guid=self.entries[0].guid).update(title='old title', content_hash='old')
+        feeds = FeedFactory.create_batch(5, channel=self.channel)
+        # select existing + savepoint + insert + update + seen update + items update + select new + items insert
+        # + release + feeds counters + followers of the invalidated listings
+        with self.assertNumQueries(11):
+            utils.update_items_data(self.entries_data, self.channel, feeds)
+
+
+class TestFeedCounters(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.channel = ChannelFactory()
+        self.feed = FeedFactory(channel=self.channel, updated=True)
+        self.entries_data = utils.get_entries_data(mocks.valid_feed.get('entries'))
+
+    def assertCounts(self, feed, unread_count, total_count):
+        feed.refresh_from_db()
+        self.assertEqual((feed.unread_count, feed.total_count), (unread_count, total_count))
+
+    def test_count_created_items(self):
+        entries_data = dict(list(self.entries_data.items())[:30])
+        utils.create_items(self.feed, entries_data)
+        self.assertCounts(self.feed, 30, 30)
+        new_feed = FeedFactory(channel=self.channel, updated=False)
+        utils.update_items_data(self.entries_data, self.channel, [self.feed], [new_feed])
+        self.assertCounts(self.feed, 40, 40)
+        self.assertCounts(new_feed, 40, 40)
+
+    def test_uncount_read_items(self):
+        utils.create_items(self.feed, self.entries_data)
+        other_feed = FeedFactory(updated=True)
+        utils.create_items(other_feed, self.entries_data)
+        items = [*self.feed.items.all()[:3], *other_feed.items.all()[:2]]
+        ids = [item.pk for item in items]
+        self.assertEqual(utils.mark_items_read(Item.objects.filter(pk__in=ids)), 5)
+        # already read items are not counted twice
+        self.assertEqual(utils.mark_items_read(Item.objects.filter(pk__in=ids)), 0)
+        self.assertCounts(self.feed, 37, 40)
+        self.assertCounts(other_feed, 38, 40)
+
+    def test_reconcile_drifted_counters(self):
+        ItemFactory.create_batch(3, feed=self.feed, read=False)
+        ItemFactory.create_batch(2, feed=self.feed, read=True)
+        synced_feed = FeedFactory(unread_count=0, total_count=0)
+        self.assertEqual(utils.reconcile_feeds_counts(Feed.objects.all()), 1)
+        self.assertCounts(self.feed, 3, 5)
+        self.assertCounts(synced_feed, 0, 0)
+
+
+class TestUpdateChannel(TestCase):
+
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.valid_feed)
+    def test_update_all_feeds_with_one_fetch(self, feed_mock):
+        channel = ChannelFactory(xml_link='https://example.com/rss')
+        feeds = FeedFactory.create_batch(3, updated=False, channel=channel)
+        self.assertTrue(utils.update_channel(channel, feeds))
+        self.assertEqual(feed_mock.call_count, 1)
+        self.assertEqual(Entry.objects.count(), 40)
+        for feed in feeds:
+            feed.refresh_from_db()
+            self.assertTrue(feed.updated)
+            self.assertEqual(feed.title, mocks.valid_feed.feed.title)
+            self.assertEqual(feed.items.count(), 40)
+
+    def test_skip_unchanged_document(self):
+        channel = ChannelFactory(xml_link='https://example.com/rss')
+        feed = FeedFactory(channel=channel, updated=True)
+        headers = {'content-type': 'application/rss+xml', 'etag': '"v1"'}
+        feed_xml = parse_document(channel.xml_link, 200, headers, mocks.rss_document)
+        self.assertTrue(utils.update_channel_document(channel, [feed], feed_xml))
+        self.assertEqual(channel.content_hash, feed_xml.content_hash)
+        entries = list(Entry.objects.values_list('pk', 'last_updated_at'))
+
+        headers['etag'] = '"v2"'
+        feed_xml = parse_document(channel.xml_link, 200, headers, mocks.rss_document, channel.content_hash)
+        # only the channel schedule and validators are saved
+        with self.assertNumQueries(1):
+            self.assertTrue(utils.update_channel_document(channel, [feed], feed_xml))
+        channel.refresh_from_db()
+        self.assertEqual(channel.etag, '"v2"')
+        self.assertEqual(list(Entry.objects.values_list('pk', 'last_updated_at')), entries)
+
+    def test_enable_feeds_of_not_modified_channel(self):
+        channel = ChannelFactory(xml_link='https://example.com/rss', state=Channel.BROKEN)
+        feed = FeedFactory(channel=channel, updated=True)
+        feed_xml = parse_document(channel.xml_link, 200, {'content-type': 'application/rss+xml'}, mocks.rss_document)
+        utils.update_channel_document(channel, [feed], feed_xml)
+        # disabled while the channel was broken, then the document did not change
+        disabled_feed = FeedFactory(channel=channel, updated=False)
+        channel.state = Channel.BROKEN
+        self.assertTrue(utils.update_channel_document(channel, [feed], mocks.not_modified_feed))
+        disabled_feed.refresh_from_db()
+        self.assertTrue(disabled_feed.updated)
+        self.assertEqual(disabled_feed.items.count(), feed.items.count())
+        self.assertEqual(disabled_feed.total_count, feed.items.count())
+
+    def test_keep_unchanged_channel_data(self):
+        channel = ChannelFactory(xml_link='https://example.com/rss')
+        feeds = FeedFactory.create_batch(2, channel=channel, updated=True)
+        feed_xml = parse_document(channel.xml_link, 200, {}, mocks.rss_document)
+        utils.update_channel_data(channel, feed_xml, feeds)
+        channel.save()
+        # the same data does not rewrite the feeds
+        with self.assertNumQueries(0):
+            utils.update_channel_data(channel, feed_xml, feeds)
+
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.not_modified_feed)
+    def test_send_channel_validators(self, feed_mock):
+        channel = ChannelFactory(xml_link='https://example.com/rss', etag='"a"', last_modified=None)
+        utils.update_channel(channel, [FeedFactory(channel=channel)])
+        feed_mock.assert_called_once_with(
+            'https://example.com/rss', etag='"a"', modified=None, content_hash=None, max_wait=None
+        )
+
+
+class TestNormalizeFeedUrl(TestCase):
+
+    def test_normalize_feed_url(self):
+        self.assertEqual(
+            utils.normalize_feed_url('HTTPS://Example.COM:443/Feed?a=1#top'),
+            'https://example.com/Feed?a=1'
+        )
+        self.assertEqual(utils.normalize_feed_url('http://example.com'), 'http://example.com/')
+        self.assertEqual(utils.normalize_feed_url('http://example.com:8080/rss'), 'http://example.com:8080/rss')
@@ -1,16 +1,27 @@
 import json
+from urllib.parse import parse_qs, urlsplit
+from datetime import timedelta
 from unittest import mock
 
-from rest_framework.test import APITestCase, APIClient
+from celery.exceptions import TimeoutError
+from django.test import override_settings
+from django.utils.timezone import now
+from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .factories import UserFactory, FeedFactory, ItemFactory
-from feeds.models import Feed, Item
+from .cases import APITestCase
+from .factories import UserFactory, FeedFactory, EntryFactory, ItemFactory
+from feeds.fetcher import parse_document
+from feeds.models import Channel, Entry, Feed, Item
+from feeds.tasks import feed_refresh_task
+from feeds.throttling import HostThrottled
 from feeds.tests import mocks
+from feeds import utils
 
 
 class TestFeedViewSet(APITestCase):
     def setUp(self):
+        super().setUp()
         self.user = UserFactory()
         self.client = APIClient()
         refresh = RefreshToken.for_user(self.user)
@@ -37,7 +48,20 @@ class TestFeedViewSet(APITestCase):
         item = Item.objects.first()
         self.assertEqual(
             'Qualcomm kondigt eigen smartphone aan met Snapdragon 888 en 6,78"-oledscherm',
-            item.title)
+            item.entry.title)
+
+    @override_settings(WEBSUB_CALLBACK_URL='http://testserver/')
+    @mock.patch('feeds.tasks.websub_subscribe_task.delay')
+    def test_subscribe_to_discovered_hub(self, subscribe_mock):
+        feed_xml = parse_document(
+            'https://example.com/rss', 200, {'content-type': 'application/rss+xml'}, mocks.rss_hub_document
+        )
+        with mock.patch('feeds.utils.parse_feed', return_value=feed_xml):
+            response = self.client.post('/feeds/', data=json.dumps(self.data), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        channel = Channel.objects.get()
+        self.assertEqual(channel.hub, 'https://hub.example.com/')
+        subscribe_mock.assert_called_once_with(channel.pk)
 
     @mock.patch('feeds.utils.parse_feed', return_value=mocks.invalid_feed)
     def test_create_feed_with_invalid_xml(self, feed_mock):
@@ -99,7 +123,7 @@ class TestFeedViewSet(APITestCase):
         self.assertEqual(Feed.objects.count(), 1)
         self.assertEqual(Item.objects.count(), 40)
         item = Item.objects.last()
-        self.assertIsNone(item.title)
+        self.assertIsNone(item.entry.title)
 
     @mock.patch('feeds.utils.parse_feed', return_value=mocks.item_without_title_and_description)
     def test_create_feed_without_title_and_description(self, feed_mock):
@@ -137,6 +161,82 @@ class TestFeedViewSet(APITestCase):
         )
         self.assertEqual(response.status_code, 201)
 
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.valid_feed)
+    def test_share_entries_with_other_followers(self, feed_mock):
+        other_user = UserFactory()
+        for user in [other_user, self.user]:
+            self.client.force_authenticate(user)
+            response = self.client.post(
+                '/feeds/',
+                data=json.dumps(self.data),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(Channel.objects.count(), 1)
+        self.assertEqual(Entry.objects.count(), 40)
+        self.assertEqual(Item.objects.count(), 80)
+        self.assertEqual(Item.objects.filter(feed__owner=self.user).count(), 40)
+
+    @override_settings(FEEDS_ASYNC_SUBSCRIPTION=True)
+    @mock.patch('feeds.tasks.feed_subscribe_task.delay')
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.valid_feed)
+    def test_create_feed_async(self, feed_mock, task_mock):
+        response = self.client.post(
+            '/feeds/',
+            data=json.dumps(self.data),
+            content_type='application/json'
+        )
+        json_data = response.json()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(feed_mock.call_count, 0)
+        task_mock.assert_called_once_with(json_data.get('id'))
+        self.assertEqual(json_data.get('status'), Feed.PENDING)
+        self.assertTrue(response['Location'].endswith('/feeds/{}/subscription/'.format(json_data.get('id'))))
+        feed = Feed.objects.get(id=json_data.get('id'))
+        self.assertFalse(feed.updated)
+        self.assertEqual(Item.objects.count(), 0)
+
+        response = self.client.get(response['Location'], content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'id': feed.id, 'status': Feed.PENDING, 'error': None})
+
+    @override_settings(FEEDS_ASYNC_SUBSCRIPTION=True)
+    @mock.patch('feeds.tasks.feed_subscribe_task.delay')
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.valid_feed)
+    def test_create_feed_async_from_cached_channel(self, feed_mock, task_mock):
+        followed_feed = FeedFactory(xml_link=self.data['url'], updated=True)
+        # entries of the last document were all seen by the last update
+        seen_at = now()
+        EntryFactory.create_batch(3, channel=followed_feed.channel, last_seen_at=seen_at)
+        EntryFactory.create_batch(2, channel=followed_feed.channel, last_seen_at=seen_at - timedelta(days=1))
+        response = self.client.post(
+            '/feeds/',
+            data=json.dumps(self.data),
+            content_type='application/json'
+        )
+        json_data = response.json()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(feed_mock.call_count, 0)
+        self.assertEqual(task_mock.call_count, 0)
+        self.assertEqual(json_data.get('status'), Feed.ACTIVE)
+        self.assertEqual(json_data.get('title'), followed_feed.channel.title)
+        self.assertEqual(Item.objects.filter(feed_id=json_data.get('id')).count(), 3)
+
+    def test_feeds_counts(self):
+        FeedFactory(owner=self.user, unread_count=3, total_count=10)
+        FeedFactory(owner=self.user, unread_count=2, total_count=4)
+        FeedFactory(unread_count=7, total_count=7)
+        response = self.client.get('/feeds/counts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'unread_count': 5, 'total_count': 14})
+        response = self.client.get('/feeds/')
+        self.assertEqual(sorted(feed['unread_count'] for feed in response.json()['results']), [2, 3])
+
+    def test_other_user_feed_subscription(self):
+        feed = FeedFactory(status=Feed.PENDING)
+        response = self.client.get('/feeds/{}/subscription/'.format(feed.pk), content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
     def test_create_feed_with_no_params(self):
         response = self.client.post(
             '/feeds/',
@@ -222,6 +322,35 @@ class TestFeedViewSet(APITestCase):
         self.assertEqual(Item.objects.count(), 40)
         feed.refresh_from_db()
         self.assertTrue(feed.updated)
+        self.assertEqual(feed.channel.etag, mocks.valid_feed.etag)
+        self.assertEqual(feed.channel.last_modified, mocks.valid_feed.modified)
+
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.not_modified_feed)
+    def test_not_modified_force_update(self, feed_mock):
+        feed = FeedFactory.create(
+            owner=self.user,
+            updated=False,
+            xml_link=self.data.get('url'),
+            channel__etag='"abc"',
+            channel__last_modified='Sun, 11 Jul 2021 16:09:08 GMT',
+            channel__content_hash='a' * 64
+            )
+        response = self.client.post(
+            '/feeds/{}/force_update/'.format(feed.pk),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        feed_mock.assert_called_once_with(
+            feed.channel.xml_link,
+            etag='"abc"',
+            modified='Sun, 11 Jul 2021 16:09:08 GMT',
+            content_hash='a' * 64,
+            max_wait=0
+        )
+        self.assertEqual(response.json().get('title'), feed.title)
+        self.assertEqual(Item.objects.count(), 0)
+        feed.refresh_from_db()
+        self.assertTrue(feed.updated)
 
     @mock.patch('feeds.utils.parse_feed', return_value=mocks.invalid_feed)
     def test_unsuccessful_force_update(self, feed_mock):
@@ -241,17 +370,83 @@ class TestFeedViewSet(APITestCase):
         feed.refresh_from_db()
         self.assertFalse(feed.updated)
 
+    @mock.patch('feeds.throttling.redis_retry_at', 0)
+    @mock.patch('feeds.throttling.acquire_host_slot', return_value=(None, 12.0))
+    def test_throttled_host(self, slot_mock):
+        # requests answer at once instead of waiting for the host
+        response = self.client.post('/feeds/', self.data, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '12')
+        self.assertFalse(Feed.objects.exists())
+
+        feed = FeedFactory.create(owner=self.user, xml_link=self.data.get('url'))
+        response = self.client.post('/feeds/{}/force_update/'.format(feed.pk), content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(slot_mock.call_count, 2)
+
+    @override_settings(FEEDS_QUEUE_FORCE_UPDATE=True)
+    @mock.patch('feeds.tasks.feed_refresh_task.apply_async', side_effect=lambda args: feed_refresh_task.apply(args))
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.valid_feed)
+    def test_queued_force_update(self, feed_mock, task_mock):
+        feed = FeedFactory.create(owner=self.user, updated=False, xml_link=self.data.get('url'))
+        response = self.client.post('/feeds/{}/force_update/'.format(feed.pk), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        task_mock.assert_called_once_with((feed.pk,))
+        self.assertEqual(response.json().get('title'), mocks.valid_feed.feed.title)
+        self.assertEqual(Item.objects.count(), 40)
+
+    @override_settings(FEEDS_QUEUE_FORCE_UPDATE=True)
+    @mock.patch('feeds.tasks.feed_refresh_task.apply_async', side_effect=lambda args: feed_refresh_task.apply(args))
+    @mock.patch('feeds.utils.parse_feed', return_value=mocks.invalid_feed)
+    def test_unsuccessful_queued_force_update(self, feed_mock, task_mock):
+        feed = FeedFactory.create(owner=self.user, updated=False, xml_link=self.data.get('url'))
+        response = self.client.post('/feeds/{}/force_update/'.format(feed.pk), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual('Invalid feed', response.json().get('errors')[0])
+
+    @override_settings(FEEDS_QUEUE_FORCE_UPDATE=True)
+    @mock.patch('feeds.tasks.feed_refresh_task.apply_async')
+    def test_failed_queued_force_update(self, task_mock):
+        feed = FeedFactory.create(owner=self.user, xml_link=self.data.get('url'))
+        task_mock.return_value.failed.return_value = True
+        task_mock.return_value.get.return_value = HostThrottled(retry_after=12.0)
+        response = self.client.post('/feeds/{}/force_update/'.format(feed.pk), content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '12')
+        task_mock.return_value.get.assert_called_once_with(timeout=mock.ANY, propagate=False)
+
+        # errors of the worker answer as a failed update instead of a server error
+        task_mock.return_value.get.return_value = Feed.DoesNotExist()
+        response = self.client.post('/feeds/{}/force_update/'.format(feed.pk), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual('Failed to update feed', response.json().get('errors')[0])
+
+    @override_settings(FEEDS_QUEUE_FORCE_UPDATE=True)
+    @mock.patch('feeds.tasks.feed_refresh_task.apply_async')
+    def test_queued_force_update_timeout(self, task_mock):
+        task_mock.return_value.get.side_effect = TimeoutError()
+        feed = FeedFactory.create(owner=self.user, xml_link=self.data.get('url'))
+        response = self.client.post('/feeds/{}/force_update/'.format(feed.pk), content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json().get('id'), feed.pk)
+
 
 class TestItemViewSet(APITestCase):
     def setUp(self):
+        super().setUp()
         self.user = UserFactory()
         self.client = APIClient()
         refresh = RefreshToken.for_user(self.user)
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
         self.feed = FeedFactory(owner=self.user)
 
+    def count_items(self):
+        # the factories leave the counters of the feeds to the reconciliation
+        utils.reconcile_feeds_counts(Feed.objects.all())
+
     def test_list_items(self):
         ItemFactory.create_batch(4, feed=self.feed)
+        self.count_items()
         response = self.client.get(
             '/items/',
             content_type='application/json'
@@ -262,14 +457,88 @@ class TestItemViewSet(APITestCase):
         self.assertEqual(len(json_data.get("results")), 4)
         for result in json_data.get("results"):
             item = Item.objects.get(id=result.get('id'))
-            self.assertEqual(result.get('title'), item.title)
-            self.assertEqual(result.get('link'), item.link)
+            self.assertEqual(result.get('title'), item.entry.title)
+            self.assertEqual(result.get('link'), item.entry.link)
+            self.assertEqual(result.get('guid'), item.entry.guid)
             self.assertEqual(result.get('read'), item.read)
 
+    def test_paginate_items_with_cursor(self):
+        items = ItemFactory.create_batch(5, feed=self.feed, last_updated_at=now())
+        items += ItemFactory.create_batch(3, feed=self.feed, last_updated_at=now() - timedelta(days=1))
+        expected = [item.id for item in sorted(items, key=lambda item: (item.last_updated_at, item.id), reverse=True)]
+        received = []
+        url = '/items/?limit=3'
+        while url:
+            response = self.client.get(url, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            json_data = response.json()
+            self.assertLessEqual(len(json_data.get("results")), 3)
+            received += [result.get('id') for result in json_data.get("results")]
+            url = json_data.get("next")
+        self.assertEqual(received, expected)
+
+    def test_paginate_items_back_with_cursor(self):
+        items = ItemFactory.create_batch(5, feed=self.feed)
+        self.count_items()
+        first_page = self.client.get('/items/?limit=2', content_type='application/json').json()
+        self.assertIsNone(first_page.get("previous"))
+        second_page = self.client.get(first_page.get("next"), content_type='application/json').json()
+        self.assertEqual(second_page.get("count"), len(items))
+        response = self.client.get(second_page.get("previous"), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json().get("results"), first_page.get("results"))
+
+    def test_paginate_with_invalid_cursor(self):
+        response = self.client.get('/items/?cursor=invalid', content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(ITEM_SYNC_SETTLE_TIME=0)
+    def test_sync_changed_items(self):
+        items = ItemFactory.create_batch(5, feed=self.feed, read=False, changed_at=now() - timedelta(days=1))
+        received = []
+        url = '/items/sync/?limit=2'
+        while True:
+            response = self.client.get(url, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            json_data = response.json()
+            received += [result.get('id') for result in json_data.get("results")]
+            url = '/items/sync/?limit=2&cursor={}'.format(json_data.get("cursor"))
+            if not json_data.get("has_more"):
+                break
+        self.assertEqual(received, [item.id for item in items])
+
+        response = self.client.get(url, content_type='application/json')
+        self.assertEqual(response.json().get("results"), [])
+        self.assertEqual(response.json().get("cursor"), url.split('cursor=')[1])
+
+        self.client.post(
+            '/items/read/',
+            data=json.dumps({"ids": [items[1].id]}),
+            content_type='application/json'
+        )
+        new_item = ItemFactory(feed=self.feed)
+        ItemFactory()
+        response = self.client.get(url, content_type='application/json')
+        json_data = response.json()
+        self.assertEqual([result.get('id') for result in json_data.get("results")], [items[1].id, new_item.id])
+        self.assertTrue(json_data.get("results")[0].get('read'))
+
+    def test_sync_holds_back_recent_changes(self):
+        item = ItemFactory(feed=self.feed, changed_at=now() - timedelta(days=1))
+        ItemFactory(feed=self.feed)
+        response = self.client.get('/feeds/{}/items/sync/'.format(self.feed.pk), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result.get('id') for result in response.json().get("results")], [item.id])
+
+    def test_sync_with_invalid_cursor(self):
+        response = self.client.get('/items/sync/?cursor=invalid', content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
     def test_list_all_feeds_items(self):
         feed2 = FeedFactory(owner=self.user)
         ItemFactory.create_batch(4, feed=self.feed)
         ItemFactory.create_batch(4, feed=feed2)
+        self.count_items()
         response = self.client.get(
             '/items/',
             content_type='application/json'
@@ -283,6 +552,7 @@ class TestItemViewSet(APITestCase):
     def test_list_only_owned_feeds_items(self):
         ItemFactory.create_batch(4, feed=self.feed)
         ItemFactory.create_batch(4)
+        self.count_items()
         response = self.client.get(
             '/items/',
             content_type='application/json'
@@ -300,6 +570,7 @@ class TestItemViewSet(APITestCase):
     def test_filter_list_items(self):
         ItemFactory.create_batch(4, feed=self.feed, read=True)
         ItemFactory.create_batch(3, feed=self.feed, read=False)
+        self.count_items()
         response = self.client.get(
             '/items/?read=true',
             content_type='application/json'
@@ -329,6 +600,7 @@ class TestItemViewSet(APITestCase):
         feed2 = FeedFactory(owner=self.user)
         ItemFactory.create_batch(4, feed=self.feed)
         ItemFactory.create_batch(4, feed=feed2)
+        self.count_items()
         response = self.client.get(
             '/feeds/{}/items/'.format(self.feed.pk),
             content_type='application/json'
@@ -353,6 +625,7 @@ class TestItemViewSet(APITestCase):
 
     def test_mark_feed_items_read(self):
         items = ItemFactory.create_batch(3, feed=self.feed, read=False)
+        Feed.objects.filter(pk=self.feed.pk).update(unread_count=3, total_count=3)
         response = self.client.post(
             '/feeds/{}/items/read/'.format(self.feed.pk),
             data=json.dumps({"ids": [items[0].id, items[1].id]}),
@@ -364,6 +637,8 @@ class TestItemViewSet(APITestCase):
         self.assertTrue(items[0].read)
         self.assertTrue(items[1].read)
         self.assertFalse(items[2].read)
+        self.feed.refresh_from_db()
+        self.assertEqual(self.feed.unread_count, 1)
 
     def test_mark_items_read(self):
         items = ItemFactory.create_batch(3, feed=self.feed, read=False)
@@ -379,6 +654,103 @@ class TestItemViewSet(APITestCase):
         self.assertTrue(items[1].read)
         self.assertFalse(items[2].read)
 
+    def test_mark_all_items_read(self):
+        other_feed = FeedFactory(owner=self.user)
+        ItemFactory.create_batch(3, feed=self.feed, read=False)
+        ItemFactory.create_batch(2, feed=other_feed, read=False)
+        other_user_item = ItemFactory(read=False)
+        response = self.client.post('/items/read_all/', data={}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'count': 5})
+        self.assertFalse(Item.objects.filter(feed__owner=self.user, read=False).exists())
+        other_user_item.refresh_from_db()
+        self.assertFalse(other_user_item.read)
+        for feed in [self.feed, other_feed]:
+            feed.refresh_from_db()
+            self.assertEqual(feed.unread_count, 0)
+
+    def test_mark_feed_items_read_before(self):
+        other_feed = FeedFactory(owner=self.user)
+        old_items = ItemFactory.create_batch(2, feed=self.feed, read=False, last_updated_at=now() - timedelta(days=2))
+        new_item = ItemFactory(feed=self.feed, read=False, last_updated_at=now())
+        other_item = ItemFactory(feed=other_feed, read=False, last_updated_at=now() - timedelta(days=2))
+        response = self.client.post(
+            '/feeds/{}/items/read_all/'.format(self.feed.pk),
+            data={'before': (now() - timedelta(days=1)).isoformat()},
+            format='json'
+        )
+        self.assertEqual(response.json(), {'count': 2})
+        self.assertEqual(
+            set(Item.objects.filter(read=True).values_list('pk', flat=True)), {item.pk for item in old_items}
+        )
+        self.feed.refresh_from_db()
+        self.assertEqual(self.feed.unread_count, 1)
+        self.assertFalse(Item.objects.get(pk=new_item.pk).read)
+        self.assertFalse(Item.objects.get(pk=other_item.pk).read)
+
+    def test_mark_items_read_from_cursor(self):
+        ItemFactory.create_batch(5, feed=self.feed, read=False, last_updated_at=now())
+        response = self.client.get('/items/?read=false&limit=2')
+        seen = [result['id'] for result in response.json()['results']]
+        cursor = parse_qs(urlsplit(response.json()['next']).query)['cursor'][0]
+        response = self.client.post('/items/read_all/', data={'cursor': cursor}, format='json')
+        # the items the listing returns from the cursor on are older than the seen ones
+        self.assertEqual(response.json(), {'count': 3})
+        self.assertEqual(set(Item.objects.filter(read=False).values_list('pk', flat=True)), set(seen))
+
+    def test_mark_items_read_with_invalid_cursor(self):
+        response = self.client.post('/items/read_all/', data={'cursor': 'invalid'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'cursor': ['Invalid cursor']})
+
+    def search(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_search_items(self):
+        title_match = ItemFactory(feed=self.feed, entry__title='Snapdragon phone', entry__description='A review')
+        description_match = ItemFactory(feed=self.feed, entry__title='News', entry__description='New snapdragon chip')
+        ItemFactory(feed=self.feed, entry__title='Other', entry__description='Unrelated')
+        ItemFactory(entry__title='Snapdragon of another user', entry__description='')
+        json_data = self.search('/items/search/?q=snapdragon')
+        # title matches rank higher than description matches
+        self.assertEqual([result['id'] for result in json_data['results']], [title_match.id, description_match.id])
+        self.assertIsNone(json_data['next'])
+        json_data = self.search('/items/search/?q=snapdragon+review')
+        self.assertEqual([result['id'] for result in json_data['results']], [title_match.id])
+        other_feed_match = ItemFactory(feed=FeedFactory(owner=self.user), entry__title='Snapdragon')
+        json_data = self.search('/feeds/{}/items/search/?q=snapdragon'.format(other_feed_match.feed_id))
+        self.assertEqual([result['id'] for result in json_data['results']], [other_feed_match.id])
+
+    def test_search_updated_entries(self):
+        item = ItemFactory(feed=self.feed, entry__title='Old title')
+        data = {
+            'title': 'New title', 'link': item.entry.link, 'description': item.entry.description,
+            'published_at': item.entry.published_at
+        }
+        data['content_hash'] = utils.get_entry_hash(data)
+        utils.update_items_data({item.entry.guid: data}, self.feed.channel, [self.feed])
+        self.assertEqual(self.search('/items/search/?q=old')['results'], [])
+        self.assertEqual([result['id'] for result in self.search('/items/search/?q=new')['results']], [item.id])
+
+    def test_paginate_search_results(self):
+        ItemFactory.create_batch(5, feed=self.feed, entry__title='Snapdragon')
+        received = []
+        url = '/items/search/?q=snapdragon&limit=2'
+        while url:
+            json_data = self.search(url)
+            received += [result['id'] for result in json_data['results']]
+            url = json_data['next']
+        self.assertEqual(sorted(received), sorted(Item.objects.values_list('pk', flat=True)))
+
+    def test_search_without_query(self):
+        for path in ['/items/search/', '/items/search/?q=+']:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 400)
+        # FTS operators and quotes of the input are searched as words
+        self.assertEqual(self.search('/items/search/?q=%22AND+OR%28')['results'], [])
+
     def test_mark_other_user_item_as_read(self):
         item = ItemFactory.create(read=False)
         response = self.client.post(
@@ -394,3 +766,85 @@ class TestItemViewSet(APITestCase):
         )
         item.refresh_from_db()
         self.assertFalse(item.read)
+
+
+class TestCachedListings(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = UserFactory()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.feed = FeedFactory(owner=self.user, updated=True)
+
+    def list_items(self, path='/items/?read=false'):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [result['id'] for result in response.json()['results']]
+
+    def test_serve_listing_from_cache(self):
+        items = ItemFactory.create_batch(3, feed=self.feed)
+        self.assertEqual(len(self.list_items('/items/')), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.list_items('/items/')), 3)
+        # items created without going through the refresh are not seen until an invalidation
+        ItemFactory(feed=self.feed)
+        self.assertEqual(len(self.list_items('/items/')), 3)
+        other_user = UserFactory()
+        ItemFactory(feed=FeedFactory(owner=other_user))
+        self.client.force_authenticate(other_user)
+        self.assertEqual(len(self.list_items('/items/')), 1)
+        self.assertNotIn(items[0].id, self.list_items('/items/'))
+
+    def test_read_invalidates_listings(self):
+        items = ItemFactory.create_batch(3, feed=self.feed, read=False)
+        self.assertEqual(len(self.list_items()), 3)
+        self.assertEqual(len(self.list_items('/feeds/{}/items/?read=false'.format(self.feed.pk))), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/items/read/', data={'ids': [items[0].id]}, format='json')
+        self.assertEqual(len(self.list_items()), 2)
+        self.assertEqual(len(self.list_items('/feeds/{}/items/?read=false'.format(self.feed.pk))), 2)
+
+    def test_refresh_invalidates_followers_listings(self):
+        other_user = UserFactory()
+        other_feed = FeedFactory(owner=other_user, channel=self.feed.channel, updated=False)
+        self.assertEqual(self.list_items(), [])
+        self.client.force_authenticate(other_user)
+        self.assertEqual(self.list_items(), [])
+        entries_data = utils.get_entries_data(mocks.valid_feed.entries)
+        with self.captureOnCommitCallbacks(execute=True):
+            utils.update_items_data(entries_data, self.feed.channel, [self.feed], [other_feed])
+        self.assertEqual(len(self.list_items()), 15)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(len(self.list_items()), 15)
+
+    def test_unfollow_invalidates_feed_listing(self):
+        response = self.client.get('/feeds/')
+        self.assertEqual(response.json()['count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/feeds/{}/'.format(self.feed.pk))
+        response = self.client.get('/feeds/')
+        self.assertEqual(response.json()['count'], 0)
+
+    def test_not_modified_listing(self):
+        items = ItemFactory.create_batch(2, feed=self.feed, read=False)
+        etags = {}
+        # nested route only checks the feed owner
+        paths = {'/items/?read=false': 0, '/feeds/{}/items/?read=false'.format(self.feed.pk): 1}
+        for path, queries in paths.items():
+            etags[path] = self.client.get(path)['ETag']
+            with self.assertNumQueries(queries):
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etags[path])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etags[path])
+            self.assertEqual(response.content, b'')
+            # compressed responses carry weak ETags
+            response = self.client.get(path, HTTP_IF_NONE_MATCH='W/{}'.format(etags[path]))
+            self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(*etags.values())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/items/read/', data={'ids': [items[0].id]}, format='json')
+        for path, etag in etags.items():
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            self.assertEqual(len(response.json()['results']), 1)
@@ -0,0 +1,196 @@
+import hmac
+from base64 import b64encode
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+from django.test import override_settings
+from django.utils import timezone
+
+from .cases import TestCase
+from .factories import ChannelFactory, FeedFactory
+from feeds.fetcher import parse_document
+from feeds.models import Channel, Entry
+from feeds.scheduler import get_poll_interval
+from feeds.tasks import renew_websub_subscriptions_task, websub_content_task
+from feeds.tests import mocks
+from feeds import utils, websub
+
+HUB_DOCUMENT = mocks.rss_hub_document
+HEADERS = {'content-type': 'application/rss+xml'}
+
+
+class StandInHub:
+    """
+    Hub answering subscription requests like a WebSub hub, it verifies the intent
+    on the callback then publishes signed content to it.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.subscriptions = {}
+
+    def handle(self, request):
+        form = {key: values[0] for key, values in parse_qs(request.content.decode()).items()}
+        self.subscriptions[form['hub.topic']] = form
+        return httpx.Response(202)
+
+    def verify(self, topic, mode='subscribe', challenge='challenge'):
+        subscription = self.subscriptions[topic]
+        return self.client.get(urlsplit(subscription['hub.callback']).path, {
+            'hub.mode': mode,
+            'hub.topic': topic,
+            'hub.challenge': challenge,
+            'hub.lease_seconds': subscription['hub.lease_seconds'],
+        })
+
+    def publish(self, topic, content, secret=None):
+        subscription = self.subscriptions[topic]
+        signature = hmac.new((secret or subscription['hub.secret']).encode(), content, 'sha256').hexdigest()
+        return self.client.post(
+            urlsplit(subscription['hub.callback']).path,
+            content,
+            content_type='application/rss+xml',
+            HTTP_X_HUB_SIGNATURE='sha256={}'.format(signature)
+        )
+
+
+@override_settings(
+    WEBSUB_CALLBACK_URL='http://testserver/', WEBSUB_POLL_INTERVAL=24 * 60 * 60,
+    WEBSUB_LEASE_SECONDS=7 * 24 * 60 * 60, WEBSUB_VERIFY_TIMEOUT=60 * 60
+)
+class TestWebSub(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.hub = StandInHub(self.client)
+        feed_xml = parse_document('https://example.com/rss', 200, HEADERS, HUB_DOCUMENT)
+        self.channel = utils.get_channel('https://example.com/rss', feed_xml)
+        self.feed = FeedFactory(channel=self.channel, updated=True)
+
+    def subscribe(self):
+        with httpx.Client(transport=httpx.MockTransport(self.hub.handle)) as client:
+            websub.request_subscription(self.channel, client=client)
+        self.channel.refresh_from_db()
+
+    def test_discover_hub(self):
+        self.assertEqual(self.channel.hub, 'https://hub.example.com/')
+        self.assertEqual(self.channel.topic, 'https://example.com/rss')
+        headers = {**HEADERS, 'link': '<https://push.example.com/>; rel="hub"'}
+        feed_xml = parse_document('https://example.com/rss', 200, headers, HUB_DOCUMENT)
+        self.assertEqual(websub.get_hub_links(feed_xml)['hub'], 'https://push.example.com/')
+        feed_xml = parse_document('https://example.com/rss', 200, HEADERS, mocks.rss_document)
+        self.assertEqual(websub.get_hub_links(feed_xml), {'hub': None, 'topic': None})
+
+    def test_subscribe_and_verify(self):
+        self.assertTrue(websub.needs_subscription(self.channel))
+        self.subscribe()
+        form = self.hub.subscriptions['https://example.com/rss']
+        self.assertEqual(form['hub.callback'], 'http://testserver/websub/{}'.format(self.channel.pk))
+        self.assertEqual(form['hub.secret'], self.channel.websub_secret)
+
+        response = self.hub.verify('https://example.com/rss')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'challenge')
+        self.channel.refresh_from_db()
+        self.assertFalse(websub.needs_subscription(self.channel))
+        # pushed channels are only polled as a safety net
+        self.assertEqual(get_poll_interval(self.channel), 24 * 60 * 60)
+        self.assertGreater(self.channel.next_fetch_at, timezone.now() + timedelta(hours=23))
+
+    def test_refuse_unsolicited_verification(self):
+        self.subscribe()
+        self.hub.verify('https://example.com/rss')
+        # a verification of the same subscription can not extend the lease again
+        Channel.objects.filter(pk=self.channel.pk).update(websub_expires_at=None)
+        self.assertEqual(self.hub.verify('https://example.com/rss').status_code, 404)
+        self.channel.refresh_from_db()
+        self.assertIsNone(self.channel.websub_expires_at)
+
+        self.subscribe()
+        Channel.objects.filter(pk=self.channel.pk).update(
+            websub_requested_at=timezone.now() - timedelta(hours=2)
+        )
+        self.assertEqual(self.hub.verify('https://example.com/rss').status_code, 404)
+
+    def test_bound_verified_lease(self):
+        self.subscribe()
+        self.hub.subscriptions['https://example.com/rss']['hub.lease_seconds'] = 10 * 365 * 24 * 60 * 60
+        self.assertEqual(self.hub.verify('https://example.com/rss').status_code, 200)
+        self.channel.refresh_from_db()
+        self.assertLessEqual(self.channel.websub_expires_at, timezone.now() + timedelta(days=7))
+
+    def test_refuse_unknown_topic(self):
+        self.subscribe()
+        self.hub.subscriptions['https://example.com/other'] = self.hub.subscriptions['https://example.com/rss']
+        self.assertEqual(self.hub.verify('https://example.com/other').status_code, 404)
+        # followed channels are not unsubscribed
+        self.assertEqual(self.hub.verify('https://example.com/rss', mode='unsubscribe').status_code, 404)
+
+    def test_denied_subscription(self):
+        self.subscribe()
+        self.hub.verify('https://example.com/rss')
+        self.assertEqual(self.hub.verify('https://example.com/rss', mode='denied').status_code, 200)
+        self.channel.refresh_from_db()
+        self.assertIsNone(self.channel.websub_expires_at)
+        self.assertLessEqual(self.channel.next_fetch_at, timezone.now())
+
+    @mock.patch('feeds.tasks.websub_content_task.delay', side_effect=lambda *args: websub_content_task.apply(args))
+    def test_ingest_pushed_content(self, delay_mock):
+        self.subscribe()
+        self.hub.verify('https://example.com/rss')
+        response = self.hub.publish('https://example.com/rss', HUB_DOCUMENT)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(delay_mock.call_args[0][1], {'content-type': 'application/rss+xml', 'content-language': ''})
+        self.assertEqual(self.feed.items.count(), 2)
+        self.channel.refresh_from_db()
+        self.assertEqual(self.channel.hub, 'https://hub.example.com/')
+        self.assertIsNotNone(self.channel.websub_expires_at)
+
+    @mock.patch('feeds.tasks.websub_content_task.delay')
+    def test_ignore_forged_content(self, delay_mock):
+        self.subscribe()
+        response = self.hub.publish('https://example.com/rss', HUB_DOCUMENT, secret='forged')
+        self.assertEqual(response.status_code, 202)
+        delay_mock.assert_not_called()
+        self.assertFalse(Entry.objects.exists())
+
+    @override_settings(FEED_FETCH_MAX_BYTES=100)
+    @mock.patch('feeds.tasks.websub_content_task.delay')
+    def test_ignore_too_large_content(self, delay_mock):
+        self.subscribe()
+        response = self.hub.publish('https://example.com/rss', HUB_DOCUMENT)
+        self.assertEqual(response.status_code, 202)
+        delay_mock.assert_not_called()
+
+    def test_ignore_invalid_pushed_content(self):
+        self.subscribe()
+        content = b64encode(b'<html></html>').decode()
+        self.assertFalse(websub_content_task.apply((self.channel.pk, HEADERS, content)).get())
+        self.assertFalse(Entry.objects.exists())
+
+    def test_drop_lease_of_removed_hub(self):
+        self.subscribe()
+        self.hub.verify('https://example.com/rss')
+        self.channel.refresh_from_db()
+        feed_xml = parse_document(self.channel.xml_link, 200, HEADERS, mocks.rss_document)
+        utils.update_channel_document(self.channel, [self.feed], feed_xml)
+        self.channel.refresh_from_db()
+        self.assertIsNone(self.channel.hub)
+        self.assertIsNone(self.channel.websub_expires_at)
+
+    @mock.patch('feeds.tasks.group')
+    def test_renew_ending_leases(self, group_mock):
+        Channel.objects.filter(pk=self.channel.pk).update(websub_expires_at=timezone.now() + timedelta(hours=2))
+        pushed = ChannelFactory(hub='https://hub.example.com/', websub_expires_at=timezone.now() + timedelta(days=5))
+        FeedFactory(channel=pushed, updated=True)
+        # nobody follows this one anymore
+        ChannelFactory(hub='https://hub.example.com/')
+        self.assertEqual(renew_websub_subscriptions_task.apply().get(), 1)
+        self.assertEqual([task.args for task in group_mock.call_args[0][0]], [(self.channel.pk,)])
+
+    @override_settings(WEBSUB_CALLBACK_URL=None)
+    def test_poll_without_callback(self):
+        self.assertFalse(websub.needs_subscription(self.channel))
+        self.assertEqual(renew_websub_subscriptions_task.apply().get(), 0)
@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import contextmanager, asynccontextmanager
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# takes a concurrency slot and a token of the host bucket atomically, returns 0 when
+# both are taken or the milliseconds to wait before trying again
+ACQUIRE_SCRIPT = '''
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local concurrency = tonumber(ARGV[4])
+local lease = tonumber(ARGV[5])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - lease)
+if redis.call('ZCARD', KEYS[2]) >= concurrency then
+    return tonumber(ARGV[7])
+end
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+if tokens < 1 then
+    return math.ceil((1 - tokens) / rate * 1000)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens - 1, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+redis.call('ZADD', KEYS[2], now, ARGV[6])
+redis.call('EXPIRE', KEYS[2], lease)
+return 0
+'''
+
+# empties the host bucket so no request is sent before the server allows it again
+PENALIZE_SCRIPT = '''
+local rate = tonumber(ARGV[2])
+redis.call('HSET', KEYS[1], 'tokens', -tonumber(ARGV[3]) * rate, 'updated_at', ARGV[1])
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3]) + tonumber(ARGV[4]) / rate) + 1)
+'''
+
+
+# once Redis failed, fetches of this process go without limits for this many seconds
+# instead of waiting for a connection before every request
+REDIS_RETRY_INTERVAL = 30
+redis_retry_at = 0
+
+
+class HostThrottled(Exception):
+    """
+    Raised when a host does not allow a request within FEED_HOST_MAX_WAIT.
+    """
+
+    def __init__(self, host=None, retry_after=None):
+        super().__init__('{} is throttled'.format(host))
+        self.retry_after = retry_after
+
+
+@lru_cache(maxsize=None)
+def get_redis():
+    '''
+    get the Redis client shared by the fetches of this process
+
+    Returns:
+        client (Redis): Redis client.
+    '''
+    return redis.Redis.from_url(settings.REDIS_URL, socket_timeout=1, socket_connect_timeout=0.5)
+
+
+def get_slot_lease():
+    '''
+    get the seconds a fetch holds its host slot at most: downloads stop at FEED_FETCH_DEADLINE
+    and a read started before it ends within FEED_FETCH_TIMEOUT
+
+    Returns:
+        lease (int): seconds after which a slot that was not released is freed.
+    '''
+    return settings.FEED_FETCH_DEADLINE + settings.FEED_FETCH_TIMEOUT
+
+
+def use_host_limits():
+    '''
+    check if fetches go through the host limits, they are skipped for REDIS_RETRY_INTERVAL
+    after Redis could not be reached
+
+    Returns:
+        limited (boolean): True if slots should be taken, False otherwise.
+    '''
+    return settings.FEED_HOST_LIMITS and time.monotonic() >= redis_retry_at
+
+
+def skip_host_limits(url, error):
+    '''
+    fetch without host limits until REDIS_RETRY_INTERVAL passed
+
+    Parameters:
+        url (URL): url fetched without limits.
+        error (RedisError): error of the failed Redis call.
+    '''
+    global redis_retry_at
+    redis_retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+    logger.warning('Fetching %s without host limits for %ss: %r', url, REDIS_RETRY_INTERVAL, error)
+
+
+def get_host(url):
+    '''
+    get the host name that requests of url are limited by
+
+    Parameters:
+        url (URL): url to be fetched.
+    Returns:
+        host (str): lower case host name.
+    '''
+    return (urlsplit(str(url)).hostname or '').lower()
+
+
+def get_host_keys(host):
+    '''
+    get the Redis keys of host rate limit bucket and concurrency slots
+
+    Parameters:
+        host (str): requested host.
+    Returns:
+        keys (List): bucket and slots keys.
+    '''
+    return ['feeds:host:{}:bucket'.format(host), 'feeds:host:{}:slots'.format(host)]
+
+
+def acquire_host_slot(host):
+    '''
+    try to take a concurrency slot and a rate limit token of host without waiting
+
+    Parameters:
+        host (str): host to be requested.
+    Returns:
+        slot (str): id of the taken slot or None if nothing was taken.
+        wait (float): seconds to wait before trying again.
+    '''
+    slot = uuid.uuid4().hex
+    wait = get_redis().eval(
+        ACQUIRE_SCRIPT,
+        2,
+        *get_host_keys(host),
+        time.time(),
+        settings.FEED_HOST_RATE,
+        settings.FEED_HOST_BURST,
+        settings.FEED_HOST_CONCURRENCY,
+        get_slot_lease(),
+        slot,
+        int(settings.FEED_HOST_POLL_INTERVAL * 1000)
+    )
+    if wait == 0:
+        return slot, 0
+    return None, wait / 1000
+
+
+def release_host_slot(host, slot):
+    '''
+    give back the concurrency slot taken by a finished request
+
+    Parameters:
+        host (str): requested host.
+        slot (str): id of the taken slot.
+    '''
+    get_redis().zrem(get_host_keys(host)[1], slot)
+
+
+def penalize_host(host, retry_after):
+    '''
+    stop requesting host for retry_after seconds, used when it answers 429 or 503
+
+    Parameters:
+        host (str): requested host.
+        retry_after (int): seconds the host asked to wait for.
+    '''
+    if not use_host_limits():
+        return
+    try:
+        get_redis().eval(
+            PENALIZE_SCRIPT,
+            1,
+            get_host_keys(host)[0],
+            time.time(),
+            settings.FEED_HOST_RATE,
+            retry_after,
+            settings.FEED_HOST_BURST
+        )
+    except redis.RedisError as error:
+        logger.warning('Could not penalize %s: %r', host, error)
+
+
+def get_retry_after(headers):
+    '''
+    read seconds of Retry-After response header
+
+    Parameters:
+        headers (Mapping): response headers.
+    Returns:
+        retry_after (int): seconds to wait, FEED_HOST_PENALTY if missing or a date.
+    '''
+    retry_after = headers.get('retry-after', '')
+    if retry_after.isdigit():
+        return min(int(retry_after), settings.FEED_MAX_FETCH_INTERVAL)
+    return settings.FEED_HOST_PENALTY
+
+
+@contextmanager
+def host_slot(url, max_wait=None):
+    '''
+    wait until the host of url allows one more request and hold its slot while fetching,
+    limits are not applied if Redis is not reachable.
+
+    Parameters:
+        url (URL): url to be fetched.
+        max_wait (float): seconds to wait for the host, FEED_HOST_MAX_WAIT if None.
+    Yields:
+        deadline (float): time.monotonic() value the download must end by, the slot lease ends after it.
+    '''
+    host = get_host(url)
+    max_wait = settings.FEED_HOST_MAX_WAIT if max_wait is None else max_wait
+    wait_until = time.monotonic() + max_wait
+    slot = None
+    while use_host_limits():
+        try:
+            slot, wait = acquire_host_slot(host)
+        except redis.RedisError as error:
+            skip_host_limits(url, error)
+            break
+        if slot is not None:
+            break
+        if time.monotonic() + wait > wait_until:
+            raise HostThrottled(host, wait)
+        time.sleep(wait)
+    try:
+        yield time.monotonic() + settings.FEED_FETCH_DEADLINE
+    finally:
+        if slot is not None:
+            try:
+                release_host_slot(host, slot)
+            except redis.RedisError as error:
+                # the slot expires with its lease
+                logger.warning('Could not release slot of %s: %r', host, error)
+
+
+@asynccontextmanager
+async def async_host_slot(url):
+    '''
+    host_slot for coroutines, Redis calls run in the default executor so other
+    downloads go on while this one waits.
+
+    Parameters:
+        url (URL): url to be fetched.
+    Yields:
+        deadline (float): time.monotonic() value the download must end by.
+    '''
+    loop = asyncio.get_running_loop()
+    host = get_host(url)
+    wait_until = time.monotonic() + settings.FEED_HOST_MAX_WAIT
+    slot = None
+    while use_host_limits():
+        try:
+            slot, wait = await loop.run_in_executor(None, acquire_host_slot, host)
+        except redis.RedisError as error:
+            skip_host_limits(url, error)
+            break
+        if slot is not None:
+            break
+        if time.monotonic() + wait > wait_until:
+            raise HostThrottled(host, wait)
+        await asyncio.sleep(wait)
+    try:
+        yield time.monotonic() + settings.FEED_FETCH_DEADLINE
+    finally:
+        if slot is not None:
+            try:
+                await loop.run_in_executor(None, release_host_slot, host, slot)
+            except redis.RedisError as error:
+                logger.warning('Could not release slot of %s: %r', host, error)
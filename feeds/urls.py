@@ -11,4 +11,6 @@ feed_router.register('items', views.ItemViewSet, basename='feed-items')
 urlpatterns = [
     path('', include(router.urls)),
     path('', include(feed_router.urls)),
+    path('metrics', views.metrics, name='metrics'),
+    path('websub/<int:pk>', views.websub_callback, name='websub-callback'),
 ]
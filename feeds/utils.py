@@ -1,24 +1,97 @@
+import json
+from collections import defaultdict
+from hashlib import sha256
 from time import mktime
-from datetime import datetime
-import feedparser
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit
 from django.utils import timezone
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, OuterRef, Subquery, When
+from django.db.models.functions import Coalesce, Greatest
 from django.core.mail import send_mail
+from rest_framework.exceptions import ValidationError
 
-from feeds.models import Item, Feed
-from feeds.validators import validate_feed
+from feeds.cache import invalidate_feeds, invalidate_users
+from feeds.models import Channel, Entry, Item, Feed
+from feeds.validators import validate_feed_document, validate_feed_item
+from feeds.scheduler import schedule_channel, schedule_failed_channel
+from feeds.fetcher import fetch_document
+from feeds.websub import discover_hub, get_hub_links
+from feeds.metrics import VALIDATE_SECONDS, UPSERT_SECONDS, ENTRIES, ITEMS_CREATED, CHANNEL_FAILURES
 
+ENTRY_CONTENT_FIELDS = ['title', 'link', 'description', 'published_at']
+ENTRY_UPDATE_FIELDS = [*ENTRY_CONTENT_FIELDS, 'content_hash', 'last_updated_at']
 
-def parse_feed(feed_url):
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_feed_url(feed_url):
+    '''
+    normalize feed URL so that different spellings of the same URL are fetched once,
+    scheme and host are lower cased, default port and fragment are dropped.
+
+    Parameters:
+        feed_url (URL): feed url as the user entered it.
+    Returns:
+        url (str): normalized url.
+    '''
+    parts = urlsplit(feed_url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = '{}:{}'.format(netloc, parts.port)
+    if parts.username:
+        credentials = parts.username if parts.password is None else '{}:{}'.format(parts.username, parts.password)
+        netloc = '{}@{}'.format(credentials, netloc)
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+def parse_feed(feed_url, etag=None, modified=None, content_hash=None, max_wait=None):
     '''
-    parse feeds URLs
+    parse feeds URLs, sending the validators of the previous fetch (if any) so
+    the server can answer with 304 Not Modified instead of the whole document.
+    Requests go through the per host limits over the pooled connections of the worker.
 
     Parameters:
         feed_url (URL): Any url parse data from.
+        etag (str): ETag header of the previous response.
+        modified (str): Last-Modified header of the previous response.
+        content_hash (str): hash of the previous document, the same document is not parsed again.
+        max_wait (float): seconds to wait for the host before raising HostThrottled, used by requests.
     Returns:
         data (FeedParserDict): Feed Parser Object that include data from url.
     '''
-    return feedparser.parse(feed_url)
+    return fetch_document(feed_url, etag=etag, modified=modified, content_hash=content_hash, max_wait=max_wait)
+
+
+def is_not_modified(feed_xml):
+    '''
+    check if the server answered a conditional request with 304 Not Modified
+    or sent the same document as the last fetch
+
+    Parameters:
+        feed_xml (FeedParserDict): parsed feed data.
+    Returns:
+        not_modified (boolean): True if the document did not change since the last fetch.
+    '''
+    return feed_xml.get('status') == 304 or feed_xml.get('unchanged', False)
+
+
+def get_feed_validators(feed_xml):
+    '''
+    Extract HTTP validators to be sent with the next conditional request
+
+    Parameters:
+        feed_xml (FeedParserDict): parsed feed data.
+    Returns:
+        data (dict): etag and last modified values of the response.
+    '''
+    return {
+        "etag": feed_xml.get('etag'),
+        "last_modified": feed_xml.get('modified'),
+    }
 
 
 def get_date_object(date):
@@ -76,86 +149,597 @@ def get_item_data(item):
     return data
 
 
-def create_items(feed_id, feed_xml):
+def get_entry_hash(data):
     '''
-    Create feed items in database using bulkcreate
+    fingerprint the extracted data of an item so changed entries are found
+    without loading their stored content
 
     Parameters:
-        feed_id (int): the id of the feed that items belong to.
-        feed_xml (FeedParserDict): parsed feed data.
+        data (dict): item data extracted from the parsed entry.
+    Returns:
+        hash (str): hex digest of the item data.
     '''
-    items = []
-    for item in feed_xml.get('entries'):
+    content = json.dumps([data.get(field) for field in ENTRY_CONTENT_FIELDS], default=str)
+    return sha256(content.encode()).hexdigest()
+
+
+def get_entries_data(entries):
+    '''
+    Validate parsed items and extract their data in one pass so every item is
+    normalized once and only its compact data is kept for the update
+
+    Parameters:
+        entries (List): parsed items.
+    Returns:
+        entries_data (dict): data of every item keyed by guid.
+    '''
+    # later entries win when a document repeats a guid, same as sequential upserts
+    entries_data = {}
+    for item in entries:
+        validate_feed_item(item)
         data = get_item_data(item)
-        items.append(Item(feed_id=feed_id, **data))
-    Item.objects.bulk_create(items)
+        data['content_hash'] = get_entry_hash(data)
+        entries_data[data.pop('guid')] = data
+    return entries_data
+
+
+def get_channel(feed_url, feed_xml):
+    '''
+    Get the channel of feed url or create it from the parsed data if no one follows it yet
+
+    Parameters:
+        feed_url (URL): url of the feed.
+        feed_xml (FeedParserDict): parsed feed data.
+    Returns:
+        channel (Channel): channel shared by all the feeds of this url.
+    '''
+    channel, created = Channel.objects.get_or_create(
+        xml_link=normalize_feed_url(feed_url),
+        defaults={**get_feed_data(feed_xml), **get_feed_validators(feed_xml), **get_hub_links(feed_xml)}
+    )
+    return channel
+
+
+def create_items(feed, entries_data):
+    '''
+    Create feed items in database, entries that other users already follow are reused
+
+    Parameters:
+        feed (Feed): the feed that items belong to.
+        entries_data (dict): data of the parsed items keyed by guid.
+    '''
+    update_items_data(entries_data, feed.channel, [], [feed])
+
+
+def get_cached_channel(feed_url):
+    '''
+    Get the channel of feed url if its entries are already stored and kept up to date
+
+    Parameters:
+        feed_url (URL): url of the feed.
+    Returns:
+        channel (Channel): channel followed by active feeds or None.
+    '''
+    return Channel.objects.filter(
+        xml_link=normalize_feed_url(feed_url),
+        feeds__status=Feed.ACTIVE,
+        feeds__updated=True
+    ).first()
 
 
-def update_feed_data(feed, feed_xml):
+def create_cached_feed(feed_url, owner, channel):
     '''
-    Update feed data using data extracted from feed_xml
+    Subscribe owner to feed url from the stored channel data and the entries of its last
+    document without fetching it, older entries of the channel are not given to new followers
 
     Parameters:
-        feed (Feed): The feed object to be updated.
+        feed_url (URL): url of the feed.
+        owner (User): user following the feed.
+        channel (Channel): cached channel of the feed url.
+    Returns:
+        feed (Feed): the created feed.
+    '''
+    entries = list(get_document_entries(channel).order_by('pk').values_list('pk', 'last_updated_at'))
+    with transaction.atomic():
+        feed = Feed.objects.create(
+            title=channel.title,
+            link=channel.link,
+            description=channel.description,
+            modified_at=channel.modified_at,
+            xml_link=feed_url,
+            owner=owner,
+            channel=channel,
+            unread_count=len(entries),
+            total_count=len(entries)
+        )
+        changed_at = timezone.now()
+        Item.objects.bulk_create([
+            Item(feed=feed, entry_id=entry_id, last_updated_at=last_updated_at, changed_at=changed_at)
+            for entry_id, last_updated_at in entries
+        ])
+    invalidate_feeds([feed])
+    return feed
+
+
+def create_pending_feed(feed_url, owner):
+    '''
+    Create a feed whose document is fetched later by the subscribe task, it is not
+    updated periodically until the first fetch succeeds.
+
+    Parameters:
+        feed_url (URL): url of the feed.
+        owner (User): user following the feed.
+    Returns:
+        feed (Feed): the created feed.
+    '''
+    channel, created = Channel.objects.get_or_create(xml_link=normalize_feed_url(feed_url))
+    feed = Feed.objects.create(
+        title='',
+        link='',
+        description='',
+        xml_link=feed_url,
+        owner=owner,
+        channel=channel,
+        updated=False,
+        status=Feed.PENDING
+    )
+    invalidate_feeds([feed])
+    return feed
+
+
+def subscribe_feed(feed):
+    '''
+    Fetch the document of a pending feed without validators so it gets all the entries,
+    the channel followers are updated with it too.
+
+    Parameters:
+        feed (Feed): pending feed.
+    Returns:
+        updated (boolean): False if update failed and True otherwise.
+    '''
+    feeds = [*feed.channel.feeds.filter(updated=True).exclude(pk=feed.pk), feed]
+    return update_channel_document(feed.channel, feeds, parse_feed(feed.xml_link))
+
+
+def update_channel_data(channel, feed_xml, feeds):
+    '''
+    Update channel data and the data of the feeds following it using data extracted from feed_xml,
+    the channel is saved by the caller and feeds are only written when their data changed
+
+    Parameters:
+        channel (Channel): The channel object to be updated.
         feed_xml (FeedParserDict): parsed feed data.
+        feeds (List): Feed objects to be updated.
     '''
     data = get_feed_data(feed_xml)
-    feed.__dict__.update(data)
-    feed.save()
+    if any(getattr(channel, field) != value for field, value in data.items()):
+        channel.__dict__.update(data)
+        stale_feeds = feeds
+    else:
+        # followers already have the channel data, except the feeds coming back
+        stale_feeds = [feed for feed in feeds if not feed.updated]
+    if stale_feeds:
+        Feed.objects.filter(pk__in=[feed.pk for feed in stale_feeds]).update(**data)
+        invalidate_feeds(stale_feeds)
+
+
+def update_items_data(entries_data, channel, feeds, new_feeds=()):
+    '''
+    Update channel entries data if exist or create if entry does not exist then
+    create the items of the new entries for the feeds following the channel.
+    The hashes of existing entries are loaded in one query keyed by guid then new
+    entries are bulk created and only the entries whose hash changed are bulk updated,
+    every entry of the document is marked as seen.
+
+    Parameters:
+        entries_data (dict): data of the parsed items keyed by guid.
+        channel (Channel): channel that entries belongs to.
+        feeds (List): feeds that get items of the new entries only.
+        new_feeds (List): feeds that get the items they miss, like a new or re-enabled feed.
+    '''
+    guids = list(entries_data)
+    existing_entries = {
+        guid: (pk, content_hash) for guid, pk, content_hash in Entry.objects.filter(
+            channel=channel, guid__in=guids
+        ).values_list('guid', 'pk', 'content_hash')
+    }
+    last_updated_at = timezone.now()
+    new_entries = []
+    changed_entries = []
+    for guid, data in entries_data.items():
+        entry = existing_entries.get(guid)
+        if entry is None:
+            new_entries.append(Entry(
+                channel=channel, guid=guid, last_updated_at=last_updated_at, last_seen_at=last_updated_at, **data
+            ))
+        elif entry[1] != data['content_hash']:
+            # a field missing from the document is cleared like the hash says
+            changed_entries.append(
+                Entry(pk=entry[0], last_updated_at=last_updated_at, **{'published_at': None, **data})
+            )
+
+    with transaction.atomic():
+        Entry.objects.bulk_create(new_entries)
+        Entry.objects.bulk_update(changed_entries, ENTRY_UPDATE_FIELDS)
+        # listed entries are still published even if their content did not change
+        Entry.objects.filter(pk__in=[entry[0] for entry in existing_entries.values()]).update(
+            last_seen_at=last_updated_at
+        )
+        if changed_entries:
+            Item.objects.filter(
+                entry_id__in=[entry.pk for entry in changed_entries]
+                ).update(last_updated_at=last_updated_at, changed_at=last_updated_at)
+        create_entries_items(channel, {entry.guid for entry in new_entries}, feeds, new_feeds)
+    if new_entries or changed_entries or new_feeds:
+        # changed entries update the items of every follower, even disabled ones
+        invalidate_users(Feed.objects.filter(channel=channel).values_list('owner_id', flat=True))
+    ENTRIES.labels('inserted').inc(len(new_entries))
+    ENTRIES.labels('updated').inc(len(changed_entries))
+
+
+def create_entries_items(channel, new_guids, feeds, new_feeds):
+    '''
+    Create the items of channel entries for the feeds following it
+
+    Parameters:
+        channel (Channel): channel that entries belongs to.
+        new_guids (Set): guids of the entries created by this update.
+        feeds (List): feeds that get items of the new entries only.
+        new_feeds (List): feeds that get items of the entries they missed.
+    '''
+    items = []
+    if feeds and new_guids:
+        entries = Entry.objects.filter(
+            channel=channel, guid__in=new_guids
+            ).order_by('pk').values_list('pk', 'last_updated_at')
+        changed_at = timezone.now()
+        for entry_id, last_updated_at in entries:
+            for feed in feeds:
+                items.append(Item(
+                    feed_id=feed.pk,
+                    entry_id=entry_id,
+                    last_updated_at=last_updated_at,
+                    changed_at=changed_at
+                    ))
+    if new_feeds:
+        items.extend(get_missed_items(channel, new_feeds))
+    # a concurrent update of the channel may have created some missed items
+    Item.objects.bulk_create(items, ignore_conflicts=bool(new_feeds))
+    ITEMS_CREATED.inc(len(items))
+    if feeds and new_guids:
+        # every followed feed got one new unread item per new entry
+        Feed.objects.filter(pk__in=[feed.pk for feed in feeds]).update(
+            unread_count=F('unread_count') + len(new_guids),
+            total_count=F('total_count') + len(new_guids)
+        )
+    if new_feeds:
+        count_feeds_items(Feed.objects.filter(pk__in=[feed.pk for feed in new_feeds]))
 
 
-def update_items_data(entries, feed_id):
+def get_document_entries(channel):
     '''
-    Update items data if exist or create if item does not exist
+    get the entries listed by the last document of channel, the update storing a
+    document marks all of its entries as seen at the same time
 
     Parameters:
-        entries (List): List of items.
-        feed_id (int): id of feed that items belongs to.
+        channel (Channel): channel that entries belongs to.
+    Returns:
+        entries (QuerySet): Entry objects of the last document.
     '''
-    for item in entries:
-        data = get_item_data(item)
-        data['last_updated_at'] = timezone.now()
-        Item.objects.update_or_create(guid=data.pop("guid"), feed_id=feed_id, defaults=data)
+    last_seen_at = channel.entries.order_by('-last_seen_at').values('last_seen_at')[:1]
+    return channel.entries.filter(last_seen_at=Subquery(last_seen_at))
+
+
+def get_missed_items(channel, feeds):
+    '''
+    Build the items feeds are missing. Feeds without items, like new ones, get the entries
+    of the last document only. Feeds with items get the entries created after their newest
+    one, like the entries created while a feed was disabled, older entries were pruned
+    from the feed and they and the entries past ITEM_RETENTION_DAYS are not created again.
 
+    Parameters:
+        channel (Channel): channel followed by feeds.
+        feeds (List): new or re-enabled feeds.
+    Returns:
+        items (List): Item objects to be created.
+    '''
+    newest = dict(
+        Item.objects.filter(feed__in=feeds).order_by().values('feed').annotate(
+            newest=Max('entry_id')
+        ).values_list('feed', 'newest')
+    )
+    changed_at = timezone.now()
+    items = []
+    new_feeds = [feed for feed in feeds if feed.pk not in newest]
+    if new_feeds:
+        items.extend(
+            Item(feed_id=feed.pk, entry_id=entry_id, last_updated_at=last_updated_at, changed_at=changed_at)
+            for entry_id, last_updated_at in get_document_entries(channel).order_by('pk').values_list(
+                'pk', 'last_updated_at'
+            )
+            for feed in new_feeds
+        )
+    enabled_feeds = [feed for feed in feeds if feed.pk in newest]
+    if enabled_feeds:
+        entries = Entry.objects.filter(channel=channel, pk__gt=min(newest[feed.pk] for feed in enabled_feeds))
+        if settings.ITEM_RETENTION_DAYS:
+            entries = entries.filter(
+                last_updated_at__gte=timezone.now() - timedelta(days=settings.ITEM_RETENTION_DAYS)
+            )
+        items.extend(
+            Item(feed_id=feed.pk, entry_id=entry_id, last_updated_at=last_updated_at, changed_at=changed_at)
+            for entry_id, last_updated_at in entries.order_by('pk').values_list('pk', 'last_updated_at')
+            for feed in enabled_feeds if entry_id > newest[feed.pk]
+        )
+    return items
 
-def feed_has_updates(feed, feed_xml):
+
+def get_items_count(**filters):
+    '''
+    build a subquery counting the items of the outer feed
+
+    Parameters:
+        filters (dict): lookups the counted items match.
+    Returns:
+        count (Coalesce): number of items, 0 if the feed has none.
+    '''
+    items = Item.objects.filter(feed=OuterRef('pk'), **filters).order_by().values('feed')
+    return Coalesce(Subquery(items.annotate(count=Count('pk')).values('count')), 0)
+
+
+def count_feeds_items(feeds):
+    '''
+    set the counters of feeds from their items in one update
+
+    Parameters:
+        feeds (QuerySet): Feed objects to be counted.
+    '''
+    feeds.update(unread_count=get_items_count(read=False), total_count=get_items_count())
+
+
+def mark_items_read(items):
+    '''
+    mark items as read and take them off the unread counters of their feeds, items
+    are locked first so concurrent reads of the same item are counted once.
+
+    Parameters:
+        items (QuerySet): Item objects to be marked as read.
+    Returns:
+        count (int): number of items that were unread.
+    '''
+    with transaction.atomic():
+        unread_items = list(items.select_for_update().filter(read=False).values_list('pk', 'feed_id'))
+        if not unread_items:
+            return 0
+        Item.objects.filter(pk__in=[pk for pk, feed_id in unread_items]).update(
+            read=True, changed_at=timezone.now()
+        )
+        counts = defaultdict(int)
+        for pk, feed_id in unread_items:
+            counts[feed_id] += 1
+        # a drifted counter stays at 0 until the reconcile task corrects it
+        Feed.objects.filter(pk__in=counts).update(unread_count=Case(
+            *[When(pk=feed_id, then=Greatest(F('unread_count') - count, 0)) for feed_id, count in counts.items()]
+        ))
+    return len(unread_items)
+
+
+def mark_all_items_read(items, feeds):
+    '''
+    mark the unread items of a filtered queryset as read in one update then recount the
+    items left unread in feeds, which the item index answers without reading the read ones.
+
+    Parameters:
+        items (QuerySet): Item objects to be marked as read.
+        feeds (QuerySet): Feed objects the items belong to.
+    Returns:
+        count (int): number of items that were unread.
+    '''
+    with transaction.atomic():
+        count = items.select_related(None).filter(read=False).update(read=True, changed_at=timezone.now())
+        if count:
+            feeds.update(unread_count=get_items_count(read=False))
+    return count
+
+
+def reconcile_feeds_counts(feeds):
+    '''
+    correct the counters of feeds that drifted from their items
+
+    Parameters:
+        feeds (QuerySet): Feed objects to be checked.
+    Returns:
+        count (int): number of corrected feeds.
+    '''
+    drifted = list(feeds.annotate(
+        actual_unread=get_items_count(read=False),
+        actual_total=get_items_count()
+    ).exclude(unread_count=F('actual_unread'), total_count=F('actual_total')))
+    for feed in drifted:
+        feed.unread_count = feed.actual_unread
+        feed.total_count = feed.actual_total
+    Feed.objects.bulk_update(drifted, ['unread_count', 'total_count'])
+    invalidate_feeds(drifted)
+    return len(drifted)
+
+
+def feed_has_updates(channel, feed_xml):
     '''
     check if feed has update by comparing last modification dates
 
     Parameters:
-        feed (Feed): Feed object that we already have.
+        channel (Channel): Channel object that we already have.
         feed_xml (FeedParserDict): New parsed data.
     Returns:
         updated (boolean): True if there is difference between database and parsed data, false otherwise.
     '''
-    modified_at = get_date_object(feed_xml.get('modified_parsed'))
-    if not modified_at:
+    if not feed_xml.get('modified_parsed'):
         return True
-    return feed.modified_at != modified_at
+    return channel.modified_at != get_date_object(feed_xml.get('modified_parsed'))
 
 
-def update_feed(feed):
+def update_feed(feed, max_wait=None):
     '''
-    check if feed is valid and has update then update feed and its items
+    check if feed is valid and has update then update feed and its items.
+    A 304 Not Modified response skips parsing, validation and item updates.
 
     Parameters:
         feed (Feed): Feed object to be updated.
+        max_wait (float): seconds to wait for the host before raising HostThrottled, used by requests.
+    Returns:
+        updated (boolean): False if update failed and True otherwise.
+    '''
+    return update_channel(feed.channel, [feed], max_wait=max_wait)
+
+
+def update_channel(channel, feeds, max_wait=None):
+    '''
+    fetch and parse channel url once then update the channel entries and the feeds that follow it.
+    A 304 Not Modified response skips parsing, validation and item updates.
+
+    Parameters:
+        channel (Channel): Channel object to be updated.
+        feeds (List): Feed objects to be updated.
+        max_wait (float): seconds to wait for the host before raising HostThrottled, used by requests.
     Returns:
         updated (boolean): False if update failed and True otherwise.
     '''
     try:
-        feed_xml = parse_feed(feed.xml_link)
-        validate_feed(feed_xml)
-        if feed_has_updates(feed, feed_xml):
-            update_feed_data(feed, feed_xml)
-            update_items_data(feed_xml.get('entries'), feed.pk)
-        feed.updated = True
-        feed.save()
-        return True
-    except Feed.DoesNotExist:
+        feed_xml = parse_feed(
+            channel.xml_link,
+            etag=channel.etag,
+            modified=channel.last_modified,
+            content_hash=channel.content_hash,
+            max_wait=max_wait
+        )
+        return update_channel_document(channel, feeds, feed_xml)
+    except Channel.DoesNotExist:
         return False
 
 
+def update_channel_document(channel, feeds, feed_xml):
+    '''
+    validate an already fetched channel document then update the channel entries and the feeds that follow it.
+
+    Parameters:
+        channel (Channel): Channel object to be updated.
+        feeds (List): Feed objects to be updated.
+        feed_xml (FeedParserDict): parsed feed data.
+    Returns:
+        updated (boolean): False if update failed and True otherwise.
+    '''
+    if channel.state == Channel.BROKEN:
+        # followers disabled when the circuit opened come back with the channel
+        feeds = [
+            *feeds,
+            *channel.feeds.filter(updated=False, status=Feed.ACTIVE).exclude(pk__in=[feed.pk for feed in feeds])
+        ]
+    # disabled feeds missed the entries created while they were not updated
+    disabled_feeds = [feed for feed in feeds if not feed.updated]
+    enabled_feeds = [feed for feed in feeds if feed.updated]
+    if is_not_modified(feed_xml):
+        update_fields = ['next_fetch_at', 'state', 'failure_count', 'last_error']
+        if feed_xml.get('unchanged'):
+            # the same document came back in a full response, maybe with new validators
+            channel.__dict__.update(get_feed_validators(feed_xml))
+            update_fields += ['etag', 'last_modified']
+        schedule_channel(channel, feed_xml)
+        reset_channel_health(channel)
+        channel.save(update_fields=update_fields)
+        if disabled_feeds:
+            # the stored entries are the document, feeds coming back get the ones they missed from them
+            with transaction.atomic():
+                create_entries_items(channel, set(), [], disabled_feeds)
+        enable_feeds(disabled_feeds)
+        return True
+    with VALIDATE_SECONDS.time():
+        validate_feed_document(feed_xml)
+        entries_data = get_entries_data(feed_xml.get('entries'))
+    if feed_has_updates(channel, feed_xml) or disabled_feeds:
+        with UPSERT_SECONDS.time():
+            update_channel_data(channel, feed_xml, feeds)
+            update_items_data(entries_data, channel, enabled_feeds, disabled_feeds)
+    channel.__dict__.update(get_feed_validators(feed_xml))
+    channel.content_hash = feed_xml.get('content_hash')
+    # pushed content may leave out the links of the full document
+    if not feed_xml.get('pushed'):
+        discover_hub(channel, feed_xml)
+    schedule_channel(channel, feed_xml)
+    reset_channel_health(channel)
+    channel.save()
+    enable_feeds(disabled_feeds)
+    return True
+
+
+def reset_channel_health(channel):
+    '''
+    mark channel as healthy after a successful update
+
+    Parameters:
+        channel (Channel): updated channel.
+    '''
+    channel.state = Channel.HEALTHY
+    channel.failure_count = 0
+    channel.last_error = None
+
+
+def get_error_message(error):
+    '''
+    get a readable message of an update failure
+
+    Parameters:
+        error (Exception): error raised by the update.
+    Returns:
+        message (str): error message.
+    '''
+    if isinstance(error, ValidationError) and isinstance(error.detail, dict):
+        return ', '.join(str(message) for message in error.detail.get('errors', [])) or str(error)
+    return str(error) or repr(error)
+
+
+def record_channel_failure(channel, error):
+    '''
+    count a failed update of channel and back off before fetching it again. After
+    FEED_CIRCUIT_THRESHOLD failures in a row the circuit opens: followers are disabled
+    and notified once and the channel is only probed until an update succeeds.
+
+    Parameters:
+        channel (Channel): channel that failed to be updated.
+        error (Exception): error raised by the update.
+    '''
+    channel.failure_count += 1
+    channel.last_error = get_error_message(error)
+    opened = channel.failure_count >= settings.FEED_CIRCUIT_THRESHOLD and channel.state != Channel.BROKEN
+    if channel.failure_count >= settings.FEED_CIRCUIT_THRESHOLD:
+        channel.state = Channel.BROKEN
+    else:
+        channel.state = Channel.FAILING
+    schedule_failed_channel(channel)
+    channel.save(update_fields=['next_fetch_at', 'state', 'failure_count', 'last_error'])
+    CHANNEL_FAILURES.labels(channel.state).inc()
+    if opened:
+        feeds = list(channel.feeds.filter(updated=True).select_related('owner'))
+        Feed.objects.filter(pk__in=[feed.pk for feed in feeds]).update(updated=False)
+        invalidate_feeds(feeds)
+        for feed in feeds:
+            send_failure_notification(feed)
+
+
+def enable_feeds(feeds):
+    '''
+    Turn auto updating on for feeds, pending feeds become active
+
+    Parameters:
+        feeds (List): Feed objects to be enabled.
+    '''
+    Feed.objects.filter(pk__in=[feed.pk for feed in feeds]).update(updated=True, status=Feed.ACTIVE, error=None)
+    invalidate_feeds(feeds)
+    for feed in feeds:
+        feed.updated = True
+        feed.status = Feed.ACTIVE
+        feed.error = None
+
+
 def send_failure_notification(feed):
     '''
     send notification email to the user who owns the feed that failed to be updated
@@ -166,7 +750,8 @@ def send_failure_notification(feed):
 
     subject = 'Failed to update feed'
     message = \
-        'Hi {}, System faild to update this feed ({}) and auto updating is disabled for this feed.'.format(
+        'Hi {}, System faild to update this feed ({}) and auto updating is disabled for this feed. ' \
+        'It will be enabled again once the feed is reachable.'.format(
             feed.owner.username,
             feed.xml_link
         )
@@ -1,9 +1,10 @@
 from rest_framework.exceptions import ValidationError
 
 
-def validate_feed(feed):
+def validate_feed_document(feed):
     '''
-    Check if parsed feed is valid feed then validate feed items
+    Check if parsed feed is valid feed with items, without validating the items themselves
+    so they can be validated while their data is extracted
 
     Parameters:
         feed (FeedParserDict): FeedParserDict that is generated from parsing the URL.
@@ -11,7 +12,8 @@ def validate_feed(feed):
     if not feed.get('feed') or feed.get('bozo', 0) == 1:
         raise ValidationError({"errors": ["Invalid feed"]})
     validate_feed_channel(feed.feed)
-    validate_feed_items(feed)
+    if not feed.get('entries'):
+        raise ValidationError({"errors": ["feed has no items"]})
 
 
 def validate_feed_channel(feed):
@@ -25,22 +27,17 @@ def validate_feed_channel(feed):
         raise ValidationError({"errors": ["Invalid feed"]})
 
 
-def validate_feed_items(feed):
+def validate_feed_item(item):
     '''
-    - Validate that feed has items
     - Raise a validation exception if item does neither have title nor description
     - Raise a validation exception if item does not have guid
 
     Parameters:
-        feed (FeedParserDict): FeedParserDict that is generated from parsing the URL.
+        item (FeedParserDict): parsed item data.
     '''
-    if not feed.get('entries'):
-        raise ValidationError({"errors": ["feed has no items"]})
-
-    for item in feed.get('entries'):
-        # feed item should has at least title or description
-        if not item.get('title') and not item.get('description'):
-            raise ValidationError({"errors": ["feed has invalid item(s)"]})
+    # feed item should has at least title or description
+    if not item.get('title') and not item.get('description'):
+        raise ValidationError({"errors": ["feed has invalid item(s)"]})
 
-        if not item.get('guid'):
-            raise ValidationError({"errors": ["guid is missing in some items"]})
+    if not item.get('guid'):
+        raise ValidationError({"errors": ["guid is missing in some items"]})
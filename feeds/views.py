@@ -1,16 +1,53 @@
+from base64 import b64encode
+
 from rest_framework import viewsets, mixins, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import Throttled, ValidationError
+from rest_framework.reverse import reverse
+from django.conf import settings
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 from django_filters.rest_framework import DjangoFilterBackend
+from celery.exceptions import TimeoutError
+from prometheus_client import CONTENT_TYPE_LATEST
 
-from feeds import serializers, utils, validators, models
+from feeds import serializers, utils, validators, models, tasks, cache, search, websub
+from feeds.metrics import can_read_metrics, export_metrics
 from feeds.permissions import IsFeedOwner
+from feeds.pagination import ItemCursorPagination, ItemSyncPagination, ItemSearchPagination
+from feeds.throttling import HostThrottled
+
+
+class CachedListModelMixin(mixins.ListModelMixin):
+    """
+    List pages are cached per user until one of the user feeds or items changes,
+    clients sending the ETag of an unchanged page get 304 Not Modified.
+    """
+
+    def list(self, request, *args, **kwargs):
+        # the key is taken before the query so a change committed meanwhile gets a newer version
+        key = cache.get_page_key(request)
+        headers = {'ETag': cache.get_page_etag(key), 'Cache-Control': 'private, no-cache'}
+        if cache.is_not_modified(request, headers['ETag']):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        data = cache.get_page(key)
+        if data is not None:
+            return Response(data, headers=headers)
+        response = super().list(request, *args, **kwargs)
+        cache.set_page(key, response.data)
+        for header, value in headers.items():
+            response[header] = value
+        return response
 
 
 class FeedViewSet(mixins.CreateModelMixin,
                   mixins.DestroyModelMixin,
-                  mixins.ListModelMixin,
+                  CachedListModelMixin,
                   viewsets.GenericViewSet):
 
     serializer_class = serializers.FeedSerializer
@@ -25,39 +62,120 @@ class FeedViewSet(mixins.CreateModelMixin,
             context={'request': request}
             )
         create_serializer.is_valid(raise_exception=True)
-        feed = utils.parse_feed(create_serializer.data.get('url'))
-        validators.validate_feed(feed)
+        if settings.FEEDS_ASYNC_SUBSCRIPTION:
+            return self.create_async(create_serializer.data.get('url'))
+        try:
+            feed = utils.parse_feed(create_serializer.data.get('url'), max_wait=settings.FEED_HOST_REQUEST_MAX_WAIT)
+        except HostThrottled as error:
+            raise Throttled(wait=error.retry_after)
+        validators.validate_feed_document(feed)
+        entries_data = utils.get_entries_data(feed.get('entries'))
         data = utils.get_feed_data(feed)
         data['owner'] = request.user.pk
         data['xml_link'] = create_serializer.data.get('url')
 
         serializer = serializers.FeedSerializer(data=data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        utils.create_items(serializer.data.get('id'), feed)
+        channel = utils.get_channel(data['xml_link'], feed)
+        serializer.save(channel=channel)
+        utils.create_items(serializer.instance, entries_data)
+        cache.invalidate_users([request.user.pk])
+        if websub.needs_subscription(channel):
+            tasks.websub_subscribe_task.delay(channel.pk)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def create_async(self, url):
+        # channels followed by active feeds already have their entries stored
+        channel = utils.get_cached_channel(url)
+        if channel is not None:
+            feed = utils.create_cached_feed(url, self.request.user, channel)
+            return Response(serializers.FeedSerializer(feed).data, status=status.HTTP_201_CREATED)
+
+        feed = utils.create_pending_feed(url, self.request.user)
+        tasks.feed_subscribe_task.delay(feed.pk)
+        location = reverse('feeds-subscription', args=[feed.pk], request=self.request)
+        return Response(
+            serializers.FeedSerializer(feed).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': location}
+            )
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        cache.invalidate_users([instance.owner_id])
+
+    @action(detail=False, methods=['get'])
+    def counts(self, request, *args, **kwargs):
+        # summed from the counters of the user feeds, items are not counted
+        counts = self.get_queryset().aggregate(unread_count=Sum('unread_count'), total_count=Sum('total_count'))
+        return Response(status=status.HTTP_200_OK, data={key: value or 0 for key, value in counts.items()})
+
+    @action(detail=True, methods=['get'])
+    def subscription(self, request, pk, *args, **kwargs):
+        feed = self.get_object()
+        return Response(status=status.HTTP_200_OK, data=serializers.FeedSubscriptionSerializer(feed).data)
+
     @action(detail=True, methods=['post'])
     def force_update(self, request, pk, *args, **kwargs):
         feed = self.get_object()
-        utils.update_feed(feed)
+        if settings.FEEDS_QUEUE_FORCE_UPDATE:
+            return self.queue_update(feed)
+        try:
+            utils.update_feed(feed, max_wait=settings.FEED_HOST_REQUEST_MAX_WAIT)
+        except HostThrottled as error:
+            raise Throttled(wait=error.retry_after)
+        feed.refresh_from_db()
+        return Response(status=status.HTTP_200_OK, data=serializers.FeedSerializer(feed).data)
+
+    def queue_update(self, feed):
+        result = tasks.feed_refresh_task.apply_async((feed.pk,))
+        try:
+            errors = result.get(timeout=settings.FEED_FORCE_UPDATE_TIMEOUT, propagate=False)
+        except TimeoutError:
+            # the worker keeps updating the feed, its items show up in the item listing
+            return Response(status=status.HTTP_202_ACCEPTED, data=serializers.FeedSerializer(feed).data)
+        if result.failed():
+            # the exception raised by the worker is the result of the failed task
+            if isinstance(errors, HostThrottled):
+                raise Throttled(wait=errors.retry_after)
+            raise ValidationError({"errors": ["Failed to update feed"]})
+        if errors:
+            raise ValidationError(errors)
         feed.refresh_from_db()
         return Response(status=status.HTTP_200_OK, data=serializers.FeedSerializer(feed).data)
 
 
-class ItemViewSet(mixins.ListModelMixin,
+class ItemViewSet(CachedListModelMixin,
                   viewsets.GenericViewSet):
 
     serializer_class = serializers.ItemSerializer
     permission_classes = [IsAuthenticated, IsFeedOwner]
+    pagination_class = ItemCursorPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['read']
 
     def get_queryset(self):
+        items = models.Item.objects.select_related('entry')
         if self.kwargs.get('feed_pk'):
-            return models.Item.objects.filter(feed_id=self.kwargs.get('feed_pk'))
+            return items.filter(feed_id=self.kwargs.get('feed_pk'))
         ids_list = self.request.user.feeds.values_list('pk', flat=True)
-        return models.Item.objects.filter(feed_id__in=ids_list)
+        return items.filter(feed_id__in=ids_list)
+
+    def get_feeds(self):
+        feeds = self.request.user.feeds.all()
+        if self.kwargs.get('feed_pk'):
+            return feeds.filter(pk=self.kwargs.get('feed_pk'))
+        return feeds
+
+    def count_items(self):
+        # listed items are counted from the counters of their feeds, the read filter picks the counter
+        counts = self.get_feeds().aggregate(unread=Sum('unread_count'), total=Sum('total_count'))
+        unread, total = counts['unread'] or 0, counts['total'] or 0
+        filterset = DjangoFilterBackend().get_filterset(self.request, self.get_queryset(), self)
+        read = filterset.form.cleaned_data.get('read') if filterset.is_valid() else None
+        if read is None:
+            return total
+        return total - unread if read else unread
 
     @action(detail=False, methods=['post'])
     def read(self, request, *args, **kwargs):
@@ -66,7 +184,71 @@ class ItemViewSet(mixins.ListModelMixin,
             context={'items': self.get_queryset()}
             )
         serializer.is_valid(raise_exception=True)
-        models.Item.objects.filter(
-            id__in=serializer.validated_data.get('ids')
-            ).update(read=True)
+        utils.mark_items_read(models.Item.objects.filter(id__in=serializer.validated_data.get('ids')))
+        cache.invalidate_users([request.user.pk])
         return Response(status=status.HTTP_200_OK, data=serializer.data)
+
+    @action(detail=False, methods=['post'])
+    def read_all(self, request, *args, **kwargs):
+        serializer = serializers.ReadAllItemsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # the current filters and feed scope apply, items are also limited to the ones
+        # updated before a date or listed from a cursor on
+        items = self.filter_queryset(self.get_queryset())
+        if serializer.validated_data.get('before'):
+            items = items.filter(last_updated_at__lte=serializer.validated_data.get('before'))
+        if serializer.validated_data.get('cursor'):
+            # same items the listing returns from the cursor on
+            items = ItemCursorPagination().filter_after(items, serializer.validated_data.get('cursor'))
+        feeds = request.user.feeds.all()
+        if self.kwargs.get('feed_pk'):
+            feeds = feeds.filter(pk=self.kwargs.get('feed_pk'))
+        count = utils.mark_all_items_read(items, feeds)
+        cache.invalidate_users([request.user.pk])
+        return Response(status=status.HTTP_200_OK, data={'count': count})
+
+    @action(detail=False, methods=['get'])
+    def search(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': ['This query parameter is required.']})
+        paginator = ItemSearchPagination()
+        channels = self.get_feeds().values('channel_id')
+        items = search.search_items(self.filter_queryset(self.get_queryset()), channels, query)
+        items = paginator.paginate_queryset(items, request, view=self)
+        serializer = self.get_serializer(items, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def sync(self, request, *args, **kwargs):
+        # read filter is not applied so clients also receive items marked as read
+        paginator = ItemSyncPagination()
+        items = paginator.paginate_queryset(self.get_queryset(), request, view=self)
+        serializer = self.get_serializer(items, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+def metrics(request):
+    # scraped by Prometheus, refresh metrics of the workers are exported by their own server
+    if not can_read_metrics(request):
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(export_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def websub_callback(request, pk):
+    channel = get_object_or_404(models.Channel, pk=pk)
+    if request.method == 'GET':
+        challenge = websub.verify_intent(channel, request.GET)
+        if challenge is None:
+            return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+        return HttpResponse(challenge, content_type='text/plain')
+    # hubs expect content they signed wrongly or too large to be acknowledged and ignored,
+    # signed content is handed to a worker so the hub does not wait for the update
+    body = request.body
+    if len(body) <= settings.FEED_FETCH_MAX_BYTES and \
+            websub.is_valid_signature(channel.websub_secret, body, request.headers.get('X-Hub-Signature')):
+        headers = websub.get_pushed_headers(request.headers)
+        tasks.websub_content_task.delay(channel.pk, headers, b64encode(body).decode())
+    return HttpResponse(status=status.HTTP_202_ACCEPTED)
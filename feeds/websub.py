@@ -0,0 +1,208 @@
+import hmac
+import re
+import secrets
+from datetime import timedelta
+
+import httpx
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from feeds.fetcher import FetchError, get_client, parse_document
+from feeds.scheduler import get_next_fetch_at, get_poll_interval
+
+LINK_PATTERN = re.compile(r'<([^>]+)>\s*;\s*rel="?([^";,]+)"?')
+SIGNATURE_METHODS = ('sha1', 'sha256', 'sha384', 'sha512')
+
+
+def get_hub_links(feed_xml):
+    '''
+    discover the WebSub hub and topic of a document, Link headers of the response
+    come before the links of the document
+
+    Parameters:
+        feed_xml (FeedParserDict): parsed feed data.
+    Returns:
+        links (dict): hub and topic urls, None if not advertised.
+    '''
+    links = {}
+    for href, rels in LINK_PATTERN.findall(feed_xml.get('headers', {}).get('link', '')):
+        for rel in rels.split():
+            links.setdefault(rel, href)
+    for link in feed_xml.get('feed', {}).get('links', []):
+        links.setdefault(link.get('rel'), link.get('href'))
+    hub = links.get('hub')
+    return {'hub': hub, 'topic': links.get('self') if hub else None}
+
+
+def discover_hub(channel, feed_xml):
+    '''
+    set the hub and topic advertised by the fetched document on channel, a lease
+    taken from another hub or for another topic does not push this one
+
+    Parameters:
+        channel (Channel): channel that was fetched.
+        feed_xml (FeedParserDict): parsed feed data.
+    '''
+    links = get_hub_links(feed_xml)
+    if links['hub'] != channel.hub or links['topic'] != channel.topic:
+        channel.websub_expires_at = None
+    channel.hub = links['hub']
+    channel.topic = links['topic']
+
+
+def needs_subscription(channel):
+    '''
+    check if channel advertises a hub and has no lease or one ending soon
+
+    Parameters:
+        channel (Channel): followed channel.
+    Returns:
+        needed (boolean): True if a subscription should be requested, False otherwise.
+    '''
+    if not settings.WEBSUB_CALLBACK_URL or not channel.hub:
+        return False
+    renew_at = timezone.now() + timedelta(seconds=settings.WEBSUB_RENEW_BEFORE)
+    return channel.websub_expires_at is None or channel.websub_expires_at <= renew_at
+
+
+def get_callback_url(channel):
+    return '{}{}'.format(settings.WEBSUB_CALLBACK_URL.rstrip('/'), reverse('websub-callback', args=[channel.pk]))
+
+
+def get_topic(channel):
+    return channel.topic or channel.xml_link
+
+
+def request_subscription(channel, client=None):
+    '''
+    ask the hub of channel to push its topic to our callback, the subscription
+    starts once the hub verifies it on the callback within WEBSUB_VERIFY_TIMEOUT
+
+    Parameters:
+        channel (Channel): channel advertising a hub.
+        client (httpx.Client): custom client, used in tests.
+    '''
+    if channel.websub_secret is None:
+        channel.websub_secret = secrets.token_hex(32)
+    channel.websub_requested_at = timezone.now()
+    channel.save(update_fields=['websub_secret', 'websub_requested_at'])
+    client = client or get_client()
+    try:
+        response = client.post(channel.hub, data={
+            'hub.mode': 'subscribe',
+            'hub.topic': get_topic(channel),
+            'hub.callback': get_callback_url(channel),
+            'hub.secret': channel.websub_secret,
+            'hub.lease_seconds': settings.WEBSUB_LEASE_SECONDS,
+        })
+    except httpx.HTTPError as error:
+        raise FetchError('failed to subscribe to {}: {!r}'.format(channel.hub, error)) from error
+    if response.status_code not in (202, 204):
+        raise FetchError('{} responded with {}'.format(channel.hub, response.status_code))
+
+
+def is_pending(channel):
+    '''
+    check if a subscription of channel was requested and its hub can still verify it
+
+    Parameters:
+        channel (Channel): channel of the callback.
+    Returns:
+        pending (boolean): True if the hub can verify the subscription, False otherwise.
+    '''
+    if channel.websub_requested_at is None:
+        return False
+    return channel.websub_requested_at > timezone.now() - timedelta(seconds=settings.WEBSUB_VERIFY_TIMEOUT)
+
+
+def verify_intent(channel, params):
+    '''
+    answer the verification of a hub, a subscription of the current hub and topic we
+    requested starts the lease and moves the next poll to the safety poll interval. The
+    lease is bounded by the one we asked for
+
+    Parameters:
+        channel (Channel): channel of the callback.
+        params (QueryDict): hub.mode, hub.topic, hub.challenge and hub.lease_seconds query parameters.
+    Returns:
+        challenge (str): challenge to echo or None if the intent is refused.
+    '''
+    mode = params.get('hub.mode')
+    if params.get('hub.topic') != get_topic(channel):
+        return None
+    if mode == 'denied':
+        channel.websub_expires_at = None
+        channel.next_fetch_at = timezone.now()
+        channel.save(update_fields=['websub_expires_at', 'next_fetch_at'])
+        return ''
+    if mode == 'subscribe' and channel.hub and is_pending(channel) and channel.feeds.filter(updated=True).exists():
+        try:
+            lease_seconds = int(params.get('hub.lease_seconds', settings.WEBSUB_LEASE_SECONDS))
+        except ValueError:
+            return None
+        lease_seconds = max(0, min(lease_seconds, settings.WEBSUB_LEASE_SECONDS))
+        channel.websub_expires_at = timezone.now() + timedelta(seconds=lease_seconds)
+        channel.websub_requested_at = None
+        channel.next_fetch_at = get_next_fetch_at(get_poll_interval(channel), channel.skip_hours)
+        channel.save(update_fields=['websub_expires_at', 'websub_requested_at', 'next_fetch_at'])
+        return params.get('hub.challenge')
+    # channels nobody follows anymore are let go
+    if mode == 'unsubscribe' and not channel.feeds.filter(updated=True).exists():
+        channel.websub_expires_at = None
+        channel.save(update_fields=['websub_expires_at'])
+        return params.get('hub.challenge')
+    return None
+
+
+def is_valid_signature(secret, body, signature):
+    '''
+    check the X-Hub-Signature of pushed content against the secret of the subscription
+
+    Parameters:
+        secret (str): secret sent with the subscription.
+        body (bytes): pushed content.
+        signature (str): X-Hub-Signature header as method=hexdigest.
+    Returns:
+        valid (boolean): True if the content was signed with secret, False otherwise.
+    '''
+    if not secret or not signature or '=' not in signature:
+        return False
+    method, digest = signature.split('=', 1)
+    if method not in SIGNATURE_METHODS:
+        return False
+    return hmac.compare_digest(hmac.new(secret.encode(), body, method).hexdigest(), digest)
+
+
+def get_pushed_headers(headers):
+    '''
+    keep the request headers the pushed content is parsed with
+
+    Parameters:
+        headers (Mapping): request headers.
+    Returns:
+        headers (dict): content type and language of the pushed content.
+    '''
+    return {
+        'content-type': headers.get('content-type', ''),
+        'content-language': headers.get('content-language', ''),
+    }
+
+
+def parse_pushed_document(channel, headers, body):
+    '''
+    parse content pushed by the hub of channel like a fetched document, it keeps
+    the validators of the last fetch for the next safety poll
+
+    Parameters:
+        channel (Channel): channel of the callback.
+        headers (Mapping): request headers.
+        body (bytes): pushed content.
+    Returns:
+        data (FeedParserDict): parsed feed data.
+    '''
+    feed_xml = parse_document(channel.xml_link, 200, get_pushed_headers(headers), body, channel.content_hash)
+    feed_xml['etag'] = channel.etag
+    feed_xml['modified'] = channel.last_modified
+    feed_xml['pushed'] = True
+    return feed_xml
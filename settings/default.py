@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
     'django_filters',
     'django_celery_beat',
     'feeds',
+    # benchmark commands and their harness, not installed by production settings
+    'benchmarks',
 ]
 
 MIDDLEWARE = [
@@ -141,9 +144,129 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=14),
 }
-CELERY_MAX_RETRIES = 2
-# max retries in seconds
-CELERY_RETRY_DELAY = 20
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379')
+# list pages are cached in Redis, requests go to the database while it is not reachable
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ.get('CACHE_URL', REDIS_URL),
+        'OPTIONS': {
+            'SOCKET_CONNECT_TIMEOUT': 1,
+            'SOCKET_TIMEOUT': 1,
+            'IGNORE_EXCEPTIONS': True,
+        },
+    }
+}
+# cached pages are invalidated by new user versions, they only expire to bound how long
+# a page survives an invalidation lost while Redis was not reachable
+FEEDS_CACHE_TIMEOUT = 15 * 60
+
+# user triggered refreshes and subscriptions get their own queue and workers so
+# bursts of scheduled polling never wait in front of them
+CELERY_INTERACTIVE_QUEUE = 'interactive'
+CELERY_BULK_QUEUE = 'bulk'
+CELERY_TASK_DEFAULT_QUEUE = CELERY_BULK_QUEUE
+CELERY_TASK_ROUTES = {
+    'feeds.tasks.feed_refresh_task': {'queue': CELERY_INTERACTIVE_QUEUE},
+    'feeds.tasks.feed_subscribe_task': {'queue': CELERY_INTERACTIVE_QUEUE},
+    'feeds.tasks.update_feeds_task': {'queue': CELERY_BULK_QUEUE},
+    # only messages queued before the batch updates still run it
+    'feeds.tasks.feed_update_task': {'queue': CELERY_BULK_QUEUE},
+    'feeds.tasks.channels_batch_update_task': {'queue': CELERY_BULK_QUEUE},
+    'feeds.tasks.channel_update_task': {'queue': CELERY_BULK_QUEUE},
+    'feeds.tasks.reconcile_feeds_counts_task': {'queue': CELERY_BULK_QUEUE},
+    'feeds.tasks.prune_items_task': {'queue': CELERY_BULK_QUEUE},
+    'feeds.tasks.rotate_item_partitions_task': {'queue': CELERY_BULK_QUEUE},
+    'feeds.tasks.websub_subscribe_task': {'queue': CELERY_BULK_QUEUE},
+    'feeds.tasks.websub_content_task': {'queue': CELERY_BULK_QUEUE},
+    'feeds.tasks.renew_websub_subscriptions_task': {'queue': CELERY_BULK_QUEUE},
+}
+# long batch tasks should not be reserved by a worker while others are idle
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# results are only stored for the tasks a request waits for, like feed_refresh_task,
+# and they expire soon since the request gives up after FEED_FORCE_UPDATE_TIMEOUT
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', REDIS_URL)
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_RESULT_EXPIRES = 10 * 60
+
+# number of channels fetched concurrently by one worker
+FEED_FETCH_CONCURRENCY = 100
+# number of channels handled by one batch update task
+FEED_FETCH_BATCH_SIZE = 500
+# timeout of every network operation of a feed request in seconds
+FEED_FETCH_TIMEOUT = 20
+# seconds a whole feed download may take, host slots are leased for as long
+FEED_FETCH_DEADLINE = 40
+# max size of feed document in bytes
+FEED_FETCH_MAX_BYTES = 5 * 1024 * 1024
+# limit requests per host, the limits are shared by all workers through Redis
+FEED_HOST_LIMITS = True
+# requests per second and burst of the token bucket shared by all workers per host
+FEED_HOST_RATE = 1
+FEED_HOST_BURST = 5
+# parallel requests to one host from all workers
+FEED_HOST_CONCURRENCY = 2
+# seconds a fetch waits for its host before giving up
+FEED_HOST_MAX_WAIT = 30
+# seconds an API request subscribing or updating a feed waits for its host before answering 429
+FEED_HOST_REQUEST_MAX_WAIT = 0
+# seconds between attempts to take a host slot
+FEED_HOST_POLL_INTERVAL = 0.5
+# seconds a host answering 429 or 503 without Retry-After is not requested
+FEED_HOST_PENALTY = 5 * 60
+# seconds a dispatched channel is not dispatched again while its update runs
+FEED_FETCH_LEASE = 60 * 60
+# bounds of the adaptive fetch interval in seconds
+FEED_MIN_FETCH_INTERVAL = 5 * 60
+FEED_MAX_FETCH_INTERVAL = 24 * 60 * 60
+# number of recent entries used to estimate how often a feed publishes
+FEED_SCHEDULE_SAMPLE_SIZE = 10
+# seconds before the first retry of a failing channel, doubled with every failure in a row
+FEED_BACKOFF_BASE = 60
+FEED_BACKOFF_MAX = 6 * 60 * 60
+# failures in a row after which followers are disabled and the channel is only probed
+FEED_CIRCUIT_THRESHOLD = 10
+# seconds between probes of a broken channel
+FEED_PROBE_INTERVAL = 24 * 60 * 60
+# public base url hubs push to, channels advertising a WebSub hub are only polled
+# as a safety net once subscribed. WebSub is off if not set
+WEBSUB_CALLBACK_URL = os.environ.get('WEBSUB_CALLBACK_URL')
+# seconds of the subscription lease asked to hubs, renewed WEBSUB_RENEW_BEFORE before it ends
+WEBSUB_LEASE_SECONDS = 7 * 24 * 60 * 60
+WEBSUB_RENEW_BEFORE = 24 * 60 * 60
+# seconds a hub has to verify a subscription request, verifications nobody requested are refused
+WEBSUB_VERIFY_TIMEOUT = 60 * 60
+# seconds between safety polls of channels pushed by their hub
+WEBSUB_POLL_INTERVAL = 24 * 60 * 60
+# create feeds as pending and fetch them in a task instead of inside the request
+FEEDS_ASYNC_SUBSCRIPTION = False
+# run force update in the interactive queue and wait for it instead of inside the request
+FEEDS_QUEUE_FORCE_UPDATE = False
+# seconds force update waits for the queued update before answering 202
+FEED_FORCE_UPDATE_TIMEOUT = 10
+# seconds item changes are held back from sync so concurrent commits can not be skipped
+ITEM_SYNC_SETTLE_TIME = 2
+# feeds whose unread and total counters are checked by one query of the reconcile task
+FEED_COUNTS_BATCH_SIZE = 1000
+# items older than this number of days are deleted, never if None
+ITEM_RETENTION_DAYS = None
+# items of a feed after its newest ones are deleted, never if None
+ITEM_RETENTION_MAX_PER_FEED = None
+# unread items are never deleted by retention
+ITEM_RETENTION_KEEP_UNREAD = True
+# entries left without items are deleted after this number of days
+ENTRY_ORPHAN_RETENTION_DAYS = 30
+# rows deleted by one statement of the pruning task
+ITEM_PRUNE_BATCH_SIZE = 500
+# partition items by month on PostgreSQL when migrating, see feeds/partitions.py
+ITEM_PARTITIONING = False
+# monthly item partitions created ahead of the current month
+ITEM_PARTITIONS_AHEAD = 3
+# port of the metrics server started by celery workers, no server if not set
+METRICS_WORKER_PORT = int(os.environ.get('METRICS_WORKER_PORT', 0)) or None
+# addresses or networks allowed to read /metrics of the API besides staff users, the address
+# is the one of the connection so scrapers should not go through a proxy
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
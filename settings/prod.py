@@ -7,13 +7,52 @@ env = environ.Env()
 environ.Env.read_env()
 
 DEBUG = False
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'benchmarks']  # noqa
 SECRET_KEY = env.str('SECRET_KEY')
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST_USER = env.str('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = env.str('EMAIL_HOST_PASSWORD')
 
-CELERY_MAX_RETRIES = env.int('CELERY_MAX_RETRIES', default=3)
-CELERY_RETRY_DELAY = env.int('CELERY_RETRY_DELAY', default=60)
+FEED_FETCH_CONCURRENCY = env.int('FEED_FETCH_CONCURRENCY', default=100)
+FEED_FETCH_BATCH_SIZE = env.int('FEED_FETCH_BATCH_SIZE', default=500)
+FEED_FETCH_TIMEOUT = env.int('FEED_FETCH_TIMEOUT', default=20)
+FEED_FETCH_DEADLINE = env.int('FEED_FETCH_DEADLINE', default=40)
+FEED_FETCH_MAX_BYTES = env.int('FEED_FETCH_MAX_BYTES', default=5 * 1024 * 1024)
+FEED_HOST_LIMITS = env.bool('FEED_HOST_LIMITS', default=True)
+FEED_HOST_RATE = env.float('FEED_HOST_RATE', default=1)
+FEED_HOST_BURST = env.int('FEED_HOST_BURST', default=5)
+FEED_HOST_CONCURRENCY = env.int('FEED_HOST_CONCURRENCY', default=2)
+FEED_HOST_MAX_WAIT = env.int('FEED_HOST_MAX_WAIT', default=30)
+FEED_HOST_REQUEST_MAX_WAIT = env.float('FEED_HOST_REQUEST_MAX_WAIT', default=0)
+FEED_FETCH_LEASE = env.int('FEED_FETCH_LEASE', default=60 * 60)
+FEED_MIN_FETCH_INTERVAL = env.int('FEED_MIN_FETCH_INTERVAL', default=5 * 60)
+FEED_MAX_FETCH_INTERVAL = env.int('FEED_MAX_FETCH_INTERVAL', default=24 * 60 * 60)
+FEED_BACKOFF_BASE = env.int('FEED_BACKOFF_BASE', default=60)
+FEED_BACKOFF_MAX = env.int('FEED_BACKOFF_MAX', default=6 * 60 * 60)
+FEED_CIRCUIT_THRESHOLD = env.int('FEED_CIRCUIT_THRESHOLD', default=10)
+FEED_PROBE_INTERVAL = env.int('FEED_PROBE_INTERVAL', default=24 * 60 * 60)
+WEBSUB_CALLBACK_URL = env.str('WEBSUB_CALLBACK_URL', default=None)
+WEBSUB_LEASE_SECONDS = env.int('WEBSUB_LEASE_SECONDS', default=7 * 24 * 60 * 60)
+WEBSUB_RENEW_BEFORE = env.int('WEBSUB_RENEW_BEFORE', default=24 * 60 * 60)
+WEBSUB_VERIFY_TIMEOUT = env.int('WEBSUB_VERIFY_TIMEOUT', default=60 * 60)
+WEBSUB_POLL_INTERVAL = env.int('WEBSUB_POLL_INTERVAL', default=24 * 60 * 60)
+FEEDS_ASYNC_SUBSCRIPTION = env.bool('FEEDS_ASYNC_SUBSCRIPTION', default=False)
+FEEDS_QUEUE_FORCE_UPDATE = env.bool('FEEDS_QUEUE_FORCE_UPDATE', default=False)
+FEED_FORCE_UPDATE_TIMEOUT = env.int('FEED_FORCE_UPDATE_TIMEOUT', default=10)
+CELERY_RESULT_EXPIRES = env.int('CELERY_RESULT_EXPIRES', default=10 * 60)
+ITEM_SYNC_SETTLE_TIME = env.int('ITEM_SYNC_SETTLE_TIME', default=2)
+FEED_COUNTS_BATCH_SIZE = env.int('FEED_COUNTS_BATCH_SIZE', default=1000)
+ITEM_RETENTION_DAYS = env.int('ITEM_RETENTION_DAYS', default=None)
+ITEM_RETENTION_MAX_PER_FEED = env.int('ITEM_RETENTION_MAX_PER_FEED', default=None)
+ITEM_RETENTION_KEEP_UNREAD = env.bool('ITEM_RETENTION_KEEP_UNREAD', default=True)
+ENTRY_ORPHAN_RETENTION_DAYS = env.int('ENTRY_ORPHAN_RETENTION_DAYS', default=30)
+ITEM_PRUNE_BATCH_SIZE = env.int('ITEM_PRUNE_BATCH_SIZE', default=500)
+ITEM_PARTITIONING = env.bool('ITEM_PARTITIONING', default=False)
+ITEM_PARTITIONS_AHEAD = env.int('ITEM_PARTITIONS_AHEAD', default=3)
+METRICS_WORKER_PORT = env.int('METRICS_WORKER_PORT', default=None)
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=['127.0.0.1', '::1'])
+FEEDS_CACHE_TIMEOUT = env.int('FEEDS_CACHE_TIMEOUT', default=15 * 60)
+DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=env.int('ACCESS_TOKEN_LIFETIME', default=15)),